@@ -12,6 +12,7 @@ from xivo_dao.alchemy.callerid import Callerid
 from xivo_dao.alchemy.callfilter import Callfilter
 from xivo_dao.alchemy.callfiltermember import Callfiltermember
 from xivo_dao.alchemy.cel import CEL
+from xivo_dao.alchemy.cel_reader_position import CELReaderPosition
 from xivo_dao.alchemy.context import Context
 from xivo_dao.alchemy.contextinclude import ContextInclude
 from xivo_dao.alchemy.contextmember import ContextMember
@@ -84,6 +85,7 @@ from xivo_dao.alchemy.phonebookaddress import PhonebookAddress
 from xivo_dao.alchemy.phonebooknumber import PhonebookNumber
 from xivo_dao.alchemy.phonefunckey import PhoneFunckey
 from xivo_dao.alchemy.pickup import Pickup
+from xivo_dao.alchemy.pickup_membership_version import PickupMembershipVersion
 from xivo_dao.alchemy.pickupmember import PickupMember
 from xivo_dao.alchemy.provisioning import Provisioning
 from xivo_dao.alchemy.queue import Queue
@@ -109,10 +111,14 @@ from xivo_dao.alchemy.schedulepath import SchedulePath
 from xivo_dao.alchemy.session import Session
 from xivo_dao.alchemy.sipauthentication import SIPAuthentication
 from xivo_dao.alchemy.stat_agent import StatAgent
+from xivo_dao.alchemy.stat_agent_login_state import StatAgentLoginState
 from xivo_dao.alchemy.stat_agent_periodic import StatAgentPeriodic
 from xivo_dao.alchemy.stat_call_on_queue import StatCallOnQueue
+from xivo_dao.alchemy.stat_call_on_queue_rollup import StatCallOnQueueRollup
+from xivo_dao.alchemy.stat_pending_call import StatPendingCall
 from xivo_dao.alchemy.stat_queue import StatQueue
 from xivo_dao.alchemy.stat_queue_periodic import StatQueuePeriodic
+from xivo_dao.alchemy.stat_watermark import StatWatermark
 from xivo_dao.alchemy.staticiax import StaticIAX
 from xivo_dao.alchemy.staticmeetme import StaticMeetme
 from xivo_dao.alchemy.staticqueue import StaticQueue
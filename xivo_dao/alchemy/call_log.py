@@ -15,7 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-from sqlalchemy.schema import Column
+from sqlalchemy.schema import Column, Index
 from sqlalchemy.types import DateTime, Integer, String, Boolean, Interval
 
 from xivo_dao.helpers.db_manager import Base
@@ -24,6 +24,10 @@ from xivo_dao.helpers.db_manager import Base
 class CallLog(Base):
 
     __tablename__ = 'call_log'
+    __table_args__ = (
+        Index('call_log__idx__source_line_identity_date', 'source_line_identity', 'date'),
+        Index('call_log__idx__destination_line_identity_date', 'destination_line_identity', 'date'),
+    )
 
     id = Column(Integer, nullable=False, primary_key=True)
     date = Column(DateTime, nullable=False)
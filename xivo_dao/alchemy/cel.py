@@ -16,6 +16,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import text
 from sqlalchemy.schema import Column, Index, ForeignKeyConstraint
 from sqlalchemy.types import DateTime, Integer, String
 
@@ -33,6 +34,7 @@ class CEL(Base):
         Index('cel__idx__call_log_id', 'call_log_id'),
         Index('cel__idx__eventtime', 'eventtime'),
         Index('cel__idx__linkedid', 'linkedid'),
+        Index('cel__idx__unprocessed', 'eventtime', 'id', postgresql_where=text('call_log_id IS NULL')),
     )
 
     id = Column(Integer, primary_key=True, nullable=False)
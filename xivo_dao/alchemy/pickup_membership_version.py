@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from sqlalchemy import event
+from sqlalchemy.schema import Column, DDL, PrimaryKeyConstraint, Sequence
+from sqlalchemy.types import BigInteger, Integer
+
+from xivo_dao.alchemy.groupfeatures import GroupFeatures
+from xivo_dao.alchemy.linefeatures import LineFeatures
+from xivo_dao.alchemy.pickup import Pickup
+from xivo_dao.alchemy.pickupmember import PickupMember
+from xivo_dao.alchemy.queuefeatures import QueueFeatures
+from xivo_dao.alchemy.queuemember import QueueMember
+from xivo_dao.alchemy.user_line import UserLine
+from xivo_dao.helpers.db_manager import Base
+
+
+class PickupMembershipVersion(Base):
+
+    __tablename__ = 'pickup_membership_version'
+    __table_args__ = (
+        PrimaryKeyConstraint('id'),
+    )
+
+    id = Column(Integer, autoincrement=False)
+    version = Column(BigInteger, Sequence('pickup_membership_version_seq'), nullable=False)
+
+
+# the version is bumped from a sequence so that a rolled back change never
+# brings back a version that was already seen with other memberships
+_insert_version = DDL('''\
+INSERT INTO "pickup_membership_version" (id, version)
+  VALUES (1, nextval('pickup_membership_version_seq'));
+''')
+
+# the row triggers only flag the transaction, a statement trigger then bumps
+# the version once per statement instead of once per written row
+_mark_function = DDL('''\
+CREATE OR REPLACE FUNCTION "pickup_membership_version_mark"()
+  RETURNS trigger AS
+$$
+BEGIN
+  PERFORM set_config('xivo.pickup_membership_changed', 'on', true);
+  RETURN NULL;
+END;
+$$
+LANGUAGE plpgsql;
+''')
+
+_bump_function = DDL('''\
+CREATE OR REPLACE FUNCTION "pickup_membership_version_bump"()
+  RETURNS trigger AS
+$$
+DECLARE
+  changed text;
+BEGIN
+  BEGIN
+    changed := current_setting('xivo.pickup_membership_changed');
+  EXCEPTION WHEN undefined_object THEN
+    changed := 'off';
+  END;
+  IF changed = 'on' THEN
+    UPDATE pickup_membership_version SET version = nextval('pickup_membership_version_seq');
+    PERFORM set_config('xivo.pickup_membership_changed', 'off', true);
+  END IF;
+  RETURN NULL;
+END;
+$$
+LANGUAGE plpgsql;
+''')
+
+# columns read by the pickup membership index, by table, and the condition a
+# row must match to be read. The version is only bumped by rows matching the
+# condition and by updates changing one of these columns, so that other
+# writes, e.g. agents logging in and out of queues, do not lock the version
+_TRACKED_TABLES = (
+    (GroupFeatures.__table__, ('id', 'name'), None),
+    (LineFeatures.__table__, ('id', 'protocol', 'protocolid'), None),
+    (Pickup.__table__, ('id', 'commented'), None),
+    (PickupMember.__table__, ('pickupid', 'category', 'membertype', 'memberid'), None),
+    (QueueFeatures.__table__, ('id', 'name'), None),
+    (QueueMember.__table__, ('queue_name', 'usertype', 'userid'), "{row}.usertype = 'user'"),
+    (UserLine.__table__, ('user_id', 'line_id', 'main_user', 'main_line'), None),
+)
+
+
+def _bump_triggers(columns, condition):
+    changed = '({old}) IS DISTINCT FROM ({new})'.format(
+        old=', '.join('OLD.%s' % column for column in columns),
+        new=', '.join('NEW.%s' % column for column in columns),
+    )
+    conditions = {'insert': None, 'update': changed, 'delete': None}
+    if condition:
+        conditions['insert'] = condition.format(row='NEW')
+        conditions['update'] = '{changed} AND ({old} OR {new})'.format(changed=changed,
+                                                                       old=condition.format(row='OLD'),
+                                                                       new=condition.format(row='NEW'))
+        conditions['delete'] = condition.format(row='OLD')
+
+    events = {'insert': 'INSERT',
+              'update': 'UPDATE OF %s' % ', '.join(columns),
+              'delete': 'DELETE'}
+
+    for name in ('insert', 'update', 'delete'):
+        when = ' WHEN (%s)' % conditions[name] if conditions[name] else ''
+        yield DDL('''\
+CREATE TRIGGER "%(table)s_pickup_membership_version_{name}"
+  AFTER {event} ON %(fullname)s
+  FOR EACH ROW{when} EXECUTE PROCEDURE pickup_membership_version_mark();
+'''.format(name=name, event=events[name], when=when))
+
+    yield DDL('''\
+CREATE TRIGGER "%(table)s_pickup_membership_version_bump"
+  AFTER INSERT OR {update} OR DELETE ON %(fullname)s
+  FOR EACH STATEMENT EXECUTE PROCEDURE pickup_membership_version_bump();
+'''.format(update=events['update']))
+
+
+event.listen(PickupMembershipVersion.__table__, 'after_create', _insert_version.execute_if(dialect='postgresql'))
+
+for _table, _columns, _condition in _TRACKED_TABLES:
+    event.listen(_table, 'after_create', _mark_function.execute_if(dialect='postgresql'))
+    event.listen(_table, 'after_create', _bump_function.execute_if(dialect='postgresql'))
+    for _trigger in _bump_triggers(_columns, _condition):
+        event.listen(_table, 'after_create', _trigger.execute_if(dialect='postgresql'))
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-# Copyright (C) 2012-2014 Avencall
+# Copyright (C) 2012-2016 Avencall
 #
 # This program is free software: you can redistribute it and/or modify
 # it under the terms of the GNU General Public License as published by
@@ -15,8 +15,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-from sqlalchemy.schema import Column, PrimaryKeyConstraint, Index
-from sqlalchemy.types import String, Integer, Text
+from sqlalchemy import event
+from sqlalchemy.schema import Column, PrimaryKeyConstraint, Index, DDL, FetchedValue
+from sqlalchemy.types import String, Integer, Text, TIMESTAMP
 
 from xivo_dao.helpers.db_manager import Base
 
@@ -30,6 +31,7 @@ class QueueLog(Base):
         Index('queue_log__idx_callid', 'callid'),
         Index('queue_log__idx_event', 'event'),
         Index('queue_log__idx_time', 'time'),
+        Index('queue_log__idx_timestamp', 'timestamp'),
     )
 
     time = Column(String(26), nullable=False, server_default='')
@@ -43,3 +45,31 @@ class QueueLog(Base):
     data4 = Column(Text, server_default='')
     data5 = Column(Text, server_default='')
     id = Column(Integer)
+    timestamp = Column(TIMESTAMP, server_default=FetchedValue(), server_onupdate=FetchedValue())
+
+
+# time is written as text by asterisk, the typed copy is maintained by the database
+_sync_timestamp_function = DDL('''\
+CREATE OR REPLACE FUNCTION "queue_log_sync_timestamp"()
+  RETURNS trigger AS
+$$
+BEGIN
+  BEGIN
+    NEW.timestamp := CAST(NEW.time AS TIMESTAMP);
+  EXCEPTION WHEN invalid_datetime_format OR datetime_field_overflow THEN
+    NEW.timestamp := NULL;
+  END;
+  RETURN NEW;
+END;
+$$
+LANGUAGE plpgsql;
+''')
+
+_sync_timestamp_trigger = DDL('''\
+CREATE TRIGGER "queue_log_sync_timestamp"
+  BEFORE INSERT OR UPDATE OF time ON queue_log
+  FOR EACH ROW EXECUTE PROCEDURE queue_log_sync_timestamp();
+''')
+
+event.listen(QueueLog.__table__, 'after_create', _sync_timestamp_function.execute_if(dialect='postgresql'))
+event.listen(QueueLog.__table__, 'after_create', _sync_timestamp_trigger.execute_if(dialect='postgresql'))
@@ -15,12 +15,15 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-from sqlalchemy.schema import Column, ForeignKey, Index
+from sqlalchemy import event, select
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.schema import Column, DDL, ForeignKey, Index
 from sqlalchemy.types import String, TIMESTAMP, Integer, Enum
 from sqlalchemy.orm import relationship
 
 from xivo_dao.alchemy.stat_queue import StatQueue
 from xivo_dao.alchemy.stat_agent import StatAgent
+from xivo_dao.alchemy.stat_call_on_queue_rollup import add_rollup_totals, rollup_bucket
 from xivo_dao.helpers.db_manager import Base
 
 
@@ -29,6 +32,8 @@ class StatCallOnQueue(Base):
     __tablename__ = 'stat_call_on_queue'
     __table_args__ = (
         Index('stat_call_on_queue__idx_callid', 'callid'),
+        Index('stat_call_on_queue__idx_end_time', 'end_time'),
+        Index('stat_call_on_queue__idx_time', 'time'),
     )
 
     id = Column(Integer, primary_key=True)
@@ -51,6 +56,65 @@ class StatCallOnQueue(Base):
                     nullable=False)
     queue_id = Column(Integer, ForeignKey("stat_queue.id"))
     agent_id = Column(Integer, ForeignKey("stat_agent.id"))
+    end_time = Column(TIMESTAMP)
 
     stat_queue = relationship(StatQueue, foreign_keys=queue_id)
     stat_agent = relationship(StatAgent, foreign_keys=agent_id)
+
+
+# end_time is maintained by the database so that calls can be searched by end
+_end_time_function = DDL('''\
+CREATE OR REPLACE FUNCTION "stat_call_on_queue_end_time"()
+  RETURNS trigger AS
+$$
+BEGIN
+  NEW.end_time := NEW.time + (NEW.ringtime + NEW.talktime + NEW.waittime) * INTERVAL '1 second';
+  RETURN NEW;
+END;
+$$
+LANGUAGE plpgsql;
+''')
+
+_end_time_trigger = DDL('''\
+CREATE TRIGGER "stat_call_on_queue_end_time"
+  BEFORE INSERT OR UPDATE OF time, ringtime, talktime, waittime ON stat_call_on_queue
+  FOR EACH ROW EXECUTE PROCEDURE stat_call_on_queue_end_time();
+''')
+
+event.listen(StatCallOnQueue.__table__, 'after_create', _end_time_function.execute_if(dialect='postgresql'))
+event.listen(StatCallOnQueue.__table__, 'after_create', _end_time_trigger.execute_if(dialect='postgresql'))
+
+
+# calls written through the ORM are counted in stat_call_on_queue_rollup as
+# they are flushed, the bulk paths of stat_call_on_queue_dao count theirs
+_ROLLUP_ATTRIBUTES = ('time', 'queue_id', 'status')
+
+
+def _rollup_key(time, queue_id, status):
+    return rollup_bucket(time), queue_id, status
+
+
+@event.listens_for(StatCallOnQueue, 'after_insert')
+def _count_inserted_call(mapper, connection, target):
+    key = _rollup_key(target.time, target.queue_id, target.status)
+    add_rollup_totals(connection, {key: 1})
+
+
+@event.listens_for(StatCallOnQueue, 'after_delete')
+def _count_deleted_call(mapper, connection, target):
+    key = _rollup_key(target.time, target.queue_id, target.status)
+    add_rollup_totals(connection, {key: -1})
+
+
+@event.listens_for(StatCallOnQueue, 'before_update')
+def _count_updated_call(mapper, connection, target):
+    if not any(get_history(target, name).has_changes() for name in _ROLLUP_ATTRIBUTES):
+        return
+
+    table = StatCallOnQueue.__table__
+    old = connection.execute(select([table.c.time, table.c.queue_id, table.c.status])
+                             .where(table.c.id == target.id)).first()
+    old_key = _rollup_key(*old)
+    new_key = _rollup_key(target.time, target.queue_id, target.status)
+    if old_key != new_key:
+        add_rollup_totals(connection, {old_key: -1, new_key: 1})
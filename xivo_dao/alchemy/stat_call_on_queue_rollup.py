@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from datetime import timedelta
+
+from sqlalchemy.schema import Column, ForeignKey, Index, PrimaryKeyConstraint
+from sqlalchemy.types import Enum, Integer, TIMESTAMP
+
+from xivo_dao.helpers.db_manager import Base
+
+ROLLUP_BUCKET = timedelta(minutes=15)
+
+
+class StatCallOnQueueRollup(Base):
+
+    __tablename__ = 'stat_call_on_queue_rollup'
+    __table_args__ = (
+        PrimaryKeyConstraint('id'),
+        Index('stat_call_on_queue_rollup__idx_bucket', 'bucket'),
+    )
+
+    id = Column(Integer)
+    bucket = Column(TIMESTAMP, nullable=False)
+    queue_id = Column(Integer, ForeignKey('stat_queue.id', ondelete='CASCADE'))
+    status = Column(Enum('full',
+                         'closed',
+                         'joinempty',
+                         'leaveempty',
+                         'divert_ca_ratio',
+                         'divert_waittime',
+                         'answered',
+                         'abandoned',
+                         'timeout',
+                         name='call_exit_type',
+                         metadata=Base.metadata),
+                    nullable=False)
+    total = Column(Integer, nullable=False, server_default='0')
+
+
+def rollup_bucket(time):
+    minutes = ROLLUP_BUCKET.seconds // 60
+    return time.replace(minute=time.minute - time.minute % minutes, second=0, microsecond=0)
+
+
+def add_rollup_totals(connection, totals):
+    """
+    Append totals, a dict of call counts keyed by (bucket, queue_id,
+    status), to the rollup. Counts may be negative for removed calls, the
+    rows of a bucket are summed when read and merged by a refresh.
+    """
+    rows = [{'bucket': bucket, 'queue_id': queue_id, 'status': status, 'total': total}
+            for (bucket, queue_id, status), total in totals.iteritems()
+            if total]
+    if rows:
+        connection.execute(StatCallOnQueueRollup.__table__.insert(), rows)
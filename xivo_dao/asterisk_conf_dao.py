@@ -15,9 +15,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-from collections import defaultdict
+import threading
 
-from sqlalchemy.sql.expression import and_, or_, literal, cast, func
+from collections import defaultdict, namedtuple
+
+from sqlalchemy.sql.expression import and_, or_, literal, cast, func, select
 from sqlalchemy.types import Integer, String
 
 from xivo_dao.helpers.db_manager import daosession
@@ -30,6 +32,7 @@ from xivo_dao.alchemy.queuemember import QueueMember
 from xivo_dao.alchemy.queuefeatures import QueueFeatures
 from xivo_dao.alchemy.pickup import Pickup
 from xivo_dao.alchemy.pickupmember import PickupMember
+from xivo_dao.alchemy.pickup_membership_version import PickupMembershipVersion
 from xivo_dao.alchemy.groupfeatures import GroupFeatures
 from xivo_dao.alchemy.staticsip import StaticSIP
 from xivo_dao.alchemy.sipauthentication import SIPAuthentication
@@ -59,6 +62,9 @@ from xivo_dao.alchemy.func_key_mapping import FuncKeyMapping
 from xivo_dao.alchemy.func_key_dest_custom import FuncKeyDestCustom
 
 
+STREAM_BATCH_SIZE = 1000
+
+
 @daosession
 def find_sccp_general_settings(session):
     rows = session.query(SCCPGeneralSettings).all()
@@ -86,43 +92,48 @@ def find_sccp_general_settings(session):
     return res
 
 
+def _sccp_line_config(row, pickup_members):
+    protocolid, name, cid_name, cid_num, allow, disallow, language, user_id, context, number, uuid = row
+    line = {
+        'name': name,
+        'cid_name': cid_name,
+        'cid_num': cid_num,
+        'user_id': user_id,
+        'number': number,
+        'context': context,
+        'language': language,
+        'uuid': uuid,
+    }
+
+    if allow:
+        line['allow'] = allow
+    if disallow:
+        line['disallow'] = disallow
+
+    line.update(pickup_members.get(protocolid, {}))
+
+    return line
+
+
+def _sccp_line_columns():
+    return [SCCPLine.id,
+            SCCPLine.name,
+            SCCPLine.cid_name,
+            SCCPLine.cid_num,
+            SCCPLine.allow,
+            SCCPLine.disallow,
+            UserFeatures.language,
+            UserLine.user_id,
+            LineFeatures.context,
+            Extension.exten,
+            UserFeatures.uuid]
+
+
 @daosession
 def find_sccp_line_settings(session):
     sccp_pickup_members = find_pickup_members('sccp')
 
-    def line_config(protocolid, name, cid_name, cid_num, allow, disallow,
-                    language, user_id, context, number, uuid):
-        line = {
-            'name': name,
-            'cid_name': cid_name,
-            'cid_num': cid_num,
-            'user_id': user_id,
-            'number': number,
-            'context': context,
-            'language': language,
-            'uuid': uuid,
-        }
-
-        if allow:
-            line['allow'] = allow
-        if disallow:
-            line['disallow'] = disallow
-
-        line.update(sccp_pickup_members.get(protocolid, {}))
-
-        return line
-
-    rows = (session.query(SCCPLine.id,
-                          SCCPLine.name,
-                          SCCPLine.cid_name,
-                          SCCPLine.cid_num,
-                          SCCPLine.allow,
-                          SCCPLine.disallow,
-                          UserFeatures.language,
-                          UserLine.user_id,
-                          LineFeatures.context,
-                          Extension.exten,
-                          UserFeatures.uuid)
+    rows = (session.query(*_sccp_line_columns())
             .join(LineFeatures, and_(LineFeatures.protocolid == SCCPLine.id,
                                      LineFeatures.protocol == 'sccp'))
             .join(UserLine, and_(UserLine.line_id == LineFeatures.id,
@@ -134,7 +145,7 @@ def find_sccp_line_settings(session):
             .all())
 
     for row in rows:
-        yield line_config(*row)
+        yield _sccp_line_config(row, sccp_pickup_members)
 
 
 @daosession
@@ -229,6 +240,10 @@ def find_features_settings(session):
                              Features.category == 'featuremap')))
             .all())
 
+    return _features_settings(rows)
+
+
+def _features_settings(rows):
     general_options = []
     featuremap_options = []
     for row in rows:
@@ -255,6 +270,10 @@ def find_parking_settings(session):
                          Features.var_name.in_(_PARKING_OPTIONS)))
             .all())
 
+    return _parking_settings(rows)
+
+
+def _parking_settings(rows):
     general_options = []
     default_parking_lot_options = []
     for row in rows:
@@ -425,11 +444,8 @@ def _build_sip_pickup_query(session):
     return pickup_groups, call_groups
 
 
-@daosession
-def find_sip_user_settings(session):
-    pickup_groups, call_groups = _build_sip_pickup_query(session)
-
-    query = (
+def _sip_user_settings_query(session, *pickup_columns):
+    return (
         session.query(
             UserSIP,
             LineFeatures.protocol,
@@ -438,8 +454,7 @@ def find_sip_user_settings(session):
             UserFeatures.musiconhold.label('mohsuggest'),
             UserFeatures.uuid.label('uuid'),
             (Voicemail.mailbox + '@' + Voicemail.context).label('mailbox'),
-            pickup_groups.c.pickup_ids.label('namedpickupgroup'),
-            call_groups.c.pickup_ids.label('namedcallgroup')
+            *pickup_columns
         ).join(
             LineFeatures, and_(LineFeatures.protocolid == UserSIP.id,
                                LineFeatures.protocol == 'sip')
@@ -452,23 +467,71 @@ def find_sip_user_settings(session):
             Voicemail, UserFeatures.voicemailid == Voicemail.uniqueid
         ).outerjoin(
             Extension, UserLine.extension_id == Extension.id
+        ).filter(
+            and_(
+                UserSIP.category == 'user',
+                UserSIP.commented == 0,
+            )
+        )
+    )
+
+
+@daosession
+def find_sip_user_settings(session):
+    pickup_groups, call_groups = _build_sip_pickup_query(session)
+
+    query = (
+        _sip_user_settings_query(
+            session,
+            pickup_groups.c.pickup_ids.label('namedpickupgroup'),
+            call_groups.c.pickup_ids.label('namedcallgroup')
         ).outerjoin(
             pickup_groups,
             pickup_groups.c.sip_id == UserSIP.id
         ).outerjoin(
             call_groups,
             call_groups.c.sip_id == UserSIP.id
-        ).filter(
-            and_(
-                UserSIP.category == 'user',
-                UserSIP.commented == 0,
-            )
         )
     )
 
     return query
 
 
+SIPUserSettings = namedtuple('SIPUserSettings', ['UserSIP',
+                                                 'protocol',
+                                                 'context',
+                                                 'number',
+                                                 'mohsuggest',
+                                                 'uuid',
+                                                 'mailbox',
+                                                 'namedpickupgroup',
+                                                 'namedcallgroup'])
+
+
+@daosession
+def find_indexed_sip_user_settings(session):
+    '''
+    Yields the rows of find_sip_user_settings as SIPUserSettings tuples,
+    the pickup groups being read from the shared pickup membership index
+    instead of being aggregated by the query. Like the SCCP lines, the
+    groups include the group and queue pickup members and skip the
+    commented pickups.
+    '''
+    sip_pickup_members = find_pickup_members('sip')
+
+    for row in _sip_user_settings_query(session):
+        groups = sip_pickup_members.get(row.UserSIP.id, {})
+        yield SIPUserSettings(*row,
+                              namedpickupgroup=_pickup_ids(groups.get('pickupgroup')),
+                              namedcallgroup=_pickup_ids(groups.get('callgroup')))
+
+
+def _pickup_ids(pickup_ids):
+    if not pickup_ids:
+        return None
+    return ','.join(str(pickup_id) for pickup_id in sorted(pickup_ids))
+
+
 @daosession
 def find_pickup_members(session, protocol):
     '''
@@ -477,13 +540,43 @@ def find_pickup_members(session, protocol):
                   callgroup: set([pickupgroup_id, ...])},
      ...,
     }
+
+    The map is shared with other callers and must not be modified.
     '''
+    return _pickup_membership.members(session, protocol)
+
+
+class PickupMembershipIndex(object):
+    '''
+    Pickup groups of every line, by protocol and protocolid, rebuilt only
+    when the pickup membership version changed in the database.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._members = {}
+
+    def members(self, session, protocol):
+        version = session.query(PickupMembershipVersion.version).scalar()
+        with self._lock:
+            if version is None or version != self._version:
+                self._members = _build_pickup_membership(session)
+                self._version = version
+            return self._members.get(protocol, {})
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+
+
+_pickup_membership = PickupMembershipIndex()
+
+
+def _build_pickup_membership(session):
     group_map = {'member': 'pickupgroup',
                  'pickup': 'callgroup'}
 
-    res = defaultdict(lambda: defaultdict(set))
-    add_member = lambda m: res[m.protocolid][group_map[m.category]].add(m.id)
-
     base_query = session.query(
         PickupMember.category,
         Pickup.id,
@@ -492,10 +585,7 @@ def find_pickup_members(session, protocol):
     ).join(
         Pickup, Pickup.id == PickupMember.pickupid,
     ).filter(
-        and_(
-            Pickup.commented == 0,
-            LineFeatures.protocol == protocol,
-        )
+        Pickup.commented == 0,
     )
 
     users = base_query.join(
@@ -540,8 +630,11 @@ def find_pickup_members(session, protocol):
         )
     )
 
-    for member in users.union(groups.union(queues)).all():
-        add_member(member)
+    res = {}
+    for member in users.union(groups.union(queues)):
+        lines = res.setdefault(member.protocol, {})
+        groups_by_category = lines.setdefault(member.protocolid, {})
+        groups_by_category.setdefault(group_map[member.category], set()).add(member.id)
 
     return res
 
@@ -692,3 +785,285 @@ def find_queue_penalties_settings(session):
         res.append(tmp)
 
     return res
+
+
+_SNAPSHOT_ISOLATION_LEVELS = ('repeatable read', 'serializable')
+
+
+def load_settings_snapshot(session):
+    '''
+    Returns the sip, sccp, iax, queues, meetme, voicemail and features
+    settings as plain dicts, read in the current transaction of session.
+
+    Every section is read from the same snapshot, so the transaction must
+    be REPEATABLE READ or SERIALIZABLE, for example on a connection with
+    execution_options(isolation_level='REPEATABLE READ'). A ValueError is
+    raised otherwise.
+    '''
+    isolation_level = session.execute('SHOW transaction_isolation').scalar()
+    if isolation_level not in _SNAPSHOT_ISOLATION_LEVELS:
+        raise ValueError('settings snapshot read in a %s transaction' % isolation_level)
+
+    return {
+        'sip': _sip_snapshot(session),
+        'sccp': _sccp_snapshot(session),
+        'iax': _iax_snapshot(session),
+        'queues': _queues_snapshot(session),
+        'meetme': _meetme_snapshot(session),
+        'voicemail': _voicemail_snapshot(session),
+        'features': _features_snapshot(session),
+    }
+
+
+def _dicts(session, query):
+    return [dict(row) for row in session.execute(query)]
+
+
+def _sip_snapshot(session):
+    general = select([StaticSIP.var_name, StaticSIP.var_val]).where(StaticSIP.commented == 0)
+    pickup_members = _pickup_membership.members(session, 'sip')
+
+    return {
+        'general': _dicts(session, general),
+        'authentication': _dicts(session, _sip_authentication_select()),
+        'users': [_sip_user(row, pickup_members) for row in session.execute(_sip_users_select())],
+    }
+
+
+def _sip_authentication_select():
+    return select([SIPAuthentication.__table__])
+
+
+def _sip_users_select():
+    return (select([UserSIP.__table__,
+                    LineFeatures.context.label('line_context'),
+                    Extension.exten.label('number'),
+                    UserFeatures.musiconhold.label('mohsuggest'),
+                    UserFeatures.uuid.label('uuid'),
+                    (Voicemail.mailbox + '@' + Voicemail.context).label('mailbox')])
+            .select_from(UserSIP.__table__
+                         .join(LineFeatures.__table__,
+                               and_(LineFeatures.protocolid == UserSIP.id,
+                                    LineFeatures.protocol == 'sip'))
+                         .outerjoin(UserLine.__table__,
+                                    and_(UserLine.line_id == LineFeatures.id,
+                                         UserLine.main_user == True))  # noqa
+                         .outerjoin(UserFeatures.__table__, UserFeatures.id == UserLine.user_id)
+                         .outerjoin(Voicemail.__table__, UserFeatures.voicemailid == Voicemail.uniqueid)
+                         .outerjoin(Extension.__table__, UserLine.extension_id == Extension.id))
+            .where(and_(UserSIP.category == 'user',
+                        UserSIP.commented == 0)))
+
+
+def _sip_user(row, pickup_members):
+    user = dict(row)
+
+    groups = pickup_members.get(user['id'], {})
+    user['namedpickupgroup'] = _pickup_ids(groups.get('pickupgroup'))
+    user['namedcallgroup'] = _pickup_ids(groups.get('callgroup'))
+    return user
+
+
+def _sccp_snapshot(session):
+    general = select([SCCPGeneralSettings.option_name, SCCPGeneralSettings.option_value])
+    vmexten = (select([literal('vmexten').label('option_name'),
+                       Extension.exten.label('option_value')])
+               .where(and_(Extension.type == 'extenfeatures',
+                           Extension.typeval == 'vmusermsg'))
+               .limit(1))
+
+    devices = (select([SCCPDevice.__table__, Voicemail.mailbox.label('voicemail')])
+               .select_from(SCCPDevice.__table__
+                            .outerjoin(SCCPLine.__table__, SCCPLine.name == SCCPDevice.line)
+                            .outerjoin(LineFeatures.__table__,
+                                       and_(LineFeatures.protocol == 'sccp',
+                                            LineFeatures.protocolid == SCCPLine.id))
+                            .outerjoin(UserLine.__table__,
+                                       and_(UserLine.line_id == LineFeatures.id,
+                                            UserLine.main_user == True))  # noqa
+                            .outerjoin(UserFeatures.__table__, UserFeatures.id == UserLine.user_id)
+                            .outerjoin(Voicemail.__table__, Voicemail.uniqueid == UserFeatures.voicemailid)))
+
+    speeddials = (select([FuncKeyMapping.position.label('fknum'),
+                          FuncKeyMapping.label.label('label'),
+                          cast(FuncKeyMapping.blf, Integer).label('supervision'),
+                          FuncKeyDestCustom.exten.label('exten'),
+                          UserFeatures.id.label('user_id'),
+                          SCCPDevice.device.label('device')])
+                  .select_from(FuncKeyMapping.__table__
+                               .join(UserFeatures.__table__,
+                                     FuncKeyMapping.template_id == UserFeatures.func_key_private_template_id)
+                               .join(FuncKeyDestCustom.__table__,
+                                     FuncKeyDestCustom.func_key_id == FuncKeyMapping.func_key_id)
+                               .join(UserLine.__table__,
+                                     and_(UserLine.user_id == UserFeatures.id,
+                                          UserLine.main_user == True))  # noqa
+                               .join(LineFeatures.__table__, UserLine.line_id == LineFeatures.id)
+                               .join(SCCPLine.__table__,
+                                     and_(LineFeatures.protocol == 'sccp',
+                                          LineFeatures.protocolid == SCCPLine.id))
+                               .join(SCCPDevice.__table__, SCCPLine.name == SCCPDevice.line))
+                  .where(LineFeatures.commented == 0))
+
+    pickup_members = _pickup_membership.members(session, 'sccp')
+
+    return {
+        'general': _dicts(session, general) + _dicts(session, vmexten),
+        'lines': [_sccp_line_config(row, pickup_members) for row in session.execute(_sccp_lines_select())],
+        'devices': _dicts(session, devices),
+        'speeddials': _dicts(session, speeddials),
+    }
+
+
+def _sccp_lines_select():
+    return (select(_sccp_line_columns())
+            .select_from(SCCPLine.__table__
+                         .join(LineFeatures.__table__,
+                               and_(LineFeatures.protocolid == SCCPLine.id,
+                                    LineFeatures.protocol == 'sccp'))
+                         .join(UserLine.__table__,
+                               and_(UserLine.line_id == LineFeatures.id,
+                                    UserLine.main_line == True))  # noqa
+                         .join(UserFeatures.__table__,
+                               and_(UserFeatures.id == UserLine.user_id,
+                                    UserLine.main_user == True))  # noqa
+                         .join(Extension.__table__, Extension.id == UserLine.extension_id))
+            .where(LineFeatures.commented == 0))
+
+
+def _iax_snapshot(session):
+    general = select([StaticIAX.var_name, StaticIAX.var_val]).where(StaticIAX.commented == 0)
+    calllimits = select([IAXCallNumberLimits.__table__])
+
+    return {
+        'general': _dicts(session, general),
+        'trunks': _dicts(session, _iax_trunks_select()),
+        'calllimits': _dicts(session, calllimits),
+    }
+
+
+def _iax_trunks_select():
+    return select([UserIAX.__table__]).where(and_(UserIAX.commented == 0,
+                                                  UserIAX.category == 'trunk'))
+
+
+def _queues_snapshot(session):
+    general = select([StaticQueue.__table__]).where(and_(StaticQueue.commented == 0,
+                                                         StaticQueue.category == 'general'))
+    queues = select([Queue.__table__]).where(Queue.commented == 0).order_by(Queue.name)
+    skillrules = select([QueueSkillRule.__table__])
+    penalty = select([QueuePenalty.__table__]).where(QueuePenalty.commented == 0)
+
+    members = (select([QueueMember.queue_name, QueueMember.penalty, QueueMember.interface])
+               .where(and_(QueueMember.commented == 0,
+                           QueueMember.usertype == 'user'))
+               .order_by(QueueMember.queue_name, QueueMember.position))
+
+    agent_skills = (select([AgentFeatures.id, QueueSkill.name, AgentQueueSkill.weight])
+                    .where(and_(AgentQueueSkill.agentid == AgentFeatures.id,
+                                AgentQueueSkill.skillid == QueueSkill.id))
+                    .order_by(AgentFeatures.id))
+
+    penalties = (select([QueuePenalty.name,
+                         QueuePenaltyChange.seconds,
+                         QueuePenaltyChange.maxp_sign,
+                         QueuePenaltyChange.maxp_value,
+                         QueuePenaltyChange.minp_sign,
+                         QueuePenaltyChange.minp_value])
+                 .where(and_(QueuePenalty.id == QueuePenaltyChange.queuepenalty_id,
+                             QueuePenalty.commented == 0))
+                 .order_by(QueuePenalty.name))
+
+    members_by_queue = defaultdict(list)
+    for row in session.execute(members):
+        members_by_queue[row.queue_name].append({'penalty': row.penalty,
+                                                 'interface': row.interface})
+
+    return {
+        'general': _dicts(session, general),
+        'queues': _dicts(session, queues),
+        'skillrules': _dicts(session, skillrules),
+        'penalty': _dicts(session, penalty),
+        'members': dict(members_by_queue),
+        'agent_skills': _dicts(session, agent_skills),
+        'penalties': _dicts(session, penalties),
+    }
+
+
+def _meetme_snapshot(session):
+    rows = _dicts(session, select([StaticMeetme.__table__]).where(StaticMeetme.commented == 0))
+
+    return {
+        'general': [row for row in rows if row['category'] == 'general'],
+        'rooms': [row for row in rows if row['category'] == 'rooms'],
+    }
+
+
+def _voicemail_snapshot(session):
+    general = (select([StaticVoicemail.category, StaticVoicemail.var_name, StaticVoicemail.var_val])
+               .where(StaticVoicemail.commented == 0))
+    mailboxes = select([Voicemail.__table__]).where(Voicemail.commented == 0)
+
+    return {
+        'general': _dicts(session, general),
+        'mailboxes': _dicts(session, mailboxes),
+    }
+
+
+def _features_snapshot(session):
+    query = (select([Features.category, Features.var_name, Features.var_val])
+             .where(and_(Features.commented == 0,
+                         Features.category.in_(['general', 'featuremap']))))
+
+    rows = session.execute(query).fetchall()
+    parking_rows = [row for row in rows
+                    if row.category == 'general' and row.var_name in _PARKING_OPTIONS]
+    features_rows = [row for row in rows
+                     if row.category == 'featuremap' or row.var_name not in _PARKING_OPTIONS]
+
+    return {
+        'features': _features_settings(features_rows),
+        'parking': _parking_settings(parking_rows),
+    }
+
+
+@daosession
+def stream_sip_user_settings(session, batch_size=None):
+    pickup_members = _pickup_membership.members(session, 'sip')
+    for row in _stream(session, _sip_users_select(), batch_size):
+        yield _sip_user(row, pickup_members)
+
+
+@daosession
+def stream_sip_authentication_settings(session, batch_size=None):
+    for row in _stream(session, _sip_authentication_select(), batch_size):
+        yield dict(row)
+
+
+@daosession
+def stream_sccp_line_settings(session, batch_size=None):
+    pickup_members = _pickup_membership.members(session, 'sccp')
+    for row in _stream(session, _sccp_lines_select(), batch_size):
+        yield _sccp_line_config(row, pickup_members)
+
+
+@daosession
+def stream_iax_trunk_settings(session, batch_size=None):
+    for row in _stream(session, _iax_trunks_select(), batch_size):
+        yield dict(row)
+
+
+def _stream(session, query, batch_size=None):
+    batch_size = batch_size or STREAM_BATCH_SIZE
+    # server side cursor: only one batch of rows is held in memory
+    connection = session.connection().execution_options(stream_results=True)
+    result = connection.execute(query)
+    try:
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+    finally:
+        result.close()
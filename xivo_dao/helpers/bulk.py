@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+import datetime
+import logging
+import time
+
+from io import BytesIO
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = 10000
+
+_COPY_ESCAPES = [
+    ('\\', '\\\\'),
+    ('\t', '\\t'),
+    ('\n', '\\n'),
+    ('\r', '\\r'),
+]
+
+
+def bulk_insert(session, table, rows, batch_size=None):
+    """
+    Insert rows, an iterable of dicts keyed by column name, in batches.
+
+    Uses COPY FROM STDIN on PostgreSQL and a multi-row executemany on other
+    databases. Returns the number of inserted rows.
+    """
+    batch_size = batch_size or BULK_BATCH_SIZE
+    session.flush()
+    connection = session.connection()
+    if connection.dialect.name == 'postgresql':
+        insert_batch = _copy_batch
+    else:
+        insert_batch = _executemany_batch
+
+    total = 0
+    start = time.time()
+    rows = iter(rows)
+    batch = list(islice(rows, batch_size))
+    while batch:
+        insert_batch(connection, table, batch)
+        total += len(batch)
+        batch = list(islice(rows, batch_size))
+
+    elapsed = time.time() - start
+    logger.info('inserted %s rows in %s in %.3f seconds (%.0f rows/s)',
+                total, table.name, elapsed, total / elapsed if elapsed else total)
+
+    return total
+
+
+def _executemany_batch(connection, table, batch):
+    connection.execute(table.insert(), batch)
+
+
+def _copy_batch(connection, table, batch):
+    columns = sorted(batch[0].keys())
+    buf = BytesIO()
+    for row in batch:
+        line = u'\t'.join(_copy_value(row[column]) for column in columns)
+        buf.write(line.encode('utf-8'))
+        buf.write(b'\n')
+    buf.seek(0)
+
+    statement = 'COPY %s (%s) FROM STDIN' % (table.name, ', '.join('"%s"' % c for c in columns))
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(statement, buf)
+    finally:
+        cursor.close()
+
+
+def _copy_value(value):
+    if value is None:
+        return u'\\N'
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(' ').decode('ascii')
+    if isinstance(value, datetime.timedelta):
+        return u'%d days %d seconds %d microseconds' % (value.days, value.seconds, value.microseconds)
+    if isinstance(value, bool):
+        return u't' if value else u'f'
+    if not isinstance(value, unicode):
+        value = str(value).decode('utf-8')
+    for char, escaped in _COPY_ESCAPES:
+        value = value.replace(char, escaped)
+    return value
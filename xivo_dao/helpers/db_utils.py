@@ -15,10 +15,18 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
+import logging
+import time
+
 from contextlib import contextmanager
+from sqlalchemy import select
 from xivo_dao.helpers import db_manager
 from xivo_dao.helpers.db_manager import daosession
 
+logger = logging.getLogger(__name__)
+
+STREAM_BATCH_SIZE = 1000
+
 
 @contextmanager
 def flush_session(session):
@@ -46,3 +54,62 @@ def session_scope():
         raise
     finally:
         db_manager.Session.remove()
+
+
+def stream_query(query, batch_size=None):
+    """
+    Fetch the rows of an ORM query in batches using a server-side cursor.
+
+    The rows must be consumed before the end of the current transaction.
+    """
+    return query.yield_per(batch_size or STREAM_BATCH_SIZE)
+
+
+def stream_statement(session, statement, params=None):
+    """
+    Execute a core statement using a server-side cursor.
+
+    The rows must be consumed before the end of the current transaction.
+    """
+    connection = session.connection().execution_options(stream_results=True)
+    return connection.execute(statement, params or {})
+
+
+def backfill_column(session, column, touch_column, batch_size, pause=0):
+    """
+    Fill the NULL values of a column computed by a trigger, by setting
+    touch_column to itself in batches of ids. session is committed after
+    each batch, pause seconds slept between batches, and must not be
+    shared with other work. Returns the number of updated rows.
+    """
+    table = column.table
+    id_column = table.c.id
+
+    updated = 0
+    last_id = 0
+    while True:
+        batch = (select([id_column])
+                 .where(id_column > last_id)
+                 .where(column == None)  # noqa
+                 .order_by(id_column)
+                 .limit(batch_size))
+        query = (table.update()
+                 .where(id_column.in_(batch))
+                 .values({touch_column.name: touch_column})
+                 .returning(id_column))
+        updated_ids = [updated_id for updated_id, in session.execute(query)]
+        session.commit()
+
+        if not updated_ids:
+            break
+        updated += len(updated_ids)
+        last_id = max(updated_ids)
+        logger.debug('backfilled %s rows of %s', updated, column)
+
+        if len(updated_ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    logger.info('backfilled %s rows of %s', updated, column)
+    return updated
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+def union(intervals):
+    """
+    Merge the overlapping (start, end) intervals.
+
+    Returns the merged intervals sorted by start. Intervals that only touch
+    each other are kept apart.
+    """
+    result = []
+    for start, end in sorted(intervals):
+        if result and start < result[-1][1]:
+            if end > result[-1][1]:
+                result[-1] = (result[-1][0], end)
+        else:
+            result.append((start, end))
+    return result
+
+
+def intersection(intervals, other_intervals):
+    """
+    Returns the sorted parts of time covered by both lists of intervals.
+    """
+    result = []
+    left = union(intervals)
+    right = union(other_intervals)
+    i = j = 0
+    while i < len(left) and j < len(right):
+        start = max(left[i][0], right[j][0])
+        end = min(left[i][1], right[j][1])
+        if start < end:
+            result.append((start, end))
+        if left[i][1] < right[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def clip(intervals, start, end):
+    """
+    Restrict the intervals to the [start, end] range, dropping the ones
+    outside of it.
+    """
+    result = []
+    for interval_start, interval_end in intervals:
+        interval_start = max(interval_start, start)
+        interval_end = min(interval_end, end)
+        if interval_start < interval_end:
+            result.append((interval_start, interval_end))
+    return result
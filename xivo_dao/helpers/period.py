@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+def split_by_period(start, end, first_period, last_period, interval):
+    """
+    Split the [start, end) time interval on the periods of length interval
+    going from first_period to last_period included.
+
+    Yields a (period_start, duration) tuple for each period overlapped by the
+    interval. The parts of the interval outside of the periods are dropped.
+    """
+    start = max(start, first_period)
+    end = min(end, last_period + interval)
+    if start >= end:
+        return
+
+    period = first_period + period_index(first_period, interval, start) * interval
+    while period < end:
+        period_end = period + interval
+        yield period, min(end, period_end) - max(start, period)
+        period = period_end
+
+
+def period_index(first_period, interval, t):
+    return _microseconds(t - first_period) // _microseconds(interval)
+
+
+def last_period(first_period, interval, end):
+    return first_period + period_index(first_period, interval, end) * interval
+
+
+def _microseconds(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
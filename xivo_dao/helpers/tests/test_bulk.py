@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+import unittest
+
+from datetime import datetime, timedelta
+from hamcrest import assert_that, equal_to
+
+from xivo_dao.helpers.bulk import _copy_value
+
+
+class TestCopyValue(unittest.TestCase):
+
+    def test_null(self):
+        assert_that(_copy_value(None), equal_to(u'\\N'))
+
+    def test_datetime(self):
+        assert_that(_copy_value(datetime(2012, 1, 1, 1, 2, 3, 4)), equal_to(u'2012-01-01 01:02:03.000004'))
+
+    def test_timedelta(self):
+        value = timedelta(days=-1, seconds=60, microseconds=5)
+
+        assert_that(_copy_value(value), equal_to(u'-1 days 60 seconds 5 microseconds'))
+
+    def test_text_is_escaped(self):
+        assert_that(_copy_value(u'a\\b\tc\nd\r'), equal_to(u'a\\\\b\\tc\\nd\\r'))
+
+    def test_utf8_str(self):
+        assert_that(_copy_value('\xc3\xa9'), equal_to(u'\xe9'))
+
+    def test_number(self):
+        assert_that(_copy_value(42), equal_to(u'42'))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+import unittest
+
+from hamcrest import assert_that, contains, empty
+
+from xivo_dao.helpers import interval
+
+
+class TestUnion(unittest.TestCase):
+
+    def test_touching_intervals_are_kept_apart(self):
+        result = interval.union([(2, 3), (1, 2)])
+
+        assert_that(result, contains((1, 2), (2, 3)))
+
+    def test_overlapping_intervals_are_merged(self):
+        result = interval.union([(1, 2), (2, 3), (2, 4)])
+
+        assert_that(result, contains((1, 2), (2, 4)))
+
+    def test_included_intervals_are_merged(self):
+        result = interval.union([(1, 2), (2, 4), (3, 4), (5, 9), (6, 7)])
+
+        assert_that(result, contains((1, 2), (2, 4), (5, 9)))
+
+
+class TestIntersection(unittest.TestCase):
+
+    def test_intersection(self):
+        result = interval.intersection([(1, 5), (7, 10)], [(0, 2), (4, 8), (9, 12)])
+
+        assert_that(result, contains((1, 2), (4, 5), (7, 8), (9, 10)))
+
+    def test_no_intersection(self):
+        result = interval.intersection([(1, 2)], [(2, 3)])
+
+        assert_that(result, empty())
+
+
+class TestClip(unittest.TestCase):
+
+    def test_clip(self):
+        result = interval.clip([(0, 2), (3, 4), (5, 8), (8, 9)], 1, 6)
+
+        assert_that(result, contains((1, 2), (3, 4), (5, 6)))
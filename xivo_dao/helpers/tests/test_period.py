@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+import unittest
+
+from datetime import datetime, timedelta
+from hamcrest import assert_that, contains, equal_to
+
+from xivo_dao.helpers.period import last_period, split_by_period
+
+ONE_HOUR = timedelta(hours=1)
+FIRST = datetime(2012, 10, 1, 6)
+LAST = datetime(2012, 10, 1, 8)
+
+
+class TestSplitByPeriod(unittest.TestCase):
+
+    def test_interval_inside_a_period(self):
+        result = split_by_period(datetime(2012, 10, 1, 6, 10), datetime(2012, 10, 1, 6, 20), FIRST, LAST, ONE_HOUR)
+
+        assert_that(list(result), contains((FIRST, timedelta(minutes=10))))
+
+    def test_interval_spanning_many_periods(self):
+        result = split_by_period(datetime(2012, 10, 1, 6, 50), datetime(2012, 10, 1, 8, 5), FIRST, LAST, ONE_HOUR)
+
+        assert_that(list(result), contains(
+            (datetime(2012, 10, 1, 6), timedelta(minutes=10)),
+            (datetime(2012, 10, 1, 7), ONE_HOUR),
+            (datetime(2012, 10, 1, 8), timedelta(minutes=5)),
+        ))
+
+    def test_interval_clipped_to_periods(self):
+        result = split_by_period(datetime(2012, 10, 1, 5, 50), datetime(2012, 10, 1, 9, 10), FIRST, FIRST, ONE_HOUR)
+
+        assert_that(list(result), contains((FIRST, ONE_HOUR)))
+
+    def test_interval_outside_periods(self):
+        result = split_by_period(datetime(2012, 10, 1, 9), datetime(2012, 10, 1, 9, 10), FIRST, LAST, ONE_HOUR)
+
+        assert_that(list(result), equal_to([]))
+
+    def test_interval_starting_on_a_period_boundary(self):
+        result = split_by_period(datetime(2012, 10, 1, 7), datetime(2012, 10, 1, 7, 1), FIRST, LAST, ONE_HOUR)
+
+        assert_that(list(result), contains((datetime(2012, 10, 1, 7), timedelta(minutes=1))))
+
+
+class TestLastPeriod(unittest.TestCase):
+
+    def test_last_period(self):
+        result = last_period(FIRST, timedelta(minutes=15), datetime(2012, 10, 1, 7, 59, 59, 999999))
+
+        assert_that(result, equal_to(datetime(2012, 10, 1, 7, 45)))
@@ -18,21 +18,24 @@
 from sqlalchemy import between, distinct
 from sqlalchemy.sql.expression import and_, or_
 from sqlalchemy.sql.functions import min
+from sqlalchemy.sql import text
 from xivo_dao.alchemy.queue_log import QueueLog
-from sqlalchemy import cast, TIMESTAMP, func
+from sqlalchemy import func
 from datetime import timedelta
+from xivo_dao.helpers import db_manager
 from xivo_dao.helpers.db_manager import daosession
+from xivo_dao.helpers.db_utils import backfill_column, stream_query, stream_statement
+from xivo_dao.helpers.period import last_period, split_by_period
 
-
-_STR_TIME_FMT = "%Y-%m-%d %H:%M:%S.%f"
+TIMESTAMP_BACKFILL_BATCH_SIZE = 10000
 
 
 def get_wrapup_times(session, start, end, interval):
     before_start = start - timedelta(minutes=2)
-    wrapup_times_query = '''\
+    wrapup_times_query = text('''\
 SELECT
-    CAST(queue_log.time AS TIMESTAMP) AS start,
-    (CAST(queue_log.time AS TIMESTAMP) + (queue_log.data1 || ' seconds')::INTERVAL) AS end,
+    queue_log.timestamp AS start,
+    (queue_log.timestamp + (queue_log.data1 || ' seconds')::INTERVAL) AS end,
     stat_agent.id AS agent_id
 FROM
     queue_log
@@ -41,91 +44,43 @@ INNER JOIN
 WHERE
   queue_log.event = 'WRAPUPSTART'
 AND
-  queue_log.time BETWEEN :start AND :end
-'''
-
-    periods = [t for t in _enumerate_periods(start, end, interval)]
-    formatted_start = before_start.strftime('%Y-%m-%d %H:%M:%S')
-    formatted_end = end.strftime('%Y-%m-%d %H:%M:%S')
+  queue_log.timestamp BETWEEN :start AND :end
+''')
 
-    rows = session.query(
-        'start',
-        'end',
-        'agent_id'
-    ).from_statement(wrapup_times_query).params(start=formatted_start,
-                                                end=formatted_end)
+    final_period = last_period(start, interval, end)
+    params = {'start': before_start.replace(microsecond=0),
+              'end': end.replace(microsecond=0)}
 
     results = {}
-    for row in rows.all():
-        agent_id, wstart, wend = row.agent_id, row.start, row.end
-
-        starting_period = _find_including_period(periods, wstart)
-        ending_period = _find_including_period(periods, wend)
-
-        if starting_period and starting_period not in results:
-            results[starting_period] = {}
-        if ending_period and ending_period not in results:
-            results[ending_period] = {}
-
-        if starting_period is not None:
-            range_end = starting_period + interval
-            wend_in_start = wend if wend < range_end else range_end
-            time_in_period = wend_in_start - wstart
-            if agent_id not in results[starting_period]:
-                results[starting_period][agent_id] = {
-                    'wrapup_time': timedelta(seconds=0)
-                }
-            results[starting_period][agent_id]['wrapup_time'] += time_in_period
-
-        if ending_period == starting_period:
-            continue
-
-        time_in_period = wend - ending_period
-        if agent_id not in results[ending_period]:
-            results[ending_period][agent_id] = {
+    for row in stream_statement(session, wrapup_times_query, params):
+        for period_start, duration in split_by_period(row.start, row.end, start, final_period, interval):
+            agent_times = results.setdefault(period_start, {}).setdefault(row.agent_id, {
                 'wrapup_time': timedelta(seconds=0)
-            }
-        results[ending_period][agent_id]['wrapup_time'] += time_in_period
+            })
+            agent_times['wrapup_time'] += duration
 
     return results
 
 
-def _find_including_period(periods, t):
-    match = None
-    for period in periods:
-        if t > period:
-            match = period
-    return match
-
-
-def _enumerate_periods(start, end, interval):
-    tmp = start
-    while tmp <= end:
-        yield tmp
-        tmp += interval
-
-
-def _get_ended_call(session, start_str, end, queue_log_event, stat_event):
-    pairs = []
+def _get_ended_call(session, start, end, queue_log_event, stat_event, batch_size=None):
     enter_queue_event = None
 
     higher_boundary = end + timedelta(days=1)
-    end_str = higher_boundary.strftime(_STR_TIME_FMT)
 
     queue_logs = (session
                   .query(QueueLog.event,
                          QueueLog.callid,
                          QueueLog.queuename,
                          QueueLog.data3,
-                         cast(QueueLog.time, TIMESTAMP).label('time'))
-                  .filter(and_(QueueLog.time >= start_str,
-                               QueueLog.time < end_str,
+                         QueueLog.timestamp.label('time'))
+                  .filter(and_(QueueLog.timestamp >= start,
+                               QueueLog.timestamp < higher_boundary,
                                or_(QueueLog.event == 'ENTERQUEUE',
                                    QueueLog.event == queue_log_event)))
-                  .order_by(QueueLog.callid, QueueLog.time))
+                  .order_by(QueueLog.callid, QueueLog.timestamp))
 
     to_skip = None
-    for queue_log in queue_logs.all():
+    for queue_log in stream_query(queue_logs, batch_size):
         # The first matched entry of a pair should be an ENTERQUEUE
         if enter_queue_event is None and queue_log.event != 'ENTERQUEUE':
             continue
@@ -151,42 +106,34 @@ def _get_ended_call(session, start_str, end, queue_log_event, stat_event):
         if end_event.callid != enter_queue_event.callid:
             continue
 
-        pairs.append((enter_queue_event, end_event))
-
-    for enter_queue, end_event in pairs:
         yield {
-            'callid': enter_queue.callid,
-            'queue_name': enter_queue.queuename,
-            'time': enter_queue.time,
+            'callid': enter_queue_event.callid,
+            'queue_name': enter_queue_event.queuename,
+            'time': enter_queue_event.time,
             'event': stat_event,
             'talktime': 0,
             'waittime': int(end_event.data3),
         }
 
 
-def get_queue_abandoned_call(session, start, end):
-    start_str = start.strftime(_STR_TIME_FMT)
-    return _get_ended_call(session, start_str, end, 'ABANDON', 'abandoned')
+def get_queue_abandoned_call(session, start, end, batch_size=None):
+    return _get_ended_call(session, start, end, 'ABANDON', 'abandoned', batch_size)
 
 
-def get_queue_timeout_call(session, start, end):
-    start_str = start.strftime(_STR_TIME_FMT)
-    return _get_ended_call(session, start_str, end, 'EXITWITHTIMEOUT', 'timeout')
+def get_queue_timeout_call(session, start, end, batch_size=None):
+    return _get_ended_call(session, start, end, 'EXITWITHTIMEOUT', 'timeout', batch_size)
 
 
 def get_first_time(session):
-    res = session.query(cast(min(QueueLog.time), TIMESTAMP)).first()[0]
+    res = session.query(min(QueueLog.timestamp)).first()[0]
     if res is None:
         raise LookupError('Table is empty')
     return res
 
 
 def get_queue_names_in_range(session, start, end):
-    start = start.strftime(_STR_TIME_FMT)
-    end = end.strftime(_STR_TIME_FMT)
-
     return [r[0] for r in (session.query(distinct(QueueLog.queuename))
-                           .filter(between(QueueLog.time, start, end)))]
+                           .filter(between(QueueLog.timestamp, start, end)))]
 
 
 @daosession
@@ -219,13 +166,29 @@ def insert_entry(session, time, callid, queue, agent, event, d1='', d2='', d3=''
     session.add(entry)
 
 
-def hours_with_calls(session, start, end):
-    start = start.strftime(_STR_TIME_FMT)
-    end = end.strftime(_STR_TIME_FMT)
+def backfill_timestamp(batch_size=None, pause=0):
+    """
+    Fill the timestamp of the rows written before the column existed. The
+    rows are touched through their time column so that the sync trigger
+    does the conversion, by batches of batch_size ids, each committed in a
+    session of its own, and pause seconds are slept between batches.
+    Returns the number of updated rows.
+    """
+    session = db_manager.Session.session_factory()
+    try:
+        return backfill_column(session,
+                               QueueLog.timestamp,
+                               QueueLog.time,
+                               batch_size or TIMESTAMP_BACKFILL_BATCH_SIZE,
+                               pause)
+    finally:
+        session.close()
+
 
+def hours_with_calls(session, start, end):
     hours = (session
-             .query(distinct(func.date_trunc('hour', cast(QueueLog.time, TIMESTAMP))).label('time'))
-             .filter(between(QueueLog.time, start, end)))
+             .query(distinct(func.date_trunc('hour', QueueLog.timestamp)).label('time'))
+             .filter(between(QueueLog.timestamp, start, end)))
 
     for hour in hours.all():
         yield hour.time
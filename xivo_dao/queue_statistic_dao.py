@@ -15,12 +15,48 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
+import threading
 import time
+
 from xivo_dao.helpers.db_manager import daosession
 
+# statistics are recomputed at most once per CACHE_TTL seconds for a given
+# (queue_name, window, xqos), concurrent requests waiting for the same result
+CACHE_TTL = 2.0
+
+_cache = {}
+_locks = {}
+_locks_lock = threading.Lock()
+
 
 @daosession
 def get_statistics(session, queue_name, window, xqos):
+    key = (queue_name, window, xqos)
+    with _lock_for(key):
+        now = time.time()
+        cached = _cache.get(key)
+        if cached and now - cached[0] < CACHE_TTL:
+            return cached[1]
+
+        queue_statistic = _query_statistics(session, queue_name, window, xqos)
+        _cache[key] = (now, queue_statistic)
+
+    return queue_statistic
+
+
+def clear_cache():
+    # a request holding a dropped lock only races a new one to the same query
+    with _locks_lock:
+        _cache.clear()
+        _locks.clear()
+
+
+def _lock_for(key):
+    with _locks_lock:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def _query_statistics(session, queue_name, window, xqos):
     in_window = _compute_window_time(window)
     queue_statistic = (session
                        .query('received_call_count',
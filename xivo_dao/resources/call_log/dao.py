@@ -15,14 +15,16 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-from sqlalchemy import or_
+from sqlalchemy import func, or_, select, union_all
+from sqlalchemy.sql import bindparam, text
 
 from xivo_dao.alchemy.call_log import CallLog as CallLogSchema
-from xivo_dao.alchemy.cel import CEL as CELSchema
-from xivo_dao.helpers.db_utils import flush_session
+from xivo_dao.helpers.db_utils import flush_session, stream_query
 from xivo_dao.helpers.db_manager import daosession
 from xivo_dao.resources.call_log.model import db_converter
 
+CREATE_BATCH_SIZE = 1000
+
 
 @daosession
 def find_all(session):
@@ -45,12 +47,36 @@ def find_all_in_period(session, start, end):
     return map(db_converter.to_model, call_log_rows)
 
 
+@daosession
+def stream_all_in_period(session, start, end, batch_size=None):
+    call_log_rows = (session
+                     .query(CallLogSchema)
+                     .filter(CallLogSchema.date.between(start, end)))
+
+    for call_log_row in stream_query(call_log_rows, batch_size):
+        yield db_converter.to_model(call_log_row)
+
+
 @daosession
 def find_all_history_for_phone(session, identifier, limit):
+    # one index ordered scan per identity column, calls from and to the same
+    # identity being only taken from the source scan
+    from_phone = (session
+                  .query(CallLogSchema)
+                  .filter(CallLogSchema.source_line_identity == identifier)
+                  .order_by(CallLogSchema.date.desc())
+                  .limit(limit))
+    to_phone = (session
+                .query(CallLogSchema)
+                .filter(CallLogSchema.destination_line_identity == identifier)
+                .filter(or_(CallLogSchema.source_line_identity != identifier,
+                            CallLogSchema.source_line_identity == None))  # noqa
+                .order_by(CallLogSchema.date.desc())
+                .limit(limit))
+    history = union_all(from_phone.subquery().select(), to_phone.subquery().select()).alias()
     call_log_rows = (session
                      .query(CallLogSchema)
-                     .filter(or_(CallLogSchema.destination_line_identity == identifier,
-                                 CallLogSchema.source_line_identity == identifier))
+                     .select_entity_from(history)
                      .order_by(CallLogSchema.date.desc())
                      .limit(limit))
 
@@ -58,11 +84,15 @@ def find_all_history_for_phone(session, identifier, limit):
 
 
 @daosession
-def create_from_list(session, call_logs):
+def create_from_list(session, call_logs, batch_size=None):
+    batch_size = batch_size or CREATE_BATCH_SIZE
+    call_logs = list(call_logs)
+
     with flush_session(session):
-        for call_log in call_logs:
-            call_log_id = create_call_log(session, call_log)
-            _link_call_log(session, call_log, call_log_id)
+        for i in xrange(0, len(call_logs), batch_size):
+            batch = call_logs[i:i + batch_size]
+            call_log_ids = _insert_call_logs(session, batch)
+            _link_call_logs(session, batch, call_log_ids, batch_size)
 
 
 def create_call_log(session, call_log):
@@ -72,13 +102,52 @@ def create_call_log(session, call_log):
     return call_log_row.id
 
 
-def _link_call_log(session, call_log, call_log_id):
-    data_dict = {'call_log_id': int(call_log_id)}
-    related_cels = call_log.get_related_cels()
-    if related_cels:
-        session.query(CELSchema).filter(
-            CELSchema.id.in_(related_cels)
-        ).update(data_dict, synchronize_session=False)
+def _insert_call_logs(session, call_logs):
+    rows = [db_converter.to_source(call_log).todict() for call_log in call_logs]
+
+    # ids are taken from the sequence beforehand and given explicitly, the
+    # order of the rows returned by a multi-row INSERT not being guaranteed
+    missing_ids = [row for row in rows if row['id'] is None]
+    for row, call_log_id in zip(missing_ids, _next_call_log_ids(session, len(missing_ids))):
+        row['id'] = call_log_id
+
+    session.execute(CallLogSchema.__table__.insert().values(rows))
+
+    return [row['id'] for row in rows]
+
+
+def _next_call_log_ids(session, count):
+    if not count:
+        return []
+    query = select([func.nextval('call_log_id_seq')]).select_from(func.generate_series(1, count))
+    return [call_log_id for call_log_id, in session.execute(query)]
+
+
+def _link_call_logs(session, call_logs, call_log_ids, batch_size):
+    links = [(int(cel_id), int(call_log_id))
+             for call_log, call_log_id in zip(call_logs, call_log_ids)
+             for cel_id in call_log.get_related_cels()]
+
+    for i in xrange(0, len(links), batch_size):
+        _update_cels(session, links[i:i + batch_size])
+
+
+def _update_cels(session, links):
+    values = []
+    params = []
+    for n, (cel_id, call_log_id) in enumerate(links):
+        values.append('(:cel_id_{n}, :call_log_id_{n})'.format(n=n))
+        params.append(bindparam('cel_id_%s' % n, cel_id))
+        params.append(bindparam('call_log_id_%s' % n, call_log_id))
+
+    query = text('''\
+UPDATE cel
+SET call_log_id = links.call_log_id
+FROM (VALUES {values}) AS links (cel_id, call_log_id)
+WHERE cel.id = links.cel_id
+'''.format(values=', '.join(values)), bindparams=params)
+
+    session.execute(query)
 
 
 @daosession
@@ -89,12 +158,13 @@ def delete_all(session):
 
 @daosession
 def delete_from_list(session, call_log_ids):
+    call_log_ids = list(call_log_ids)
     with flush_session(session):
-        for call_log_id in call_log_ids:
+        for i in xrange(0, len(call_log_ids), CREATE_BATCH_SIZE):
             (session
              .query(CallLogSchema)
-             .filter(CallLogSchema.id == call_log_id)
-             .delete())
+             .filter(CallLogSchema.id.in_(call_log_ids[i:i + CREATE_BATCH_SIZE]))
+             .delete(synchronize_session=False))
 
 
 def _converted_call_logs(rows):
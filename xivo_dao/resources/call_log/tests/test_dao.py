@@ -18,7 +18,7 @@
 from datetime import datetime as dt
 from datetime import timedelta
 from hamcrest import (assert_that, empty, equal_to, has_length, contains_inanyorder, has_property,
-                      contains, all_of, is_)
+                      contains, all_of, is_, has_item)
 from mock import patch
 
 from xivo_dao.alchemy.call_log import CallLog as CallLogSchema
@@ -84,6 +84,17 @@ class TestCallLogDAO(DAOTestCase):
                    has_property('destination_line_identity', c4.destination_line_identity),
                    has_property('answered', c4.answered))))
 
+    def test_find_all_history_for_phone_call_to_itself(self):
+        identity = "sip/131313"
+        call_logs = (self._mock_call_log(date=dt(2015, 1, 1, 13, 10, 10),
+                                         source_line_identity=identity,
+                                         destination_line_identity=identity),)
+        call_log_dao.create_from_list(call_logs)
+
+        result = call_log_dao.find_all_history_for_phone(identity, 10)
+
+        assert_that(result, contains(has_property('date', dt(2015, 1, 1, 13, 10, 10))))
+
     def test_find_all_history_for_phone_no_calls(self):
         result = call_log_dao.find_all_history_for_phone('sip/foobar', 42)
 
@@ -127,6 +138,20 @@ class TestCallLogDAO(DAOTestCase):
         assert_that(result, contains_inanyorder(has_property('date', call_log_1.date),
                                                 has_property('date', call_log_2.date)))
 
+    def test_stream_all_in_period_found(self):
+        call_logs = _, call_log_1, call_log_2, _ = (self._mock_call_log(date=dt(2012, 1, 1, 13)),
+                                                    self._mock_call_log(date=dt(2013, 1, 1, 13)),
+                                                    self._mock_call_log(date=dt(2013, 1, 2, 13)),
+                                                    self._mock_call_log(date=dt(2014, 1, 1, 13)))
+        start = dt(2013, 1, 1, 12)
+        end = dt(2013, 1, 3, 12)
+        call_log_dao.create_from_list(call_logs)
+
+        result = list(call_log_dao.stream_all_in_period(start, end, batch_size=1))
+
+        assert_that(result, contains_inanyorder(has_property('date', call_log_1.date),
+                                                has_property('date', call_log_2.date)))
+
     def test_create_call_log(self):
         expected_id = 13
         call_log = self._mock_call_log(id=expected_id)
@@ -157,6 +182,44 @@ class TestCallLogDAO(DAOTestCase):
             all_of(has_property('id', cel_id_3), has_property('call_log_id', call_log_id_2)),
             all_of(has_property('id', cel_id_4), has_property('call_log_id', call_log_id_2))))
 
+    def test_create_from_list_in_batches(self):
+        cel_ids = [self.add_cel() for _ in range(5)]
+        call_logs = (self._mock_call_log(cel_ids[:2]),
+                     self._mock_call_log(id=42),
+                     self._mock_call_log(cel_ids[2:]))
+
+        call_log_dao.create_from_list(call_logs, batch_size=2)
+
+        call_log_rows = self.session.query(CallLogSchema).order_by(CallLogSchema.id).all()
+        assert_that(call_log_rows, has_length(3))
+        assert_that(call_log_rows, has_item(has_property('id', 42)))
+        call_log_id_1, call_log_id_3 = [row.id for row in call_log_rows if row.id != 42]
+
+        cel_rows = self.session.query(CELSchema.id, CELSchema.call_log_id).all()
+        assert_that(cel_rows, contains_inanyorder(
+            (cel_ids[0], call_log_id_1),
+            (cel_ids[1], call_log_id_1),
+            (cel_ids[2], call_log_id_3),
+            (cel_ids[3], call_log_id_3),
+            (cel_ids[4], call_log_id_3)))
+
+    def test_create_from_list_links_cels_to_their_own_call_log(self):
+        cel_ids = [self.add_cel() for _ in range(3)]
+        call_logs = (self._mock_call_log(cel_ids[:1], source_line_identity='sip/first'),
+                     self._mock_call_log(cel_ids[1:2], id=42, source_line_identity='sip/second'),
+                     self._mock_call_log(cel_ids[2:], source_line_identity='sip/third'))
+
+        call_log_dao.create_from_list(call_logs)
+
+        cel_rows = (self.session
+                    .query(CELSchema.id, CallLogSchema.source_line_identity)
+                    .join(CallLogSchema, CallLogSchema.id == CELSchema.call_log_id)
+                    .all())
+        assert_that(cel_rows, contains_inanyorder(
+            (cel_ids[0], 'sip/first'),
+            (cel_ids[1], 'sip/second'),
+            (cel_ids[2], 'sip/third')))
+
     def test_delete_all(self):
         call_logs = (self._mock_call_log(), self._mock_call_log())
         call_log_dao.create_from_list(call_logs)
@@ -15,8 +15,20 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
+import datetime
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql import or_, tuple_
+
 from xivo_dao.helpers.db_manager import daosession
+from xivo_dao.helpers.db_utils import STREAM_BATCH_SIZE, stream_query
 from xivo_dao.alchemy.cel import CEL as CELSchema
+from xivo_dao.alchemy.cel_reader_position import CELReaderPosition
+from xivo_dao.resources.cel.event_type import CELEventType
+
+DEFAULT_READER = 'call_log'
+UNENDED_CALL_MAX_AGE = datetime.timedelta(days=1)
 
 
 @daosession
@@ -36,6 +48,112 @@ def find_last_unprocessed(session, limit):
     return cel_rows
 
 
+@daosession
+def stream_last_unprocessed(session, limit, batch_size=None):
+    linked_ids = (session
+                  .query(CELSchema.linkedid)
+                  .filter(CELSchema.call_log_id == None)
+                  .order_by(CELSchema.eventtime.desc())
+                  .limit(limit)
+                  .subquery())
+    cel_rows = (session
+                .query(CELSchema)
+                .filter(CELSchema.linkedid.in_(linked_ids))
+                .order_by(CELSchema.eventtime.asc(), CELSchema.id.asc()))
+    for cel_row in stream_query(cel_rows, batch_size):
+        yield cel_row
+
+
+@daosession
+def stream_unprocessed_calls(session, reader=None, batch_size=None, max_age=None):
+    """
+    Walk the unprocessed calls that have ended, in the (eventtime, id) order
+    of their last CEL, starting after the position saved for reader, and
+    yield the CELs of each call in chronological order.
+
+    A call has ended when its last CEL is a LINKEDID_END, or is older than
+    max_age for calls that never got one. A call in progress is yielded
+    once it has ended, and a call is not yielded again once its last CEL is
+    processed.
+
+    The position is saved once every call of a batch has been yielded, the
+    calls of an interrupted batch are yielded again on the next run. It
+    never goes past the max_age cutoff, so that the calls still in progress
+    are reached when they end.
+    """
+    batch_size = batch_size or STREAM_BATCH_SIZE
+    cutoff = datetime.datetime.now() - (max_age or UNENDED_CALL_MAX_AGE)
+    position = _get_position(session, reader or DEFAULT_READER)
+    later_cel = aliased(CELSchema)
+    has_later_cel = (session
+                     .query(later_cel.id)
+                     .filter(later_cel.linkedid == CELSchema.linkedid)
+                     .filter(tuple_(later_cel.eventtime, later_cel.id) >
+                             tuple_(CELSchema.eventtime, CELSchema.id))
+                     .exists())
+
+    last = position.eventtime, position.cel_id
+    while True:
+        query = (session
+                 .query(CELSchema.eventtime, CELSchema.id, CELSchema.linkedid)
+                 .filter(CELSchema.call_log_id == None)  # noqa
+                 .filter(or_(CELSchema.eventtype == CELEventType.linkedid_end,
+                             CELSchema.eventtime < cutoff))
+                 .filter(~has_later_cel))
+        if last[0] is not None:
+            query = query.filter(tuple_(CELSchema.eventtime, CELSchema.id) > tuple_(*last))
+        rows = (query
+                .order_by(CELSchema.eventtime.asc(), CELSchema.id.asc())
+                .limit(batch_size)
+                .all())
+        if not rows:
+            return
+
+        for row in rows:
+            yield _find_call(session, row.linkedid)
+
+        last = rows[-1].eventtime, rows[-1].id
+        position.eventtime, position.cel_id = min(last, (cutoff, 0))
+        session.flush()
+
+
+@daosession
+def reset_unprocessed_position(session, reader=None):
+    (session
+     .query(CELReaderPosition)
+     .filter(CELReaderPosition.name == (reader or DEFAULT_READER))
+     .delete())
+
+
+def _get_position(session, name):
+    position = _find_position(session, name)
+    if position is None:
+        try:
+            with session.begin_nested():
+                session.add(CELReaderPosition(name=name))
+        except IntegrityError:
+            # created by a concurrent reader
+            pass
+        position = _find_position(session, name)
+    return position
+
+
+def _find_position(session, name):
+    return (session
+            .query(CELReaderPosition)
+            .filter(CELReaderPosition.name == name)
+            .with_for_update()
+            .first())
+
+
+def _find_call(session, linked_id):
+    return (session
+            .query(CELSchema)
+            .filter(CELSchema.linkedid == linked_id)
+            .order_by(CELSchema.eventtime.asc(), CELSchema.id.asc())
+            .all())
+
+
 @daosession
 def find_from_linked_id(session, linked_id):
     cel_rows = (session
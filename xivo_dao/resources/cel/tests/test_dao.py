@@ -16,7 +16,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
 import datetime
-from hamcrest import assert_that, contains, has_property, contains_inanyorder
+from hamcrest import assert_that, contains, has_length, has_property, contains_inanyorder
 
 from xivo_dao.alchemy.cel import CEL as CELSchema
 from xivo_dao.resources.call_log.model import CallLog, db_converter
@@ -105,6 +105,96 @@ class TestCELDAO(DAOTestCase):
                                      has_property('id', cel_id_3),
                                      has_property('id', cel_id_4)))
 
+    def test_stream_last_unprocessed(self):
+        limit = 2
+        self.add_cel(linkedid='1')
+        cel_id_2, cel_id_3 = self.add_cel(linkedid='2'), self._add_processed_cel(linkedid='3')
+        cel_id_4 = self.add_cel(linkedid='3')
+
+        result = cel_dao.stream_last_unprocessed(limit, batch_size=1)
+
+        assert_that(list(result), contains(has_property('id', cel_id_2),
+                                           has_property('id', cel_id_3),
+                                           has_property('id', cel_id_4)))
+
+    def test_stream_unprocessed_calls(self):
+        now = datetime.datetime.now()
+        cel_id_1 = self.add_cel(linkedid='1', eventtime=now)
+        cel_id_2 = self.add_cel(linkedid='2', eventtime=now + datetime.timedelta(seconds=1))
+        cel_id_3 = self._add_processed_cel(linkedid='3')
+        cel_id_4 = self._add_end_cel(linkedid='1', eventtime=now + datetime.timedelta(seconds=2))
+        cel_id_5 = self._add_end_cel(linkedid='3', eventtime=now + datetime.timedelta(seconds=3))
+        cel_id_6 = self._add_end_cel(linkedid='2', eventtime=now + datetime.timedelta(seconds=4))
+
+        result = cel_dao.stream_unprocessed_calls(batch_size=2)
+
+        assert_that([[cel.id for cel in call] for call in result], contains(
+            contains(cel_id_1, cel_id_4),
+            contains(cel_id_3, cel_id_5),
+            contains(cel_id_2, cel_id_6),
+        ))
+
+    def test_stream_unprocessed_calls_resumes_after_saved_position(self):
+        now = datetime.datetime.now() - datetime.timedelta(days=2)
+        self._add_end_cel(linkedid='1', eventtime=now)
+        list(cel_dao.stream_unprocessed_calls())
+        cel_id_2 = self._add_end_cel(linkedid='2', eventtime=now + datetime.timedelta(seconds=1))
+
+        result = cel_dao.stream_unprocessed_calls()
+
+        assert_that([[cel.id for cel in call] for call in result], contains(contains(cel_id_2)))
+
+        cel_dao.reset_unprocessed_position()
+
+        result = cel_dao.stream_unprocessed_calls()
+
+        assert_that(list(result), has_length(2))
+
+    def test_stream_unprocessed_calls_yields_calls_in_progress_once_ended(self):
+        now = datetime.datetime.now()
+        cel_id_1 = self.add_cel(linkedid='1', eventtime=now)
+        cel_id_2 = self._add_end_cel(linkedid='2', eventtime=now + datetime.timedelta(seconds=1))
+
+        result = cel_dao.stream_unprocessed_calls()
+
+        assert_that([[cel.id for cel in call] for call in result], contains(contains(cel_id_2)))
+
+        cel_id_3 = self._add_end_cel(linkedid='1', eventtime=now + datetime.timedelta(seconds=2))
+
+        result = cel_dao.stream_unprocessed_calls()
+
+        assert_that([[cel.id for cel in call] for call in result], contains(
+            contains(cel_id_2),
+            contains(cel_id_1, cel_id_3),
+        ))
+
+    def test_stream_unprocessed_calls_does_not_yield_processed_calls_again(self):
+        now = datetime.datetime.now()
+        self.add_cel(linkedid='1', eventtime=now)
+        cel_id = self._add_end_cel(linkedid='1', eventtime=now + datetime.timedelta(seconds=1))
+        list(cel_dao.stream_unprocessed_calls())
+        self._link_call_to_cel(self._add_call(), cel_id)
+
+        result = cel_dao.stream_unprocessed_calls()
+
+        assert_that(list(result), contains())
+
+    def test_stream_unprocessed_calls_yields_unended_calls_older_than_max_age(self):
+        now = datetime.datetime.now()
+        cel_id_1 = self.add_cel(linkedid='1', eventtime=now - datetime.timedelta(hours=1))
+        cel_id_2 = self._add_end_cel(linkedid='2', eventtime=now)
+
+        result = cel_dao.stream_unprocessed_calls()
+
+        assert_that([[cel.id for cel in call] for call in result], contains(contains(cel_id_2)))
+
+        result = cel_dao.stream_unprocessed_calls(max_age=datetime.timedelta(minutes=30))
+
+        assert_that([[cel.id for cel in call] for call in result], contains(
+            contains(cel_id_1),
+            contains(cel_id_2),
+        ))
+
     def test_find_from_linked_id_no_cels(self):
         linked_id = '666'
 
@@ -136,6 +226,9 @@ class TestCELDAO(DAOTestCase):
                                      has_property('id', cel_id_1),
                                      has_property('id', cel_id_3)))
 
+    def _add_end_cel(self, **kwargs):
+        return self.add_cel(eventtype='LINKEDID_END', **kwargs)
+
     def _add_processed_cel(self, **kwargs):
         call_log_id = self._add_call()
         cel_id = self.add_cel(**kwargs)
@@ -51,8 +51,8 @@ class CustomPersistor(object):
         return self.find_query(criteria).all()
 
     def search(self, params):
-        rows, total = custom_search.search(self.session, params)
-        return SearchResult(total, rows)
+        page = custom_search.search(self.session, params)
+        return SearchResult(page.total, page.items, page.next)
 
     def create(self, custom):
         self.fill_default_values(custom)
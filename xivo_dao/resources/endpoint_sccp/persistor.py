@@ -42,8 +42,8 @@ class SccpPersistor(object):
         return row
 
     def search(self, params):
-        rows, total = sccp_search.search(self.session, params)
-        return SearchResult(total, rows)
+        page = sccp_search.search(self.session, params)
+        return SearchResult(page.total, page.items, page.next)
 
     def create(self, sccp):
         self.fill_default_values(sccp)
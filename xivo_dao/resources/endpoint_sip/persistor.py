@@ -54,8 +54,8 @@ class SipPersistor(object):
         return row
 
     def search(self, params):
-        rows, total = sip_search.search(self.session, params)
-        return SearchResult(total, rows)
+        page = sip_search.search(self.session, params)
+        return SearchResult(page.total, page.items, page.next)
 
     def create(self, sip):
         self.fill_default_values(sip)
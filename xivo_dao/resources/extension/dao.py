@@ -77,9 +77,9 @@ def find(session, extension_id):
 
 @daosession
 def search(session, **parameters):
-    rows, total = extension_search.search(session, parameters)
-    extensions = [db_converter.to_model(row) for row in rows]
-    return SearchResult(total, extensions)
+    page = extension_search.search(session, parameters)
+    extensions = [db_converter.to_model(row) for row in page.items]
+    return SearchResult(page.total, extensions, page.next)
 
 
 @daosession
@@ -19,6 +19,8 @@ from xivo_dao.alchemy.extension import Extension
 from xivo_dao.alchemy.context import Context
 from xivo_dao.resources.utils.search import SearchSystem
 from xivo_dao.resources.utils.search import SearchConfig
+from xivo_dao.resources.utils.search_backend import TrigramSearchBackend
+from xivo_dao.resources.utils.search_backend import register_indexes
 
 
 config = SearchConfig(table=Extension,
@@ -41,4 +43,6 @@ class ExtensionSearchSystem(SearchSystem):
         return query
 
 
-extension_search = ExtensionSearchSystem(config)
+register_indexes(config)
+
+extension_search = ExtensionSearchSystem(config, backend=TrigramSearchBackend())
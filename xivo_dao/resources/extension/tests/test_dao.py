@@ -103,6 +103,14 @@ class TestSearchGivenMultipleExtensions(TestExtension):
 
         self.assert_search_returns_result(expected, skip=1)
 
+    def test_when_paginating_after_a_token_then_returns_the_following_items(self):
+        first_page = extension_dao.search(order='exten', context='inside', limit=3, after='')
+        second_page = extension_dao.search(order='exten', context='inside', limit=3, after=first_page.next)
+
+        assert_that(first_page, equal_to(SearchResult(4, [self.extension1, self.extension2, self.extension3])))
+        assert_that(second_page, equal_to(SearchResult(4, [self.extension4])))
+        assert_that(second_page.next, equal_to(None))
+
     def test_when_doing_a_paginated_search_then_returns_a_paginated_result(self):
         expected = SearchResult(3, [self.extension2])
 
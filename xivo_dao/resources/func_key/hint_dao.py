@@ -52,19 +52,43 @@ def _find_extenfeatures(session, typeval):
             .scalar())
 
 
-def _common_filter(query, context):
+def _find_all_extenfeatures(session):
+    query = (session.query(Extension.typeval, Extension.exten)
+             .filter(Extension.context == 'xivo-features')
+             .filter(Extension.type == 'extenfeatures'))
+    return dict(query.all())
+
+
+def _common_join(query):
     user_extension = aliased(Extension)
 
-    return (query.join(UserFeatures,
-                       FuncKeyMapping.template_id == UserFeatures.func_key_private_template_id)
-            .join(UserLine,
-                  UserFeatures.id == UserLine.user_id)
-            .join(user_extension,
-                  UserLine.extension_id == user_extension.id)
-            .filter(user_extension.context == context)
-            .filter(UserLine.main_user == True)
-            .filter(UserLine.main_line == True)
-            .filter(FuncKeyMapping.blf == True))
+    query = (query.join(UserFeatures,
+                        FuncKeyMapping.template_id == UserFeatures.func_key_private_template_id)
+             .join(UserLine,
+                   UserFeatures.id == UserLine.user_id)
+             .join(user_extension,
+                   UserLine.extension_id == user_extension.id)
+             .filter(UserLine.main_user == True)
+             .filter(UserLine.main_line == True)
+             .filter(FuncKeyMapping.blf == True)
+             .add_columns(user_extension.context.label('context')))
+
+    return query, user_extension.context
+
+
+def _hints(query_and_context, context, to_hint):
+    query, context_column = query_and_context
+    return tuple(to_hint(row) for row in query.filter(context_column == context))
+
+
+def _hints_by_context(query_and_context, to_hint, contexts=None):
+    query, context_column = query_and_context
+    if contexts is not None:
+        query = query.filter(context_column.in_(contexts))
+    hints = {}
+    for row in query:
+        hints.setdefault(row.context, []).append(to_hint(row))
+    return dict((context, tuple(context_hints)) for context, context_hints in hints.iteritems())
 
 
 @daosession
@@ -81,13 +105,23 @@ def calluser_extension(session):
 
 @daosession
 def user_hints(session, context):
+    return _hints(_user_hints_query(session), context, _user_hint)
+
+
+@daosession
+def all_user_hints(session, contexts=None):
+    return _hints_by_context(_user_hints_query(session), _user_hint, contexts)
+
+
+def _user_hints_query(session):
     query = (session.query(UserFeatures.id.label('user_id'),
                            Extension.exten.label('extension'),
                            sql.case([
                                (LineFeatures.protocol == 'sip', literal_column("'SIP/'") + UserSIP.name),
                                (LineFeatures.protocol == 'sccp', literal_column("'SCCP/'") + SCCPLine.name),
                                (LineFeatures.protocol == 'custom', UserCustom.interface)
-                           ]).label('argument'))
+                           ]).label('argument'),
+                           Extension.context.label('context'))
              .join(UserLine.userfeatures)
              .join(UserLine.linefeatures)
              .outerjoin(UserSIP,
@@ -108,35 +142,58 @@ def user_hints(session, context):
              .filter(UserLine.main_user == True)
              .filter(UserLine.main_line == True)
              .filter(LineFeatures.commented == 0)
-             .filter(Extension.context == context)
              .filter(UserFeatures.enablehint == 1))
 
-    return tuple(Hint(user_id=row.user_id,
-                      extension=row.extension,
-                      argument=row.argument)
-                 for row in query)
+    return query, Extension.context
+
+
+def _user_hint(row):
+    return Hint(user_id=row.user_id,
+                extension=row.extension,
+                argument=row.argument)
 
 
 @daosession
 def conference_hints(session, context):
-    query = (session.query(MeetmeFeatures.confno.label('extension'))
+    return _hints(_conference_hints_query(session), context, _conference_hint)
+
+
+@daosession
+def all_conference_hints(session, contexts=None):
+    return _hints_by_context(_conference_hints_query(session), _conference_hint, contexts)
+
+
+def _conference_hints_query(session):
+    query = (session.query(MeetmeFeatures.confno.label('extension'),
+                           Extension.context.label('context'))
              .join(FuncKeyDestConference,
                    FuncKeyDestConference.conference_id == MeetmeFeatures.id)
              .join(Extension,
                    sql.and_(
                        Extension.type == 'meetme',
                        Extension.typeval == sql.cast(MeetmeFeatures.id, Unicode)))
-             .filter(MeetmeFeatures.commented == 0)
-             .filter(Extension.context == context))
+             .filter(MeetmeFeatures.commented == 0))
 
-    return tuple(Hint(user_id=None,
-                      extension=row.extension,
-                      argument=None)
-                 for row in query)
+    return query, Extension.context
+
+
+def _conference_hint(row):
+    return Hint(user_id=None,
+                extension=row.extension,
+                argument=None)
 
 
 @daosession
 def service_hints(session, context):
+    return _hints(_service_hints_query(session), context, _service_hint)
+
+
+@daosession
+def all_service_hints(session, contexts=None):
+    return _hints_by_context(_service_hints_query(session), _service_hint, contexts)
+
+
+def _service_hints_query(session):
     query = (session.query(Extension.exten.label('extension'),
                            UserFeatures.id.label('user_id'))
              .join(FuncKeyDestService,
@@ -144,16 +201,26 @@ def service_hints(session, context):
              .join(FuncKeyMapping,
                    FuncKeyDestService.func_key_id == FuncKeyMapping.func_key_id)
              .filter(Extension.commented == 0))
-    query = _common_filter(query, context)
+    return _common_join(query)
 
-    return tuple(Hint(user_id=row.user_id,
-                      extension=row.extension,
-                      argument=None)
-                 for row in query)
+
+def _service_hint(row):
+    return Hint(user_id=row.user_id,
+                extension=row.extension,
+                argument=None)
 
 
 @daosession
 def forward_hints(session, context):
+    return _hints(_forward_hints_query(session), context, _forward_hint)
+
+
+@daosession
+def all_forward_hints(session, contexts=None):
+    return _hints_by_context(_forward_hints_query(session), _forward_hint, contexts)
+
+
+def _forward_hints_query(session):
     query = (session.query(Extension.exten.label('extension'),
                            UserFeatures.id.label('user_id'),
                            FuncKeyDestForward.number.label('argument'))
@@ -162,16 +229,26 @@ def forward_hints(session, context):
              .join(FuncKeyMapping,
                    FuncKeyDestForward.func_key_id == FuncKeyMapping.func_key_id)
              .filter(Extension.commented == 0))
-    query = _common_filter(query, context)
+    return _common_join(query)
+
 
-    return tuple(Hint(user_id=row.user_id,
-                      extension=clean_extension(row.extension),
-                      argument=row.argument)
-                 for row in query)
+def _forward_hint(row):
+    return Hint(user_id=row.user_id,
+                extension=clean_extension(row.extension),
+                argument=row.argument)
 
 
 @daosession
 def agent_hints(session, context):
+    return _hints(_agent_hints_query(session), context, _agent_hint)
+
+
+@daosession
+def all_agent_hints(session, contexts=None):
+    return _hints_by_context(_agent_hints_query(session), _agent_hint, contexts)
+
+
+def _agent_hints_query(session):
     query = (session.query(sql.cast(FuncKeyDestAgent.agent_id, Unicode).label('argument'),
                            UserFeatures.id.label('user_id'),
                            Extension.exten.label('extension'))
@@ -180,32 +257,55 @@ def agent_hints(session, context):
              .join(FuncKeyMapping,
                    FuncKeyDestAgent.func_key_id == FuncKeyMapping.func_key_id)
              .filter(Extension.commented == 0))
-    query = _common_filter(query, context)
+    return _common_join(query)
+
 
-    return tuple(Hint(user_id=row.user_id,
-                      extension=clean_extension(row.extension),
-                      argument=row.argument)
-                 for row in query)
+def _agent_hint(row):
+    return Hint(user_id=row.user_id,
+                extension=clean_extension(row.extension),
+                argument=row.argument)
 
 
 @daosession
 def custom_hints(session, context):
+    return _hints(_custom_hints_query(session), context, _custom_hint)
+
+
+@daosession
+def all_custom_hints(session, contexts=None):
+    return _hints_by_context(_custom_hints_query(session), _custom_hint, contexts)
+
+
+def _custom_hints_query(session):
     query = (session.query(FuncKeyDestCustom.exten.label('extension'))
              .join(FuncKeyMapping,
                    FuncKeyDestCustom.func_key_id == FuncKeyMapping.func_key_id))
-    query = _common_filter(query, context)
+    return _common_join(query)
 
-    return tuple(Hint(user_id=None,
-                      extension=row.extension,
-                      argument=None)
-                 for row in query)
+
+def _custom_hint(row):
+    return Hint(user_id=None,
+                extension=row.extension,
+                argument=None)
 
 
 @daosession
 def bsfilter_hints(session, context):
     bsfilter_extension = clean_extension(_find_extenfeatures(session, 'bsfilter'))
+    return _hints(_bsfilter_hints_query(session), context, _bsfilter_hint(bsfilter_extension))
+
+
+@daosession
+def all_bsfilter_hints(session, contexts=None, extenfeatures=None):
+    if extenfeatures is None:
+        extenfeatures = _find_all_extenfeatures(session)
+    bsfilter_extension = clean_extension(extenfeatures.get('bsfilter'))
+    return _hints_by_context(_bsfilter_hints_query(session), _bsfilter_hint(bsfilter_extension), contexts)
+
 
-    query = (session.query(sql.cast(FuncKeyDestBSFilter.filtermember_id, Unicode).label('argument'))
+def _bsfilter_hints_query(session):
+    query = (session.query(sql.cast(FuncKeyDestBSFilter.filtermember_id, Unicode).label('argument'),
+                           Extension.context.label('context'))
              .join(Callfiltermember,
                    Callfiltermember.id == FuncKeyDestBSFilter.filtermember_id)
              .join(Callfilter,
@@ -219,10 +319,41 @@ def bsfilter_hints(session, context):
              .filter(UserLine.main_user == True)
              .filter(UserLine.main_line == True)
              .filter(Extension.commented == 0)
-             .filter(Callfilter.commented == 0)
-             .filter(Extension.context == context))
+             .filter(Callfilter.commented == 0))
+
+    return query, Extension.context
+
 
-    return tuple(Hint(user_id=None,
-                      extension=bsfilter_extension,
-                      argument=row.argument)
-                 for row in query)
+def _bsfilter_hint(bsfilter_extension):
+    def to_hint(row):
+        return Hint(user_id=None,
+                    extension=bsfilter_extension,
+                    argument=row.argument)
+    return to_hint
+
+
+@daosession
+def all_hints(session, contexts=None):
+    """
+    Returns the hints of every context, or only of the given contexts, by
+    context and by hint type, with one query per hint type.
+    """
+    if contexts is not None and not contexts:
+        return {}
+
+    extenfeatures = _find_all_extenfeatures(session)
+    hints_by_type = {
+        'user': all_user_hints(contexts),
+        'conference': all_conference_hints(contexts),
+        'service': all_service_hints(contexts),
+        'forward': all_forward_hints(contexts),
+        'agent': all_agent_hints(contexts),
+        'custom': all_custom_hints(contexts),
+        'bsfilter': all_bsfilter_hints(contexts, extenfeatures),
+    }
+
+    hints = {}
+    for hint_type, hints_by_context in hints_by_type.iteritems():
+        for context, context_hints in hints_by_context.iteritems():
+            hints.setdefault(context, {})[hint_type] = context_hints
+    return hints
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from collections import namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.orm.attributes import get_history
+
+from xivo_dao.alchemy.callfiltermember import Callfiltermember
+from xivo_dao.alchemy.extension import Extension
+from xivo_dao.alchemy.func_key_dest_agent import FuncKeyDestAgent
+from xivo_dao.alchemy.func_key_dest_bsfilter import FuncKeyDestBSFilter
+from xivo_dao.alchemy.func_key_dest_conference import FuncKeyDestConference
+from xivo_dao.alchemy.func_key_dest_custom import FuncKeyDestCustom
+from xivo_dao.alchemy.func_key_dest_forward import FuncKeyDestForward
+from xivo_dao.alchemy.func_key_dest_service import FuncKeyDestService
+from xivo_dao.alchemy.func_key_dest_user import FuncKeyDestUser
+from xivo_dao.alchemy.func_key_mapping import FuncKeyMapping
+from xivo_dao.alchemy.linefeatures import LineFeatures
+from xivo_dao.alchemy.meetmefeatures import MeetmeFeatures
+from xivo_dao.alchemy.sccpline import SCCPLine
+from xivo_dao.alchemy.user_line import UserLine
+from xivo_dao.alchemy.usercustom import UserCustom
+from xivo_dao.alchemy.userfeatures import UserFeatures
+from xivo_dao.alchemy.usersip import UserSIP
+from xivo_dao.helpers.db_manager import daosession
+from xivo_dao.resources.func_key import hint_dao
+
+HintDiff = namedtuple('HintDiff', ['added', 'removed', 'changed'])
+
+_TRACKED_MODELS = (Extension,
+                   FuncKeyDestAgent,
+                   FuncKeyDestBSFilter,
+                   FuncKeyDestConference,
+                   FuncKeyDestCustom,
+                   FuncKeyDestForward,
+                   FuncKeyDestService,
+                   FuncKeyDestUser,
+                   FuncKeyMapping,
+                   LineFeatures,
+                   MeetmeFeatures,
+                   SCCPLine,
+                   UserCustom,
+                   UserFeatures,
+                   UserLine,
+                   UserSIP)
+
+_FEATURES_CONTEXT = 'xivo-features'
+
+_FUNC_KEY_DESTINATIONS = (FuncKeyDestAgent,
+                          FuncKeyDestCustom,
+                          FuncKeyDestForward,
+                          FuncKeyDestService)
+
+_LINE_PROTOCOLS = ((UserSIP, 'sip'),
+                   (SCCPLine, 'sccp'),
+                   (UserCustom, 'custom'))
+
+
+class HintEngine(object):
+    """
+    Keeps the last computed hints of each context and recomputes only the
+    contexts touched by the flushed changes.
+
+    The diffs are lists of (context, hint_type, hint) tuples, user hints
+    whose argument changed being reported in changed.
+    """
+
+    def __init__(self):
+        self._hints = {}
+        self._changes = _Changes()
+
+    def watch(self, target):
+        event.listen(target, 'after_flush', self._collect_flushed)
+        event.listen(target, 'after_bulk_update', self._collect_bulk)
+        event.listen(target, 'after_bulk_delete', self._collect_bulk)
+
+    def hints(self, context):
+        return self._hints.get(context, {})
+
+    def touch(self, contexts=(), user_ids=(), template_ids=()):
+        self._changes.contexts.update(contexts)
+        self._changes.user_ids.update(user_ids)
+        self._changes.template_ids.update(template_ids)
+
+    def reload(self):
+        self._changes = _Changes()
+        hints = hint_dao.all_hints()
+        return self._apply(hints, set(self._hints) | set(hints))
+
+    def refresh(self):
+        changes, self._changes = self._changes, _Changes()
+        if changes.everything:
+            return self.reload()
+
+        contexts = _affected_contexts(changes)
+        return self._apply(hint_dao.all_hints(contexts), contexts)
+
+    def _apply(self, hints, contexts):
+        diff = HintDiff([], [], [])
+        for context in contexts:
+            old = _hints_by_key(context, self._hints.get(context, {}))
+            new = _hints_by_key(context, hints.get(context, {}))
+            for key, hint in new.iteritems():
+                if key not in old:
+                    diff.added.append((context, key[1], hint))
+                elif old[key] != hint:
+                    diff.changed.append((context, key[1], hint))
+            for key, hint in old.iteritems():
+                if key not in new:
+                    diff.removed.append((context, key[1], hint))
+
+            if context in hints:
+                self._hints[context] = hints[context]
+            else:
+                self._hints.pop(context, None)
+        return diff
+
+    def _collect_flushed(self, session, flush_context):
+        for obj in session.new:
+            self._changes.add(obj)
+        for obj in session.dirty:
+            self._changes.add(obj, include_history=True)
+        for obj in session.deleted:
+            self._changes.add(obj, include_history=True)
+
+    def _collect_bulk(self, session, query, query_context, result):
+        for description in query.column_descriptions:
+            if description['type'] in _TRACKED_MODELS:
+                self._changes.everything = True
+
+
+class _Changes(object):
+
+    def __init__(self):
+        self.everything = False
+        self.contexts = set()
+        self.extension_ids = set()
+        self.user_ids = set()
+        self.template_ids = set()
+        self.line_ids = set()
+        self.protocol_ids = {}
+        self.func_key_ids = set()
+        self.filtermember_ids = set()
+        self.conference_ids = set()
+
+    def add(self, obj, include_history=False):
+        if isinstance(obj, Extension):
+            contexts = _values(obj, 'context', include_history)
+            if _FEATURES_CONTEXT in contexts:
+                # feature extensions are used by the func keys of every context
+                self.everything = True
+            self.contexts.update(contexts)
+        elif isinstance(obj, UserLine):
+            self.user_ids.update(_values(obj, 'user_id', include_history))
+            self.extension_ids.update(_values(obj, 'extension_id', include_history))
+        elif isinstance(obj, UserFeatures):
+            self.user_ids.add(obj.id)
+        elif isinstance(obj, LineFeatures):
+            self.line_ids.add(obj.id)
+        elif isinstance(obj, FuncKeyMapping):
+            self.template_ids.update(_values(obj, 'template_id', include_history))
+        elif isinstance(obj, FuncKeyDestUser):
+            self.user_ids.update(_values(obj, 'user_id', include_history))
+        elif isinstance(obj, _FUNC_KEY_DESTINATIONS):
+            self.func_key_ids.update(_values(obj, 'func_key_id', include_history))
+        elif isinstance(obj, FuncKeyDestBSFilter):
+            self.filtermember_ids.update(_values(obj, 'filtermember_id', include_history))
+        elif isinstance(obj, FuncKeyDestConference):
+            self.conference_ids.update(_values(obj, 'conference_id', include_history))
+        elif isinstance(obj, MeetmeFeatures):
+            self.conference_ids.add(obj.id)
+        else:
+            for model, protocol in _LINE_PROTOCOLS:
+                if isinstance(obj, model):
+                    self.protocol_ids.setdefault(protocol, set()).add(obj.id)
+
+
+def _values(obj, attribute, include_history):
+    values = set([getattr(obj, attribute)])
+    if include_history:
+        values.update(get_history(obj, attribute).deleted or ())
+    values.discard(None)
+    return values
+
+
+@daosession
+def _affected_contexts(session, changes):
+    contexts = set(changes.contexts)
+    user_ids = set(changes.user_ids)
+    template_ids = set(changes.template_ids)
+    line_ids = set(changes.line_ids)
+
+    for protocol, protocol_ids in changes.protocol_ids.iteritems():
+        query = (session.query(LineFeatures.id)
+                 .filter(LineFeatures.protocol == protocol)
+                 .filter(LineFeatures.protocolid.in_(protocol_ids)))
+        line_ids.update(row.id for row in query)
+
+    if changes.func_key_ids:
+        query = (session.query(FuncKeyMapping.template_id)
+                 .filter(FuncKeyMapping.func_key_id.in_(changes.func_key_ids)))
+        template_ids.update(row.template_id for row in query)
+
+    if changes.filtermember_ids:
+        query = (session.query(Callfiltermember.typeval)
+                 .filter(Callfiltermember.id.in_(changes.filtermember_ids))
+                 .filter(Callfiltermember.type == 'user'))
+        user_ids.update(int(row.typeval) for row in query)
+
+    if changes.conference_ids:
+        query = (session.query(Extension.context)
+                 .filter(Extension.type == 'meetme')
+                 .filter(Extension.typeval.in_([unicode(conference_id)
+                                                for conference_id in changes.conference_ids])))
+        contexts.update(row.context for row in query)
+
+    if changes.extension_ids:
+        query = (session.query(Extension.context)
+                 .filter(Extension.id.in_(changes.extension_ids)))
+        contexts.update(row.context for row in query)
+
+    if line_ids:
+        query = (session.query(Extension.context)
+                 .join(UserLine, UserLine.extension_id == Extension.id)
+                 .filter(UserLine.line_id.in_(line_ids)))
+        contexts.update(row.context for row in query)
+
+    if user_ids or template_ids:
+        query = (session.query(Extension.context)
+                 .join(UserLine, UserLine.extension_id == Extension.id)
+                 .join(UserFeatures, UserFeatures.id == UserLine.user_id))
+        if user_ids and template_ids:
+            query = query.filter(UserFeatures.id.in_(user_ids) |
+                                 UserFeatures.func_key_private_template_id.in_(template_ids))
+        elif user_ids:
+            query = query.filter(UserFeatures.id.in_(user_ids))
+        else:
+            query = query.filter(UserFeatures.func_key_private_template_id.in_(template_ids))
+        contexts.update(row.context for row in query)
+
+    return contexts
+
+
+def _hints_by_key(context, hints_by_type):
+    hints = {}
+    for hint_type, type_hints in hints_by_type.iteritems():
+        for hint in type_hints:
+            if hint_type == 'user':
+                key = (context, hint_type, hint.user_id, hint.extension)
+            else:
+                key = (context, hint_type, hint)
+            hints[key] = hint
+    return hints
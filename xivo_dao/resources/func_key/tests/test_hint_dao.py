@@ -15,7 +15,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-from hamcrest import assert_that, equal_to, contains
+from hamcrest import assert_that, equal_to, contains, has_property
+from mock import ANY
 from xivo_dao.tests.test_dao import DAOTestCase
 
 from xivo_dao.alchemy.callfilter import Callfilter
@@ -395,3 +396,41 @@ class TestBSFilterHints(TestHints):
         self.create_boss_and_secretary()
 
         assert_that(hint_dao.bsfilter_hints('othercontext'), contains())
+
+
+class TestAllHints(TestHints):
+
+    def test_given_users_in_two_contexts_then_hints_are_grouped_by_context(self):
+        user_row = self.add_user_and_func_key(exten='1000')
+        self.context = 'othercontext'
+        other_user_row = self.add_user_and_func_key(exten='2000')
+
+        result = hint_dao.all_user_hints()
+
+        assert_that(result, equal_to({
+            'mycontext': (Hint(user_id=user_row.id, extension='1000', argument=ANY),),
+            'othercontext': (Hint(user_id=other_user_row.id, extension='2000', argument=ANY),),
+        }))
+
+    def test_given_service_func_key_then_all_hints_returns_it_by_context_and_type(self):
+        destination_row = self.create_service_func_key('*25', 'enablednd')
+        user_row = self.add_user_and_func_key()
+        self.add_func_key_to_user(destination_row, user_row)
+
+        result = hint_dao.all_hints()
+
+        assert_that(result['mycontext']['service'],
+                    contains(Hint(user_id=user_row.id, extension='*25', argument=None)))
+        assert_that(result['mycontext']['user'], contains(has_property('user_id', user_row.id)))
+
+    def test_all_hints_match_hints_by_context(self):
+        self.add_extension(context='xivo-features', exten='_*37.', type='extenfeatures', typeval='bsfilter')
+        user_row = self.add_user_and_func_key(exten='1000')
+        self.add_func_key_to_user(self.create_forward_func_key('_*23.', 'fwdbusy', '1234'), user_row)
+        self.add_func_key_to_user(self.create_service_func_key('*25', 'enablednd'), user_row, position=2)
+
+        result = hint_dao.all_hints()
+
+        assert_that(result['mycontext']['user'], equal_to(hint_dao.user_hints(self.context)))
+        assert_that(result['mycontext']['forward'], equal_to(hint_dao.forward_hints(self.context)))
+        assert_that(result['mycontext']['service'], equal_to(hint_dao.service_hints(self.context)))
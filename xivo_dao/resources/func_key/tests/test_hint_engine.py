@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from hamcrest import assert_that, contains, empty, equal_to, is_not
+from mock import patch
+
+from xivo_dao.alchemy.extension import Extension
+from xivo_dao.alchemy.linefeatures import LineFeatures
+from xivo_dao.alchemy.usersip import UserSIP
+from xivo_dao.resources.func_key import hint_dao
+from xivo_dao.resources.func_key.hint_engine import HintDiff, HintEngine
+from xivo_dao.resources.func_key.model import Hint
+from xivo_dao.resources.func_key.tests.test_hint_dao import TestHints
+
+
+class TestHintEngine(TestHints):
+
+    def setUp(self):
+        super(TestHintEngine, self).setUp()
+        self.engine = HintEngine()
+        self.engine.watch(self.session())
+
+    def test_reload_returns_every_hint_as_added(self):
+        user_row = self.add_sip_user('1000')
+
+        diff = self.engine.reload()
+
+        expected = Hint(user_id=user_row.id, extension='1000', argument='SIP/sip1000')
+        assert_that(diff, equal_to(HintDiff(added=[('mycontext', 'user', expected)], removed=[], changed=[])))
+        assert_that(self.engine.hints('mycontext')['user'], contains(expected))
+
+    def test_refresh_without_changes_returns_empty_diff(self):
+        self.add_sip_user('1000')
+        self.engine.reload()
+
+        diff = self.engine.refresh()
+
+        assert_that(diff, equal_to(HintDiff([], [], [])))
+
+    def test_refresh_only_queries_the_contexts_of_new_users(self):
+        self.add_sip_user('1000')
+        self.engine.reload()
+        self.context = 'othercontext'
+
+        user_row = self.add_sip_user('2000')
+
+        with patch.object(hint_dao, 'all_hints', wraps=hint_dao.all_hints) as all_hints:
+            diff = self.engine.refresh()
+
+        all_hints.assert_called_once_with(set(['othercontext']))
+        expected = Hint(user_id=user_row.id, extension='2000', argument='SIP/sip2000')
+        assert_that(diff.added, contains(('othercontext', 'user', expected)))
+        assert_that(self.engine.hints('mycontext')['user'], is_not(empty()))
+
+    def test_refresh_when_extension_moves_to_another_context(self):
+        user_row = self.add_sip_user('1000')
+        self.engine.reload()
+
+        extension = self.session.query(Extension).filter(Extension.exten == '1000').one()
+        extension.context = 'othercontext'
+        self.session.flush()
+
+        diff = self.engine.refresh()
+
+        hint = Hint(user_id=user_row.id, extension='1000', argument='SIP/sip1000')
+        assert_that(diff.removed, contains(('mycontext', 'user', hint)))
+        assert_that(diff.added, contains(('othercontext', 'user', hint)))
+
+    def test_refresh_when_extension_number_changes(self):
+        user_row = self.add_sip_user('1000')
+        self.engine.reload()
+
+        extension = self.session.query(Extension).filter(Extension.exten == '1000').one()
+        extension.exten = '1001'
+        self.session.flush()
+
+        diff = self.engine.refresh()
+
+        assert_that(diff.removed, contains(('mycontext', 'user', Hint(user_row.id, '1000', 'SIP/sip1000'))))
+        assert_that(diff.added, contains(('mycontext', 'user', Hint(user_row.id, '1001', 'SIP/sip1000'))))
+
+    def test_refresh_when_func_key_is_added_to_user(self):
+        user_row = self.add_sip_user('1000')
+        self.engine.reload()
+
+        self.add_func_key_to_user(self.create_service_func_key('*25', 'enablednd'), user_row, position=2)
+
+        diff = self.engine.refresh()
+
+        assert_that(diff.added, contains(('mycontext', 'service', Hint(user_row.id, '*25', None))))
+        assert_that(diff.removed, empty())
+
+    def test_refresh_after_bulk_update_reloads_every_context(self):
+        user_row = self.add_sip_user('1000')
+        self.engine.reload()
+
+        (self.session.query(Extension)
+         .filter(Extension.exten == '1000')
+         .update({'exten': '1001'}, synchronize_session=False))
+
+        with patch.object(hint_dao, 'all_hints', wraps=hint_dao.all_hints) as all_hints:
+            diff = self.engine.refresh()
+
+        all_hints.assert_called_once_with()
+        assert_that(diff.removed, contains(('mycontext', 'user', Hint(user_row.id, '1000', 'SIP/sip1000'))))
+        assert_that(diff.added, contains(('mycontext', 'user', Hint(user_row.id, '1001', 'SIP/sip1000'))))
+
+    def test_touch_forces_the_context_to_be_recomputed(self):
+        self.engine.reload()
+        user_row = self.add_sip_user('1000')
+        self.engine = HintEngine()
+        self.engine.touch(contexts=['mycontext'])
+
+        diff = self.engine.refresh()
+
+        assert_that(diff.added, contains(('mycontext', 'user', Hint(user_row.id, '1000', 'SIP/sip1000'))))
+
+    def test_refresh_when_sip_line_name_changes(self):
+        user_row = self.add_sip_user('1000')
+        self.engine.reload()
+
+        usersip_row = self.session.query(UserSIP).filter(UserSIP.name == 'sip1000').one()
+        usersip_row.name = 'renamed'
+        self.session.flush()
+
+        diff = self.engine.refresh()
+
+        assert_that(diff.changed, contains(('mycontext', 'user', Hint(user_row.id, '1000', 'SIP/renamed'))))
+
+    def test_refresh_when_user_disables_hints(self):
+        user_row = self.add_sip_user('1000')
+        self.engine.reload()
+
+        user_row.enablehint = 0
+        self.session.flush()
+
+        diff = self.engine.refresh()
+
+        assert_that(diff.removed, contains(('mycontext', 'user', Hint(user_row.id, '1000', 'SIP/sip1000'))))
+
+    def test_refresh_when_line_is_commented(self):
+        user_row = self.add_sip_user('1000')
+        self.engine.reload()
+
+        line_row = self.session.query(LineFeatures).filter(LineFeatures.context == 'mycontext').one()
+        line_row.commented = 1
+        self.session.flush()
+
+        diff = self.engine.refresh()
+
+        assert_that(diff.removed, contains(('mycontext', 'user', Hint(user_row.id, '1000', 'SIP/sip1000'))))
+
+    def test_refresh_when_conference_number_changes(self):
+        conference_row = self.add_meetmefeatures(confno='1234')
+        self.add_extension(context='mycontext', exten='1234', type='meetme', typeval=str(conference_row.id))
+        self.add_conference_destination(conference_row.id)
+        self.engine.reload()
+
+        conference_row.confno = '4321'
+        self.session.flush()
+
+        diff = self.engine.refresh()
+
+        assert_that(diff.added, contains(('mycontext', 'conference', Hint(None, '4321', None))))
+
+    def test_refresh_when_forward_number_changes(self):
+        destination_row = self.create_forward_func_key('_*23.', 'fwdbusy', '1234')
+        user_row = self.add_user_and_func_key()
+        self.add_func_key_to_user(destination_row, user_row)
+        self.engine.reload()
+
+        destination_row.number = '5678'
+        self.session.flush()
+
+        diff = self.engine.refresh()
+
+        assert_that(diff.removed, contains(('mycontext', 'forward', Hint(user_row.id, '*23', '1234'))))
+        assert_that(diff.added, contains(('mycontext', 'forward', Hint(user_row.id, '*23', '5678'))))
+
+    def test_refresh_when_feature_extension_changes_reloads_every_context(self):
+        user_row = self.add_user_and_func_key()
+        self.add_func_key_to_user(self.create_service_func_key('*25', 'enablednd'), user_row, position=2)
+        self.engine.reload()
+
+        extension = self.session.query(Extension).filter(Extension.exten == '*25').one()
+        extension.exten = '*26'
+        self.session.flush()
+
+        with patch.object(hint_dao, 'all_hints', wraps=hint_dao.all_hints) as all_hints:
+            diff = self.engine.refresh()
+
+        all_hints.assert_called_once_with()
+        assert_that(diff.added, contains(('mycontext', 'service', Hint(user_row.id, '*26', None))))
+
+    def add_sip_user(self, exten):
+        usersip_row = self.add_usersip(name='sip{}'.format(exten))
+        return self.add_user_and_func_key('sip', usersip_row.id, exten)
@@ -30,10 +30,10 @@ def search(session, **parameters):
     persistor = build_persistor(session)
 
     query = session.query(FuncKeyTemplateSchema.id)
-    rows, total = template_search.search_from_query(query, parameters)
+    page = template_search.search_from_query(query, parameters)
 
-    items = [persistor.get(row.id) for row in rows]
-    return SearchResult(total=total, items=items)
+    items = [persistor.get(row.id) for row in page.items]
+    return SearchResult(total=page.total, items=items, next=page.next)
 
 
 @daosession
@@ -35,8 +35,8 @@ class LinePersistor(object):
         self.session = session
 
     def search(self, params):
-        rows, total = line_search.search_from_query(self.query(), params)
-        return SearchResult(total, rows)
+        page = line_search.search_from_query(self.query(), params)
+        return SearchResult(page.total, page.items, page.next)
 
     def get(self, line_id):
         line = self.find(line_id)
@@ -66,9 +66,9 @@ class UserPersistor(object):
     def search(self, parameters):
         view = self.user_view.select(parameters.get('view'))
         query = view.query(self.session)
-        rows, total = self.user_search.search_from_query(query, parameters)
-        users = view.convert_list(rows)
-        return SearchResult(total, users)
+        page = self.user_search.search_from_query(query, parameters)
+        users = view.convert_list(page.items)
+        return SearchResult(page.total, users, page.next)
 
     def create(self, user):
         self.prepare_template(user)
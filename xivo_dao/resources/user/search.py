@@ -24,6 +24,8 @@ from xivo_dao.alchemy.user_line import UserLine
 from xivo_dao.alchemy.extension import Extension
 from xivo_dao.resources.utils.search import SearchSystem
 from xivo_dao.resources.utils.search import SearchConfig
+from xivo_dao.resources.utils.search_backend import TrigramSearchBackend
+from xivo_dao.resources.utils.search_backend import register_indexes
 
 
 config = SearchConfig(table=UserFeatures,
@@ -75,4 +77,6 @@ class UserSearchSystem(SearchSystem):
                                 Voicemail.commented == 0)))
 
 
-user_search = UserSearchSystem(config)
+register_indexes(config)
+
+user_search = UserSearchSystem(config, backend=TrigramSearchBackend())
@@ -15,30 +15,71 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
+import base64
+import json
+
 from collections import namedtuple
 
 import sqlalchemy as sa
 from sqlalchemy import sql
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from sqlalchemy.util import KeyedTuple
 
 from xivo_dao.helpers import errors
+from xivo_dao.resources.utils.search_backend import ILikeSearchBackend
+
+
+class SearchResult(namedtuple('SearchResult', ['total', 'items'])):
+    '''
+    next is the token of the following page when paginating with the after
+    parameter. It is kept out of the tuple so that results still unpack
+    as (total, items).
+    '''
+
+    def __new__(cls, total, items, next=None):
+        result = super(SearchResult, cls).__new__(cls, total, items)
+        result.next = next
+        return result
+
+
+class SearchPage(namedtuple('SearchPage', ['items', 'total'])):
+
+    def __new__(cls, items, total, next=None):
+        page = super(SearchPage, cls).__new__(cls, items, total)
+        page.next = next
+        return page
 
-SearchResult = namedtuple('SearchResult', ['total', 'items'])
+
+COUNT_EXACT = 'exact'
+COUNT_WINDOW = 'window'
+COUNT_ESTIMATE = 'estimate'
 
 
 class SearchConfig(object):
 
-    def __init__(self, table, columns, default_sort, search=None, sort=None):
+    def __init__(self, table, columns, default_sort, search=None, sort=None, key=None):
         self.table = table
         self._columns = columns
         self._default_sort = default_sort
         self._search = search
         self._sort = sort
+        self._key = key
+
+    def key_column(self):
+        if self._key is not None:
+            return self._key
+        return sa.inspect(self.table).primary_key[0]
 
     def all_search_columns(self):
         if self._search:
             return [self._columns[s] for s in self._search]
         return self._columns.values()
 
+    def search_columns(self):
+        names = self._search or self._columns.keys()
+        return dict((name, self._columns[name]) for name in names)
+
     def column_for_searching(self, column_name):
         return self._columns.get(column_name)
 
@@ -55,6 +96,9 @@ class SearchConfig(object):
 
         return name
 
+    def sort_column_name(self, name=None):
+        return self._get_sort_column_name(name)
+
 
 class SearchSystem(object):
 
@@ -68,11 +112,14 @@ class SearchSystem(object):
         'order': None,
         'direction': 'asc',
         'limit': None,
-        'offset': 0
+        'offset': 0,
+        'after': None,
     }
 
-    def __init__(self, config):
+    def __init__(self, config, count_mode=COUNT_WINDOW, backend=None):
         self.config = config
+        self.count_mode = count_mode
+        self.backend = backend or ILikeSearchBackend()
 
     def search(self, session, parameters=None):
         query = session.query(self.config.table)
@@ -84,10 +131,125 @@ class SearchSystem(object):
 
         query = self._filter(query, parameters['search'])
         query = self._filter_exact_match(query, parameters)
+
+        if parameters['after'] is not None:
+            return self._seek(query, parameters)
+
         sorted_query = self._sort(query, parameters['order'], parameters['direction'])
         paginated_query = self._paginate(sorted_query, parameters['limit'], parameters['offset'])
 
-        return paginated_query.all(), sorted_query.count()
+        if self.count_mode == COUNT_EXACT:
+            return SearchPage(paginated_query.all(), sorted_query.count())
+
+        rows, extras = self._fetch(paginated_query, self._window_count())
+        total = extras[0][0] if extras else 0
+        if not rows and parameters['offset'] > 0:
+            total = sorted_query.count()
+
+        if self.count_mode == COUNT_ESTIMATE:
+            total = self._estimate_total(sorted_query, total, parameters['offset'] + len(rows))
+
+        return SearchPage(rows, total)
+
+    def _seek(self, query, parameters):
+        order = self.config.sort_column_name(parameters['order'])
+        direction = parameters['direction']
+        limit = parameters['limit']
+        column = self.config.column_for_sorting(order)
+        key = self.config.key_column()
+
+        columns = [column.label('seek_value'), key.label('seek_key')]
+        if parameters['after']:
+            value, key_value, total = self._decode_token(parameters['after'], order, direction)
+            query = query.filter(self._seek_criteria(column, key, direction, value, key_value))
+        elif self.count_mode == COUNT_EXACT:
+            total = query.count()
+        else:
+            columns.append(self._window_count())
+            total = None
+
+        sort = self.SORT_DIRECTIONS[direction]
+        seek_query = query.order_by(sort(column), sort(key))
+        if limit:
+            seek_query = seek_query.limit(limit + 1)
+
+        rows, extras = self._fetch(seek_query, *columns)
+        if total is None:
+            total = extras[0][2] if extras else 0
+            if self.count_mode == COUNT_ESTIMATE:
+                total = self._estimate_total(query, total, len(rows))
+
+        next_token = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            value, key_value = extras[limit - 1][:2]
+            next_token = self._encode_token(order, direction, value, key_value, total)
+
+        return SearchPage(rows, total, next_token)
+
+    def _seek_criteria(self, column, key, direction, value, key_value):
+        # PostgreSQL sorts NULL values last in ascending order and first in
+        # descending order
+        if direction == 'asc':
+            if value is None:
+                return sql.and_(column == None, key > key_value)  # noqa
+            return sql.or_(column > value,
+                           sql.and_(column == value, key > key_value),
+                           column == None)  # noqa
+        else:
+            if value is None:
+                return sql.or_(sql.and_(column == None, key < key_value),  # noqa
+                               column != None)  # noqa
+            return sql.or_(column < value,
+                           sql.and_(column == value, key < key_value))
+
+    def _encode_token(self, order, direction, value, key_value, total):
+        token = json.dumps([order, direction, value, key_value, total], default=unicode)
+        return base64.urlsafe_b64encode(token)
+
+    def _decode_token(self, token, order, direction):
+        try:
+            token_order, token_direction, value, key_value, total = json.loads(base64.urlsafe_b64decode(str(token)))
+        except (TypeError, ValueError, UnicodeEncodeError):
+            raise errors.invalid_query_parameter('after', token)
+
+        if (token_order, token_direction) != (order, direction):
+            raise errors.invalid_query_parameter('after', token)
+
+        return value, key_value, total
+
+    def _window_count(self):
+        return sql.func.count().over().label('total')
+
+    def _fetch(self, query, *columns):
+        descriptions = query.column_descriptions
+        single_entity = len(descriptions) == 1 and isinstance(descriptions[0]['type'], type)
+
+        results = query.add_columns(*columns).all()
+        if not results:
+            return [], []
+
+        extras = [result[-len(columns):] for result in results]
+        if single_entity:
+            return [result[0] for result in results], extras
+
+        labels = results[0].keys()[:-len(columns)]
+        return [KeyedTuple(result[:-len(columns)], labels) for result in results], extras
+
+    def _estimate_total(self, query, total, seen):
+        estimate = self._estimate_count(query)
+        if estimate is None:
+            return total
+        return max(estimate, seen)
+
+    def _estimate_count(self, query):
+        if query.session.bind.dialect.name != 'postgresql':
+            return None
+
+        plan = query.session.execute(_Explain(query.order_by(None).statement)).scalar()
+        if isinstance(plan, basestring):
+            plan = json.loads(plan)
+        return plan[0]['Plan']['Plan Rows']
 
     def _populate_parameters(self, parameters=None):
         new_params = dict(self.DEFAULTS)
@@ -101,6 +263,9 @@ class SearchSystem(object):
         if parameters['offset'] < 0:
             raise errors.wrong_type('offset', 'positive number')
 
+        if parameters['after'] is not None and parameters['offset'] > 0:
+            raise errors.invalid_query_parameter('offset', parameters['offset'])
+
         if parameters['limit'] is not None and parameters['limit'] <= 0:
             raise errors.wrong_type('limit', 'positive number')
 
@@ -111,13 +276,7 @@ class SearchSystem(object):
         if not term:
             return query
 
-        criteria = []
-        for column in self.config.all_search_columns():
-            expression = sql.cast(column, sa.String).ilike('%%%s%%' % term)
-            criteria.append(expression)
-
-        query = query.filter(sql.or_(*criteria))
-        return query
+        return self.backend.filter(query, self.config.all_search_columns(), term, self.config.key_column())
 
     def _filter_exact_match(self, query, parameters):
         for column_name, value in parameters.iteritems():
@@ -141,3 +300,14 @@ class SearchSystem(object):
             query = query.limit(limit)
 
         return query
+
+
+class _Explain(Executable, ClauseElement):
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(_Explain, 'postgresql')
+def _compile_explain(element, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) %s' % compiler.process(element.statement, **kw)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+import logging
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy import exc
+from sqlalchemy import sql
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql.util import find_tables
+
+logger = logging.getLogger(__name__)
+
+
+class ILikeSearchBackend(object):
+
+    def filter(self, query, columns, term, key=None):
+        criteria = [sql.cast(column, sa.String).ilike('%%%s%%' % term)
+                    for column in columns]
+        return query.filter(sql.or_(*criteria))
+
+
+class TrigramSearchBackend(ILikeSearchBackend):
+    '''
+    Substring search that can be served by pg_trgm GIN indexes.
+
+    Text columns are matched without the cast to VARCHAR so that the
+    expression is the same as the one of the index created by
+    create_indexes. Given the key of the searched rows, columns of other
+    tables are matched in separate branches of a UNION of keys, each branch
+    being restricted on a single table. Without pg_trgm, or on another database,
+    the search falls back to the ILIKE search.
+    '''
+
+    def __init__(self):
+        self._available = {}
+
+    def filter(self, query, columns, term, key=None):
+        if not self.is_available(query.session):
+            return super(TrigramSearchBackend, self).filter(query, columns, term)
+
+        criteria_by_tables = {}
+        for column in columns:
+            criterion = search_expression(column).ilike('%%%s%%' % term)
+            criteria_by_tables.setdefault(_tables(column), []).append(criterion)
+
+        if key is None or len(criteria_by_tables) == 1:
+            criteria = [criterion for criteria in criteria_by_tables.itervalues() for criterion in criteria]
+            return query.filter(sql.or_(*criteria))
+
+        # an OR over outer joined tables can not use the index of any of them
+        branches = [query.with_entities(key).filter(sql.or_(*criteria)).statement
+                    for criteria in criteria_by_tables.itervalues()]
+        return query.filter(key.in_(sql.union(*branches)))
+
+    def is_available(self, session):
+        bind = session.get_bind()
+        if bind.dialect.name != 'postgresql':
+            return False
+
+        key = str(bind.engine.url)
+        if key not in self._available:
+            query = sql.text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+            self._available[key] = session.execute(query).scalar()
+        return self._available[key]
+
+    def reset(self):
+        self._available.clear()
+
+    def create_indexes(self, session, config):
+        session.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        self._available.clear()
+
+        for table, name, ddl in _indexes(config):
+            _create_index(session, name, ddl)
+
+
+def register_indexes(config):
+    '''
+    Create the trigram indexes of config with their tables, when pg_trgm can
+    be installed on the server.
+    '''
+    for table, name, ddl in _indexes(config):
+        event.listen(table, 'after_create', _index_creator(name, ddl))
+
+
+def _index_creator(name, ddl):
+    def create_index(target, connection, **kw):
+        if connection.dialect.name == 'postgresql' and _install_trigram(connection):
+            _create_index(connection, name, ddl)
+    return create_index
+
+
+def _install_trigram(connection):
+    query = sql.text("SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')")
+    if not connection.execute(query).scalar():
+        return False
+
+    transaction = connection.begin_nested()
+    try:
+        connection.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except exc.DBAPIError:
+        transaction.rollback()
+        logger.warning('could not install pg_trgm, the trigram search indexes are not created')
+        return False
+    transaction.commit()
+    return True
+
+
+def _create_index(executor, name, ddl):
+    exists = executor.execute(sql.text('SELECT to_regclass(:name) IS NOT NULL'), {'name': name}).scalar()
+    if not exists:
+        logger.info('creating trigram index %s', name)
+        executor.execute(ddl)
+
+
+def search_expression(column):
+    # Enum is a String, but enum types have no ILIKE operator
+    if isinstance(column.type, sa.String) and not isinstance(column.type, sa.Enum):
+        return column
+    return sql.cast(column, sa.String)
+
+
+def index_ddl(config):
+    for table, name, ddl in _indexes(config):
+        yield name, ddl
+
+
+def _indexes(config):
+    for search_name, column in sorted(config.search_columns().iteritems()):
+        tables = _tables(column)
+        if len(tables) != 1:
+            continue
+
+        [table] = tables
+        expression = search_expression(column).compile(dialect=postgresql.dialect(),
+                                                       compile_kwargs={'literal_binds': True,
+                                                                       'include_table': False})
+        name = '%s__idx_trgm__%s' % (table.name, search_name)
+        ddl = 'CREATE INDEX "%s" ON "%s" USING gin ((%s) gin_trgm_ops)' % (name, table.name, expression)
+        yield table, name, ddl
+
+
+def _tables(column):
+    clause = sql.expression._literal_as_text(column)
+    return frozenset(find_tables(clause, check_columns=True))
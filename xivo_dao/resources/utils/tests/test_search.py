@@ -16,14 +16,21 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
 from mock import Mock
+from mock import patch
 import unittest
 from hamcrest import assert_that
 from hamcrest import equal_to
 from hamcrest import contains
 from hamcrest import contains_inanyorder
+from hamcrest import greater_than_or_equal_to
 from hamcrest import has_length
+from hamcrest import has_properties
+from sqlalchemy.orm.query import Query
 
 from xivo_dao.tests.test_dao import DAOTestCase
+from xivo_dao.resources.utils.search import COUNT_ESTIMATE
+from xivo_dao.resources.utils.search import COUNT_EXACT
+from xivo_dao.resources.utils.search import COUNT_WINDOW
 from xivo_dao.resources.utils.search import SearchConfig
 from xivo_dao.resources.utils.search import SearchSystem
 from xivo_dao.helpers.exception import InputError
@@ -169,6 +176,152 @@ class TestSearchSystem(DAOTestCase):
         assert_that(rows, contains(user_row2, user_row3))
 
 
+class TestSearchSystemCountModes(DAOTestCase):
+
+    def setUp(self):
+        DAOTestCase.setUp(self)
+        self.config = SearchConfig(table=UserFeatures,
+                                   columns={'lastname': UserFeatures.lastname,
+                                            'firstname': UserFeatures.firstname},
+                                   default_sort='lastname')
+
+    def test_given_window_count_then_page_and_total_are_fetched_in_one_query(self):
+        search = SearchSystem(self.config, count_mode=COUNT_WINDOW)
+        first_user_row = self.add_user(lastname='Abigale')
+        self.add_user(lastname='Zintrabi')
+
+        with patch.object(Query, 'count') as count:
+            rows, total = search.search(self.session, {'limit': 1})
+
+        assert_that(count.called, equal_to(False))
+        assert_that(total, equal_to(2))
+        assert_that(rows, contains(first_user_row))
+
+    def test_given_window_count_and_offset_past_the_end_then_total_is_counted(self):
+        search = SearchSystem(self.config, count_mode=COUNT_WINDOW)
+        self.add_user()
+        self.add_user()
+
+        rows, total = search.search(self.session, {'offset': 5})
+
+        assert_that(total, equal_to(2))
+        assert_that(rows, contains())
+
+    def test_given_window_count_and_column_query_then_rows_keep_their_labels(self):
+        search = SearchSystem(self.config, count_mode=COUNT_WINDOW)
+        user_row = self.add_user(lastname='Abigale')
+        query = self.session.query(UserFeatures.id.label('id'), UserFeatures.lastname.label('lastname'))
+
+        rows, total = search.search_from_query(query)
+
+        assert_that(total, equal_to(1))
+        assert_that(rows, contains(has_properties(id=user_row.id, lastname='Abigale')))
+
+    def test_given_exact_count_then_total_is_counted(self):
+        search = SearchSystem(self.config, count_mode=COUNT_EXACT)
+        first_user_row = self.add_user(lastname='Abigale')
+        self.add_user(lastname='Zintrabi')
+
+        rows, total = search.search(self.session, {'limit': 1})
+
+        assert_that(total, equal_to(2))
+        assert_that(rows, contains(first_user_row))
+
+    def test_given_estimate_count_then_total_is_at_least_the_rows_seen(self):
+        search = SearchSystem(self.config, count_mode=COUNT_ESTIMATE)
+        self.add_user(lastname='Abigale')
+        last_user_row = self.add_user(lastname='Zintrabi')
+
+        rows, total = search.search(self.session, {'offset': 1})
+
+        assert_that(total, greater_than_or_equal_to(2))
+        assert_that(rows, contains(last_user_row))
+
+
+class TestSearchSystemSeek(DAOTestCase):
+
+    def setUp(self):
+        DAOTestCase.setUp(self)
+        self.config = SearchConfig(table=UserFeatures,
+                                   columns={'lastname': UserFeatures.lastname,
+                                            'firstname': UserFeatures.firstname,
+                                            'description': UserFeatures.description},
+                                   default_sort='lastname')
+        self.search = SearchSystem(self.config)
+
+    def test_given_after_then_pages_follow_each_other(self):
+        users = [self.add_user(lastname=lastname) for lastname in ['A', 'B', 'B', 'C', 'D']]
+
+        pages = self.all_pages({'limit': 2})
+
+        assert_that([page.total for page in pages], equal_to([5, 5, 5]))
+        assert_that(self.items(pages), contains(*self.sorted_users(users, 'lastname')))
+        assert_that(pages[-1].next, equal_to(None))
+
+    def test_given_after_and_descending_direction_then_pages_follow_each_other(self):
+        users = [self.add_user(lastname=lastname) for lastname in ['A', 'B', 'B', 'C', 'D']]
+
+        pages = self.all_pages({'limit': 2, 'direction': 'desc'})
+
+        assert_that(self.items(pages), contains(*self.sorted_users(users, 'lastname', reverse=True)))
+
+    def test_given_after_and_null_sort_values_then_pages_follow_each_other(self):
+        users = [self.add_user(description=description) for description in ['b', None, 'a', None, 'c']]
+
+        ascending = self.all_pages({'limit': 2, 'order': 'description'})
+        descending = self.all_pages({'limit': 2, 'order': 'description', 'direction': 'desc'})
+
+        assert_that(self.items(ascending), contains(*self.sorted_users(users, 'description')))
+        assert_that(self.items(descending), contains(*self.sorted_users(users, 'description', reverse=True)))
+
+    def test_given_after_without_limit_then_returns_every_row_without_next(self):
+        user_row = self.add_user()
+
+        rows, total = page = self.search.search(self.session, {'after': ''})
+
+        assert_that(total, equal_to(1))
+        assert_that(rows, contains(user_row))
+        assert_that(page.next, equal_to(None))
+
+    def test_given_after_from_another_order_then_raises_error(self):
+        self.add_user()
+        self.add_user()
+        page = self.search.search(self.session, {'after': '', 'limit': 1})
+
+        self.assertRaises(InputError,
+                          self.search.search,
+                          self.session, {'after': page.next, 'limit': 1, 'order': 'firstname'})
+
+    def test_given_invalid_after_then_raises_error(self):
+        self.assertRaises(InputError,
+                          self.search.search,
+                          self.session, {'after': 'not a token'})
+
+    def test_given_after_and_offset_then_raises_error(self):
+        self.assertRaises(InputError,
+                          self.search.search,
+                          self.session, {'after': '', 'offset': 2})
+
+    def all_pages(self, parameters):
+        pages = []
+        after = ''
+        while after is not None:
+            page = self.search.search(self.session, dict(parameters, after=after))
+            pages.append(page)
+            after = page.next
+        return pages
+
+    def items(self, pages):
+        return [item for page in pages for item in page.items]
+
+    def sorted_users(self, users, attribute, reverse=False):
+        # NULL values sort last in ascending order, like PostgreSQL
+        def key(user):
+            value = getattr(user, attribute)
+            return (value is None, value, user.id)
+        return sorted(users, key=key, reverse=reverse)
+
+
 class TestSearchConfig(unittest.TestCase):
 
     def test_given_list_of_sort_columns_then_returns_columns_for_sorting(self):
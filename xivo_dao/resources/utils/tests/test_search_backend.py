@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+import unittest
+
+from hamcrest import assert_that
+from hamcrest import contains
+from hamcrest import contains_inanyorder
+from hamcrest import contains_string
+from hamcrest import equal_to
+from hamcrest import has_item
+from hamcrest import is_not
+from mock import Mock
+from mock import call
+from mock import patch
+
+from xivo_dao.alchemy.extension import Extension
+from xivo_dao.alchemy.queuemember import QueueMember
+from xivo_dao.alchemy.userfeatures import UserFeatures
+from xivo_dao.resources.user.search import UserSearchSystem
+from xivo_dao.resources.user.search import config as user_config
+from xivo_dao.resources.utils.search import SearchConfig
+from xivo_dao.resources.utils.search import SearchSystem
+from xivo_dao.resources.utils.search_backend import TrigramSearchBackend
+from xivo_dao.resources.utils.search_backend import index_ddl
+from xivo_dao.resources.utils.search_backend import register_indexes
+from xivo_dao.resources.utils.search_backend import search_expression
+from xivo_dao.tests.test_dao import DAOTestCase
+
+
+config = SearchConfig(table=UserFeatures,
+                      columns={'fullname': (UserFeatures.firstname + " " + UserFeatures.lastname),
+                               'simultcalls': UserFeatures.simultcalls,
+                               'exten': Extension.exten},
+                      default_sort='fullname')
+
+
+class TestTrigramSearchBackend(DAOTestCase):
+
+    def setUp(self):
+        DAOTestCase.setUp(self)
+        self.backend = TrigramSearchBackend()
+        self.search = SearchSystem(config, backend=self.backend)
+        self.user_config = SearchConfig(table=UserFeatures,
+                                        columns={'fullname': config.column_for_searching('fullname'),
+                                                 'simultcalls': UserFeatures.simultcalls},
+                                        default_sort='fullname')
+
+    def test_given_pg_trgm_then_text_columns_are_not_cast(self):
+        query = self.session.query(UserFeatures)
+
+        with patch.object(self.backend, 'is_available', return_value=True):
+            query = self.backend.filter(query, self.user_config.all_search_columns(), 'abc')
+
+        statement = str(query.statement)
+        assert_that(statement, contains_string('CAST(userfeatures.simultcalls AS VARCHAR)'))
+        assert_that(statement, is_not(contains_string('CAST(userfeatures.firstname')))
+
+    def test_given_pg_trgm_then_finds_same_rows_as_ilike_search(self):
+        user_row1 = self.add_user(firstname='Alice', lastname='Abigale', simultcalls=3)
+        user_row2 = self.add_user(firstname='Bob', lastname='Zintrabi', simultcalls=23)
+        ilike_search = SearchSystem(self.user_config)
+        trigram_search = SearchSystem(self.user_config, backend=self.backend)
+
+        with patch.object(self.backend, 'is_available', return_value=True):
+            for term in ['ALI', 'abi', '3']:
+                assert_that(trigram_search.search(self.session, {'search': term}),
+                            equal_to(ilike_search.search(self.session, {'search': term})))
+
+        rows, total = trigram_search.search(self.session, {'search': '3'})
+        assert_that(rows, contains_inanyorder(user_row1, user_row2))
+
+    def test_given_pg_trgm_then_columns_of_other_tables_are_searched_in_a_union(self):
+        user_row1 = self.add_user_line_with_exten(firstname='Alice', exten='1234').user
+        user_row2 = self.add_user_line_with_exten(firstname='Bob 1234', exten='5678').user
+        self.add_user_line_with_exten(firstname='Charles', exten='9999')
+        ilike_search = UserSearchSystem(user_config)
+        trigram_search = UserSearchSystem(user_config, backend=self.backend)
+
+        with patch.object(self.backend, 'is_available', return_value=True):
+            query = trigram_search._filter(self.session.query(UserFeatures), '1234')
+            rows, total = trigram_search.search(self.session, {'search': '1234'})
+
+            for term in ['ali', '56', 'bob 12']:
+                assert_that(trigram_search.search(self.session, {'search': term}),
+                            equal_to(ilike_search.search(self.session, {'search': term})))
+
+        assert_that(str(query.statement), contains_string('UNION'))
+        assert_that(rows, contains_inanyorder(user_row1, user_row2))
+
+    def test_given_no_pg_trgm_then_falls_back_to_ilike_search(self):
+        user_row = self.add_user(firstname='Alice', lastname='Abigale')
+        trigram_search = SearchSystem(self.user_config, backend=self.backend)
+
+        with patch.object(self.backend, 'is_available', return_value=False):
+            rows, total = trigram_search.search(self.session, {'search': 'ali'})
+
+        assert_that(rows, contains(user_row))
+
+    def test_given_another_database_then_pg_trgm_is_not_available(self):
+        session = Mock()
+        session.get_bind.return_value.dialect.name = 'sqlite'
+
+        assert_that(self.backend.is_available(session), equal_to(False))
+        assert_that(session.execute.called, equal_to(False))
+
+    def test_availability_is_checked_once(self):
+        self.backend.is_available(self.session)
+
+        with patch.object(self.session, 'execute') as execute:
+            self.backend.is_available(self.session)
+
+        assert_that(execute.called, equal_to(False))
+
+
+class TestIndexDDL(unittest.TestCase):
+
+    def test_index_ddl_uses_search_expressions(self):
+        result = list(index_ddl(config))
+
+        assert_that(result, contains(
+            ('extensions__idx_trgm__exten',
+             'CREATE INDEX "extensions__idx_trgm__exten" ON "extensions" USING gin ((exten) gin_trgm_ops)'),
+            ('userfeatures__idx_trgm__fullname',
+             'CREATE INDEX "userfeatures__idx_trgm__fullname" ON "userfeatures" '
+             'USING gin ((firstname || \' \' || nullif(lastname, \'\')) gin_trgm_ops)'),
+            ('userfeatures__idx_trgm__simultcalls',
+             'CREATE INDEX "userfeatures__idx_trgm__simultcalls" ON "userfeatures" '
+             'USING gin ((CAST(simultcalls AS VARCHAR)) gin_trgm_ops)'),
+        ))
+
+    def test_enum_columns_are_cast(self):
+        expression = search_expression(QueueMember.usertype)
+
+        assert_that(str(expression), equal_to('CAST(queuemember.usertype AS VARCHAR)'))
+
+    def test_index_ddl_skips_expressions_over_many_tables(self):
+        many_tables = SearchConfig(table=UserFeatures,
+                                   columns={'both': UserFeatures.firstname + Extension.exten},
+                                   default_sort='both')
+
+        assert_that(list(index_ddl(many_tables)), equal_to([]))
+
+
+class TestRegisterIndexes(unittest.TestCase):
+
+    def setUp(self):
+        with patch('xivo_dao.resources.utils.search_backend.event') as event:
+            register_indexes(config)
+        self.listeners = dict((table.name, listener)
+                              for (table, _, listener), _ in event.listen.call_args_list)
+        self.connection = Mock()
+        self.connection.dialect.name = 'postgresql'
+
+    def test_given_pg_trgm_available_then_index_is_created_with_the_table(self):
+        self.connection.execute.return_value.scalar.side_effect = [True, False]
+
+        self.listeners['extensions'](Extension.__table__, self.connection)
+
+        assert_that(self.connection.execute.call_args_list, has_item(call('CREATE EXTENSION IF NOT EXISTS pg_trgm')))
+        assert_that(self.connection.execute.call_args, equal_to(call(
+            'CREATE INDEX "extensions__idx_trgm__exten" ON "extensions" USING gin ((exten) gin_trgm_ops)')))
+
+    def test_given_pg_trgm_not_available_then_index_is_not_created(self):
+        self.connection.execute.return_value.scalar.return_value = False
+
+        self.listeners['extensions'](Extension.__table__, self.connection)
+
+        assert_that(self.connection.execute.call_count, equal_to(1))
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+import uuid
+
+from sqlalchemy import func
+from sqlalchemy import sql
+
+from xivo_dao.alchemy.func_key_template import FuncKeyTemplate
+from xivo_dao.alchemy.userfeatures import UserFeatures
+from xivo_dao.helpers.bulk import bulk_insert
+from xivo_dao.resources.user.search import UserSearchSystem
+from xivo_dao.resources.user.search import config
+from xivo_dao.resources.utils.search_backend import ILikeSearchBackend
+from xivo_dao.resources.utils.search_backend import TrigramSearchBackend
+from xivo_dao.tests.benchmark import BenchmarkTestCase
+
+
+class TestSearchBackendBenchmark(BenchmarkTestCase):
+
+    USER_COUNT = 100000
+    TERMS = ['ali', 'user 4242', 'abigale', 'zzz']
+    ROUNDS = 3
+
+    def setUp(self):
+        super(TestSearchBackendBenchmark, self).setUp()
+        first_id = self.session.query(func.coalesce(func.max(FuncKeyTemplate.id), 0)).scalar() + 1
+        template_ids = range(first_id, first_id + self.USER_COUNT)
+
+        bulk_insert(self.session, FuncKeyTemplate.__table__,
+                    ({'id': template_id, 'private': True} for template_id in template_ids))
+        bulk_insert(self.session, UserFeatures.__table__,
+                    ({'uuid': str(uuid.uuid4()),
+                      'firstname': 'User %s' % number,
+                      'lastname': 'Abigale' if number % 1000 == 0 else 'Lastname',
+                      'description': '',
+                      'func_key_private_template_id': template_id}
+                     for number, template_id in enumerate(template_ids)))
+
+    def test_ilike_against_trigram_search(self):
+        ilike_search = UserSearchSystem(config, backend=ILikeSearchBackend())
+        _, ilike_duration = self.timed(self._search_terms, ilike_search)
+
+        backend = TrigramSearchBackend()
+        if not self._trigram_installable():
+            self.report('%s users: ilike %.3fs, pg_trgm is not available on this server',
+                        self.USER_COUNT, ilike_duration)
+            return
+
+        backend.create_indexes(self.session, config)
+        self.session.execute('ANALYZE userfeatures')
+        trigram_search = UserSearchSystem(config, backend=backend)
+        _, trigram_duration = self.timed(self._search_terms, trigram_search)
+
+        self.report('%s users: ilike %.3fs, trigram %.3fs', self.USER_COUNT, ilike_duration, trigram_duration)
+
+    def _trigram_installable(self):
+        query = sql.text("SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')")
+        return self.session.execute(query).scalar()
+
+    def _search_terms(self, search_system):
+        for term in self.TERMS:
+            search_system.search(self.session, {'search': term, 'limit': 20})
@@ -30,10 +30,10 @@ from xivo_dao.alchemy.staticvoicemail import StaticVoicemail
 
 @daosession
 def search(session, **parameters):
-    rows, total = voicemail_search.search(session, parameters)
-    items = _generate_items(rows)
+    page = voicemail_search.search(session, parameters)
+    items = _generate_items(page.items)
 
-    return SearchResult(total, items)
+    return SearchResult(page.total, items, page.next)
 
 
 def _generate_items(rows):
@@ -18,6 +18,8 @@
 from xivo_dao.alchemy.voicemail import Voicemail
 from xivo_dao.resources.utils.search import SearchSystem
 from xivo_dao.resources.utils.search import SearchConfig
+from xivo_dao.resources.utils.search_backend import TrigramSearchBackend
+from xivo_dao.resources.utils.search_backend import register_indexes
 
 
 config = SearchConfig(table=Voicemail,
@@ -30,4 +32,6 @@ config = SearchConfig(table=Voicemail,
                       search=['name', 'number', 'email'],
                       default_sort='number')
 
-voicemail_search = SearchSystem(config)
+register_indexes(config)
+
+voicemail_search = SearchSystem(config, backend=TrigramSearchBackend())
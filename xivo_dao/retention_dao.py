@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+import logging
+import time
+
+from sqlalchemy import and_, case, null, or_, select
+
+from xivo_dao.alchemy.call_log import CallLog
+from xivo_dao.alchemy.cel import CEL
+from xivo_dao.alchemy.queue_log import QueueLog
+from xivo_dao.alchemy.stat_agent_login_state import StatAgentLoginState
+from xivo_dao.alchemy.stat_agent_periodic import StatAgentPeriodic
+from xivo_dao.alchemy.stat_call_on_queue import StatCallOnQueue
+from xivo_dao.alchemy.stat_call_on_queue_rollup import ROLLUP_BUCKET
+from xivo_dao.alchemy.stat_call_on_queue_rollup import StatCallOnQueueRollup
+from xivo_dao.alchemy.stat_pending_call import StatPendingCall
+from xivo_dao.alchemy.stat_queue_periodic import StatQueuePeriodic
+from xivo_dao.helpers import db_manager
+
+logger = logging.getLogger(__name__)
+
+PURGE_BATCH_SIZE = 10000
+
+_QUEUE_LOG_TIME_FMT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def _queue_log_older_than(cutoff):
+    # the rows not backfilled yet have no timestamp, their text time sorts
+    # like the timestamp it holds
+    return or_(QueueLog.timestamp < cutoff,
+               and_(QueueLog.timestamp == None,  # noqa
+                    QueueLog.time < cutoff.strftime(_QUEUE_LOG_TIME_FMT)))
+
+
+# the login state of an agent is kept while they are logged in
+_login_state_logout = case([(StatAgentLoginState.last_logout < StatAgentLoginState.last_login, null())],
+                           else_=StatAgentLoginState.last_logout)
+
+# cel is purged before call_log, deleting a call log would otherwise mark its
+# CELs as unprocessed. A rollup quarter hour is purged once it has fully
+# passed the cutoff.
+RETENTION_TABLES = [
+    ('cel', CEL.id, CEL.eventtime),
+    ('call_log', CallLog.id, CallLog.date),
+    ('queue_log', QueueLog.id, _queue_log_older_than),
+    ('stat_call_on_queue', StatCallOnQueue.id, StatCallOnQueue.time),
+    ('stat_call_on_queue_rollup', StatCallOnQueueRollup.id, StatCallOnQueueRollup.bucket + ROLLUP_BUCKET),
+    ('stat_pending_call', StatPendingCall.id, StatPendingCall.time),
+    ('stat_queue_periodic', StatQueuePeriodic.id, StatQueuePeriodic.time),
+    ('stat_agent_periodic', StatAgentPeriodic.id, StatAgentPeriodic.time),
+    ('stat_agent_login_state', StatAgentLoginState.agent, _login_state_logout),
+]
+
+
+def purge(cutoff, tables=None, batch_size=None, pause=0, progress=None):
+    """
+    Delete the rows older than cutoff from the retention tables, or only
+    from the given table names.
+
+    The rows are deleted by batches of batch_size ids in a session of their
+    own, committed after each batch and pause seconds slept between
+    batches so that other transactions are not blocked for long. progress,
+    if given, is called with (table_name, removed_so_far) after each batch.
+
+    Returns a dict of the number of removed rows by table name.
+    """
+    session = db_manager.Session.session_factory()
+    try:
+        removed = {}
+        for name, id_column, time_column in RETENTION_TABLES:
+            if tables is not None and name not in tables:
+                continue
+            removed[name] = purge_table(session, name, id_column, time_column, cutoff,
+                                        batch_size, pause, progress)
+        return removed
+    finally:
+        session.close()
+
+
+def purge_table(session, name, id_column, time_column, cutoff, batch_size=None, pause=0, progress=None):
+    """
+    Delete the rows of a table older than cutoff, committing session after
+    each batch. session must not be shared with other work. time_column may
+    also be a function of cutoff returning the criterion of the old rows.
+    """
+    batch_size = batch_size or PURGE_BATCH_SIZE
+    table = id_column.class_.__table__
+    if callable(time_column):
+        older = time_column(cutoff)
+    else:
+        older = time_column < cutoff
+
+    removed = 0
+    last_id = None
+    while True:
+        batch = (select([id_column])
+                 .where(older)
+                 .order_by(id_column)
+                 .limit(batch_size))
+        if last_id is not None:
+            batch = batch.where(id_column > last_id)
+        query = table.delete().where(id_column.in_(batch)).returning(id_column)
+        deleted_ids = [deleted_id for deleted_id, in session.execute(query)]
+        session.commit()
+
+        if not deleted_ids:
+            break
+        removed += len(deleted_ids)
+        last_id = max(deleted_ids)
+
+        logger.debug('purged %s rows from %s', removed, name)
+        if progress:
+            progress(name, removed)
+
+        if len(deleted_ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    logger.info('purged %s rows older than %s from %s', removed, cutoff, name)
+    return removed
@@ -16,24 +16,49 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
 from xivo_dao.alchemy.stat_agent_periodic import StatAgentPeriodic
+from xivo_dao.helpers.bulk import bulk_insert
 
 
 def insert_stats(session, period_stats, period_start):
     for agent_id, times in period_stats.iteritems():
-        entry = StatAgentPeriodic(
-            time=period_start,
-            login_time=times['login_time'] if 'login_time' in times else '00:00:00',
-            pause_time=times['pause_time'] if 'pause_time' in times else '00:00:00',
-            wrapup_time=times['wrapup_time'] if 'wrapup_time' in times else '00:00:00',
-            agent_id=agent_id,
-        )
+        entry = StatAgentPeriodic(**_build_row(period_start, agent_id, times))
 
         session.add(entry)
 
 
+def bulk_insert_stats(session, periods_stats):
+    """
+    periods_stats is an iterable of (period_start, period_stats) tuples,
+    period_stats being the same dict as in insert_stats.
+    """
+    rows = (_build_row(period_start, agent_id, times)
+            for period_start, period_stats in periods_stats
+            for agent_id, times in period_stats.iteritems())
+
+    return bulk_insert(session, StatAgentPeriodic.__table__, rows)
+
+
+def _build_row(period_start, agent_id, times):
+    return {
+        'time': period_start,
+        'login_time': times['login_time'] if 'login_time' in times else '00:00:00',
+        'pause_time': times['pause_time'] if 'pause_time' in times else '00:00:00',
+        'wrapup_time': times['wrapup_time'] if 'wrapup_time' in times else '00:00:00',
+        'agent_id': agent_id,
+    }
+
+
 def clean_table(session):
     session.query(StatAgentPeriodic).delete()
 
 
 def remove_after(session, date):
     session.query(StatAgentPeriodic).filter(StatAgentPeriodic.time >= date).delete()
+
+
+def remove_between(session, start, end):
+    (session
+     .query(StatAgentPeriodic)
+     .filter(StatAgentPeriodic.time >= start)
+     .filter(StatAgentPeriodic.time < end)
+     .delete())
@@ -16,12 +16,23 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
 from xivo_dao.alchemy.stat_call_on_queue import StatCallOnQueue
+from xivo_dao.alchemy.stat_call_on_queue_rollup import ROLLUP_BUCKET
+from xivo_dao.alchemy.stat_call_on_queue_rollup import StatCallOnQueueRollup
+from xivo_dao.alchemy.stat_call_on_queue_rollup import add_rollup_totals
+from xivo_dao.alchemy.stat_call_on_queue_rollup import rollup_bucket
 from xivo_dao import stat_queue_dao
+from xivo_dao.helpers import db_manager
+from xivo_dao.helpers.bulk import bulk_insert
+from xivo_dao.helpers.db_utils import backfill_column
 from sqlalchemy import func, between, literal
 from sqlalchemy.sql.expression import extract, cast
 from sqlalchemy.types import Integer
+from collections import Counter
 from datetime import timedelta
 
+REMOVE_BATCH_SIZE = 1000
+END_TIME_BACKFILL_BATCH_SIZE = 10000
+
 
 def _add_call(session, callid, time, queue_name, event, waittime=None):
     queue_id = int(stat_queue_dao.id_from_name(queue_name))
@@ -61,66 +72,204 @@ def add_timeout_call(dao_sess, callid, time, queue_name, waittime):
     _add_call(dao_sess, callid, time, queue_name, 'timeout', waittime)
 
 
+def add_calls(session, calls, batch_size=None):
+    """
+    calls is an iterable of (callid, time, queue_name, event, waittime)
+    tuples, waittime being None for events without a waiting time.
+    """
+    queue_ids = stat_queue_dao.ids_by_name(session)
+    totals = Counter()
+
+    def rows():
+        for callid, time, queue_name, event, waittime in calls:
+            if queue_name not in queue_ids:
+                raise LookupError('No such queue')
+            totals[rollup_bucket(time), queue_ids[queue_name], event] += 1
+            yield {
+                'callid': callid,
+                'time': time,
+                'queue_id': queue_ids[queue_name],
+                'status': event,
+                'waittime': waittime or 0,
+            }
+
+    inserted = bulk_insert(session, StatCallOnQueue.__table__, rows(), batch_size)
+    add_rollup_totals(session, totals)
+    return inserted
+
+
 def get_periodic_stats_quarter_hour(session, start, end):
-    quarter_hour_step = func.date_trunc(literal('hour'), StatCallOnQueue.time) + \
-        (cast(extract('minute', StatCallOnQueue.time), Integer) / 15) * timedelta(minutes=15)
-    return _get_periodic_stat_by_step(session, start, end, quarter_hour_step)
+    return _get_periodic_stats(session, start, end, _quarter_hour_step)
 
 
 def get_periodic_stats_hour(session, start, end):
-    one_hour_step = func.date_trunc(literal('hour'), StatCallOnQueue.time)
-    return _get_periodic_stat_by_step(session, start, end, one_hour_step)
+    return _get_periodic_stats(session, start, end, _hour_step)
+
+
+def _quarter_hour_step(column):
+    return func.date_trunc(literal('hour'), column) + \
+        (cast(extract('minute', column), Integer) / 15) * ROLLUP_BUCKET
 
 
-def _get_periodic_stat_by_step(session, start, end, step):
+def _hour_step(column):
+    return func.date_trunc(literal('hour'), column)
+
+
+def _get_periodic_stats(session, start, end, step):
+    """
+    The quarter hours fully included in [start, end] are read from
+    stat_call_on_queue_rollup, the partial ones at both ends of the range
+    from the calls themselves.
+    """
     stats = {}
 
-    rows = (session
-            .query(step.label('the_time'),
+    rollup_start = rollup_bucket(start)
+    if rollup_start < start:
+        rollup_start += ROLLUP_BUCKET
+    rollup_end = rollup_bucket(end + timedelta(microseconds=1))
+
+    if rollup_start < rollup_end:
+        _add_periodic_stats(stats, _get_rollup_stats(session, rollup_start, rollup_end, step))
+        _add_periodic_stats(stats, _get_call_stats(session, step,
+                                                   StatCallOnQueue.time >= start,
+                                                   StatCallOnQueue.time < rollup_start))
+        _add_periodic_stats(stats, _get_call_stats(session, step,
+                                                   StatCallOnQueue.time >= rollup_end,
+                                                   StatCallOnQueue.time <= end))
+    else:
+        _add_periodic_stats(stats, _get_call_stats(session, step,
+                                                   between(StatCallOnQueue.time, start, end)))
+
+    return stats
+
+
+def _get_rollup_stats(session, start, end, step):
+    the_time = step(StatCallOnQueueRollup.bucket).label('the_time')
+    return (session
+            .query(the_time,
+                   StatCallOnQueueRollup.queue_id,
+                   StatCallOnQueueRollup.status,
+                   func.sum(StatCallOnQueueRollup.total))
+            .filter(StatCallOnQueueRollup.bucket >= start)
+            .filter(StatCallOnQueueRollup.bucket < end)
+            .group_by(the_time,
+                      StatCallOnQueueRollup.queue_id,
+                      StatCallOnQueueRollup.status)
+            .having(func.sum(StatCallOnQueueRollup.total) != 0))
+
+
+def _get_call_stats(session, step, *criteria):
+    the_time = step(StatCallOnQueue.time).label('the_time')
+    return (session
+            .query(the_time,
                    StatCallOnQueue.queue_id,
                    StatCallOnQueue.status,
                    func.count(StatCallOnQueue.status))
-            .group_by('the_time',
+            .filter(*criteria)
+            .group_by(the_time,
                       StatCallOnQueue.queue_id,
-                      StatCallOnQueue.status)
-            .filter(between(StatCallOnQueue.time, start, end)))
+                      StatCallOnQueue.status))
 
-    for period, queue_id, status, number in rows.all():
-        if period not in stats:
-            stats[period] = {}
-        if queue_id not in stats[period]:
-            stats[period][queue_id] = {'total': 0}
-        stats[period][queue_id][status] = number
-        stats[period][queue_id]['total'] += number
 
-    return stats
+def _add_periodic_stats(stats, rows):
+    for period, queue_id, status, number in rows.all():
+        queue_stats = stats.setdefault(period, {}).setdefault(queue_id, {'total': 0})
+        queue_stats[status] = queue_stats.get(status, 0) + number
+        queue_stats['total'] += number
+
+
+def refresh_rollup(session, start=None, end=None):
+    """
+    Rebuild the stat_call_on_queue_rollup quarter hours overlapping
+    [start, end] from the calls, all of them when no range is given.
+
+    The calls added or removed by this module are counted in the rollup as
+    they are written, a refresh merges the rows appended since into one row
+    per bucket and repairs the buckets of calls written by other means.
+    """
+    buckets = session.query(StatCallOnQueueRollup)
+    bucket = _quarter_hour_step(StatCallOnQueue.time)
+    rollup = (session
+              .query(bucket,
+                     StatCallOnQueue.queue_id,
+                     StatCallOnQueue.status,
+                     func.count(StatCallOnQueue.id))
+              .group_by(bucket,
+                        StatCallOnQueue.queue_id,
+                        StatCallOnQueue.status))
+
+    if start is not None:
+        first_bucket = rollup_bucket(start)
+        buckets = buckets.filter(StatCallOnQueueRollup.bucket >= first_bucket)
+        rollup = rollup.filter(StatCallOnQueue.time >= first_bucket)
+    if end is not None:
+        after_last_bucket = rollup_bucket(end) + ROLLUP_BUCKET
+        buckets = buckets.filter(StatCallOnQueueRollup.bucket < after_last_bucket)
+        rollup = rollup.filter(StatCallOnQueue.time < after_last_bucket)
+
+    buckets.delete(synchronize_session=False)
+    session.execute(StatCallOnQueueRollup.__table__.insert().from_select(
+        ['bucket', 'queue_id', 'status', 'total'], rollup))
 
 
 def clean_table(session):
     session.query(StatCallOnQueue).delete()
+    session.query(StatCallOnQueueRollup).delete()
 
 
 def remove_after(session, date):
     session.query(StatCallOnQueue).filter(StatCallOnQueue.time >= date).delete()
+    refresh_rollup(session, date)
 
 
-def find_all_callid_between_date(session, start_date, end_date):
-    sql = '''\
-      select foo.callid, foo.end from (
-        select callid,
-               time::TIMESTAMP + (talktime || ' seconds')::INTERVAL
-                               + (ringtime || ' seconds')::INTERVAL
-                               + (waittime || ' seconds')::INTERVAL AS end
-         from stat_call_on_queue) as foo
-       where foo.end between :start_date and :end_date
-    '''
-    rows = session.query('callid').from_statement(sql).params(start_date=start_date, end_date=end_date)
-
-    return [row[0] for row in rows]
-
+def remove_between(session, start, end):
+    (session
+     .query(StatCallOnQueue)
+     .filter(StatCallOnQueue.time >= start)
+     .filter(StatCallOnQueue.time < end)
+     .delete())
+    refresh_rollup(session, start, end)
 
-def remove_callids(session, callids):
-    if not callids:
-        return
 
-    session.query(StatCallOnQueue).filter(StatCallOnQueue.callid.in_(callids)).delete(synchronize_session='fetch')
+def find_all_callid_between_date(session, start_date, end_date):
+    rows = (session
+            .query(StatCallOnQueue.callid)
+            .filter(between(StatCallOnQueue.end_time, start_date, end_date))
+            .order_by(StatCallOnQueue.id))
+
+    return [row.callid for row in rows]
+
+
+def remove_callids(session, callids, batch_size=None):
+    batch_size = batch_size or REMOVE_BATCH_SIZE
+    callids = list(callids)
+    table = StatCallOnQueue.__table__
+    totals = Counter()
+
+    for i in xrange(0, len(callids), batch_size):
+        query = (table.delete()
+                 .where(table.c.callid.in_(callids[i:i + batch_size]))
+                 .returning(table.c.time, table.c.queue_id, table.c.status))
+        for time, queue_id, status in session.execute(query):
+            totals[rollup_bucket(time), queue_id, status] -= 1
+
+    add_rollup_totals(session, totals)
+
+
+def backfill_end_time(batch_size=None, pause=0):
+    """
+    Fill the end_time of the calls written before the column existed, so
+    that find_all_callid_between_date finds them. The calls are updated by
+    batches of batch_size ids, each committed in a session of its own, and
+    pause seconds are slept between batches. Returns the number of updated
+    calls.
+    """
+    session = db_manager.Session.session_factory()
+    try:
+        return backfill_column(session,
+                               StatCallOnQueue.end_time,
+                               StatCallOnQueue.time,
+                               batch_size or END_TIME_BACKFILL_BATCH_SIZE,
+                               pause)
+    finally:
+        session.close()
@@ -15,21 +15,48 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
+import logging
+
+from datetime import timedelta
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql import text
 
+from xivo_dao import stat_call_on_queue_dao
+from xivo_dao.alchemy.queue_log import QueueLog
+from xivo_dao.alchemy.stat_agent_login_state import StatAgentLoginState
+from xivo_dao.alchemy.stat_call_on_queue import StatCallOnQueue
+from xivo_dao.alchemy.stat_pending_call import StatPendingCall
+from xivo_dao.alchemy.stat_watermark import StatWatermark
+from xivo_dao.helpers import interval
+from xivo_dao.helpers.db_utils import stream_query
+
+logger = logging.getLogger(__name__)
+
 _STR_TIME_FMT = "%Y-%m-%d %H:%M:%S.%f"
 
-FILL_ANSWERED_CALL_ON_QUEUE_QUERY = text('''\n
+_INCREMENTAL_FILL_WATERMARK = 'fill_calls'
+_AGENT_LOGIN_STATE_WATERMARK = 'agent_login_state'
+_PENDING_CALL_MAX_AGE = timedelta(days=1)
+_QUEUE_LOG_COMMIT_LAG = timedelta(minutes=1)
+
+_CALL_END_EVENTS = (
+    "'COMPLETEAGENT', 'COMPLETECALLER', 'ATTENDEDTRANSFER', 'BLINDTRANSFER', 'TRANSFER', "
+    "'ABANDON', 'EXITWITHTIMEOUT', 'EXITWITHKEY', 'EXITEMPTY', 'LEAVEEMPTY'"
+)
+
+_FILL_ANSWERED_CALL_ON_QUEUE_TEMPLATE = '''\n
 INSERT INTO stat_call_on_queue (callid, "time", talktime, waittime, queue_id, agent_id, status)
 (
     WITH
     call_entries AS (
         SELECT
-            callid, queuename, agent, time, event, data1, data2, data3, data4, data5
+            callid, queuename, agent, timestamp AS time, event, data1, data2, data3, data4, data5
         FROM
             queue_log
         WHERE
-            time BETWEEN :start AND :end
+            {call_entries_filter}
     ),
     call_start AS (
         SELECT
@@ -37,7 +64,7 @@ INSERT INTO stat_call_on_queue (callid, "time", talktime, waittime, queue_id, ag
         FROM
             call_entries
         WHERE
-            event = 'ENTERQUEUE'
+            event = 'ENTERQUEUE'{pending_call_start}
     ),
     call_end AS (
         SELECT
@@ -72,7 +99,7 @@ INSERT INTO stat_call_on_queue (callid, "time", talktime, waittime, queue_id, ag
             call_end.callid,
             call_end.queuename,
             call_end.agent,
-            call_start.time::TIMESTAMP,
+            call_start.time,
             call_end.talktime,
             call_end.waittime
         FROM
@@ -86,7 +113,7 @@ INSERT INTO stat_call_on_queue (callid, "time", talktime, waittime, queue_id, ag
             call_end.callid,
             call_end.queuename,
             call_end.agent,
-            call_end.time::TIMESTAMP
+            call_end.time
                 - (call_end.talktime || ' seconds')::INTERVAL
                 - (call_end.waittime || ' seconds')::INTERVAL
             AS time,
@@ -123,32 +150,383 @@ INSERT INTO stat_call_on_queue (callid, "time", talktime, waittime, queue_id, ag
     ORDER BY
         all_calls.time
 )
+'''
+
+FILL_ANSWERED_CALL_ON_QUEUE_QUERY = text(_FILL_ANSWERED_CALL_ON_QUEUE_TEMPLATE.format(
+    call_entries_filter='timestamp BETWEEN :start AND :end',
+    pending_call_start='',
+))
+
+FILL_ANSWERED_CALL_ON_QUEUE_INCREMENTAL_QUERY = text(_FILL_ANSWERED_CALL_ON_QUEUE_TEMPLATE.format(
+    call_entries_filter='id > :last_id AND id <= :new_last_id',
+    pending_call_start='''
+        UNION ALL
+        SELECT
+            callid, queuename, time
+        FROM
+            stat_pending_call''',
+))
+
+FILL_SIMPLE_CALL_ON_QUEUE_INCREMENTAL_QUERY = text('''\
+INSERT INTO stat_call_on_queue (callid, "time", queue_id, status)
+SELECT
+    callid,
+    queue_log.timestamp AS time,
+    stat_queue.id AS queue_id,
+    CASE WHEN event = 'FULL' THEN 'full'::call_exit_type
+         WHEN event = 'DIVERT_CA_RATIO' THEN 'divert_ca_ratio'
+         WHEN event = 'DIVERT_HOLDTIME' THEN 'divert_waittime'
+         WHEN event = 'CLOSED' THEN 'closed'
+         WHEN event = 'JOINEMPTY' THEN 'joinempty'
+    END AS status
+FROM
+    queue_log
+LEFT JOIN
+    stat_queue ON queue_log.queuename = stat_queue.name
+WHERE
+    queue_log.id > :last_id
+    AND queue_log.id <= :new_last_id
+    AND event IN ('FULL', 'DIVERT_CA_RATIO', 'DIVERT_HOLDTIME', 'CLOSED', 'JOINEMPTY')
 ''')
 
+FILL_LEAVEEMPTY_CALL_ON_QUEUE_INCREMENTAL_QUERY = text('''\
+INSERT INTO stat_call_on_queue (callid, "time", waittime, queue_id, status)
+(
+    WITH
+    call_start AS (
+        SELECT
+            callid, queuename, timestamp AS time
+        FROM
+            queue_log
+        WHERE
+            id > :last_id
+            AND id <= :new_last_id
+            AND event = 'ENTERQUEUE'
+        UNION ALL
+        SELECT
+            callid, queuename, time
+        FROM
+            stat_pending_call
+    )
+
+    SELECT
+        call_start.callid,
+        call_start.time,
+        EXTRACT(EPOCH FROM (leave_empty.timestamp - call_start.time))::INTEGER AS waittime,
+        stat_queue.id AS queue_id,
+        'leaveempty' AS status
+    FROM
+        queue_log AS leave_empty
+    INNER JOIN
+        call_start ON leave_empty.callid = call_start.callid
+                  AND leave_empty.queuename = call_start.queuename
+    LEFT JOIN
+        stat_queue ON call_start.queuename = stat_queue.name
+    WHERE
+        leave_empty.id > :last_id
+        AND leave_empty.id <= :new_last_id
+        AND leave_empty.event = 'LEAVEEMPTY'
+)
+''')
+
+REMOVE_ENDED_PENDING_CALLS_QUERY = text('''\
+DELETE FROM stat_pending_call
+USING queue_log
+WHERE
+    queue_log.id > :last_id
+    AND queue_log.id <= :new_last_id
+    AND queue_log.event IN ({call_end_events})
+    AND queue_log.callid = stat_pending_call.callid
+    AND queue_log.queuename = stat_pending_call.queuename
+'''.format(call_end_events=_CALL_END_EVENTS))
+
+ADD_PENDING_CALLS_QUERY = text('''\
+INSERT INTO stat_pending_call (callid, queuename, "time", queue_log_id)
+SELECT
+    enter_queue.callid,
+    enter_queue.queuename,
+    enter_queue.timestamp,
+    enter_queue.id
+FROM
+    queue_log AS enter_queue
+WHERE
+    enter_queue.id > :last_id
+    AND enter_queue.id <= :new_last_id
+    AND enter_queue.event = 'ENTERQUEUE'
+    AND NOT EXISTS (
+        SELECT 1
+        FROM queue_log AS call_end
+        WHERE call_end.callid = enter_queue.callid
+          AND call_end.queuename = enter_queue.queuename
+          AND call_end.id > enter_queue.id
+          AND call_end.id <= :new_last_id
+          AND call_end.event IN ({call_end_events})
+    )
+'''.format(call_end_events=_CALL_END_EVENTS))
+
+UPDATE_AGENT_LOGIN_STATE_QUERY = text('''\
+WITH new_states AS (
+    SELECT
+        agent,
+        MAX(CASE WHEN event LIKE '%LOGIN' THEN timestamp END) AS last_login,
+        MAX(CASE WHEN event LIKE '%LOGOFF' THEN timestamp END) AS last_logout
+    FROM
+        queue_log
+    WHERE
+        id > :last_id
+        AND id <= :new_last_id
+        AND event LIKE 'AGENT%'
+    GROUP BY
+        agent
+),
+updated AS (
+    UPDATE stat_agent_login_state
+    SET
+        last_login = GREATEST(stat_agent_login_state.last_login, new_states.last_login),
+        last_logout = GREATEST(stat_agent_login_state.last_logout, new_states.last_logout)
+    FROM new_states
+    WHERE stat_agent_login_state.agent = new_states.agent
+    RETURNING stat_agent_login_state.agent
+)
+INSERT INTO stat_agent_login_state (agent, last_login, last_logout)
+SELECT agent, last_login, last_logout
+FROM new_states
+WHERE agent NOT IN (SELECT agent FROM updated)
+''')
+
+# queue_log ids are taken from a sequence when the row is inserted, a
+# transaction that commits late leaves a hole below ids already visible.
+# A hole is only skipped once the rows after it are older than the lag.
+FIRST_UNCOMMITTED_QUEUE_LOG_GAP_QUERY = text('''\
+SELECT
+    previous_id
+FROM (
+    SELECT
+        id,
+        timestamp,
+        LAG(id, 1, :last_id) OVER (ORDER BY id) AS previous_id
+    FROM
+        queue_log
+    WHERE
+        id > :last_id
+) AS new_rows
+WHERE
+    id > previous_id + 1
+    AND timestamp > LOCALTIMESTAMP - :commit_lag
+ORDER BY
+    id
+LIMIT 1
+''')
+
+# the AGENT* rows not folded into stat_agent_login_state yet are aggregated
+# at read time, so the result does not depend on when the state was updated
+LAST_LOGINS_AND_LOGOUTS_QUERY = '''\
+WITH unprocessed_states AS (
+  SELECT
+    agent,
+    MAX(CASE WHEN event LIKE '%LOGIN' THEN timestamp END) AS last_login,
+    MAX(CASE WHEN event LIKE '%LOGOFF' THEN timestamp END) AS last_logout
+  FROM
+    queue_log
+  WHERE
+    id > COALESCE((SELECT queue_log_id FROM stat_watermark WHERE name = :watermark), 0)
+    AND event LIKE 'AGENT%'
+  GROUP BY
+    agent
+),
+states AS (
+  SELECT agent, last_login, last_logout FROM stat_agent_login_state
+  UNION ALL
+  SELECT agent, last_login, last_logout FROM unprocessed_states
+)
+SELECT
+  stat_agent.id AS agent,
+  MAX(states.last_login) AS login,
+  MAX(states.last_logout) AS logout
+FROM
+  stat_agent
+JOIN
+  states ON states.agent = stat_agent.name
+GROUP BY
+  stat_agent.id
+HAVING
+  MAX(states.last_login) < :end
+'''
+
 
 def fill_simple_calls(session, start, end):
+    last_call_id = _get_last_call_id(session)
     _run_sql_function_returning_void(
         session,
         start, end,
         'SELECT 1 AS place_holder FROM fill_simple_calls(:start, :end)'
     )
+    _refresh_rollup_of_calls_after(session, last_call_id)
 
 
 def fill_answered_calls(session, start, end):
     params = {
-        'start': start.strftime(_STR_TIME_FMT),
-        'end': end.strftime(_STR_TIME_FMT),
+        'start': start,
+        'end': end,
     }
 
+    last_call_id = _get_last_call_id(session)
     session.execute(FILL_ANSWERED_CALL_ON_QUEUE_QUERY, params)
+    _refresh_rollup_of_calls_after(session, last_call_id)
 
 
 def fill_leaveempty_calls(session, start, end):
+    last_call_id = _get_last_call_id(session)
     _run_sql_function_returning_void(
         session,
         start, end,
         'SELECT 1 AS place_holder FROM fill_leaveempty_calls(:start, :end)'
     )
+    _refresh_rollup_of_calls_after(session, last_call_id)
+
+
+def _get_last_call_id(session):
+    return session.query(func.max(StatCallOnQueue.id)).scalar() or 0
+
+
+def _refresh_rollup_of_calls_after(session, last_call_id):
+    first_call_time, last_call_time = (session
+                                       .query(func.min(StatCallOnQueue.time),
+                                              func.max(StatCallOnQueue.time))
+                                       .filter(StatCallOnQueue.id > last_call_id)
+                                       .first())
+    if first_call_time is not None:
+        stat_call_on_queue_dao.refresh_rollup(session, first_call_time, last_call_time)
+
+
+def fill_calls_incremental(session):
+    """
+    Fill stat_call_on_queue with the answered, simple and leaveempty calls
+    found in the queue_log rows added since the previous incremental run.
+
+    Calls that entered a queue but are not ended yet are kept in
+    stat_pending_call until their ending event is processed. Rows after a
+    recent hole in the queue_log ids are left for a later run, the hole
+    may be a row that a concurrent writer has not committed yet.
+
+    The agent login state read by get_login_intervals_in_range and the
+    call rollup of the periodic statistics are updated in the same run.
+
+    Returns the (start, end) time range of the processed queue_log rows or
+    None if there was nothing new to process.
+    """
+    update_agent_login_state(session)
+
+    watermark = _get_watermark(session, _INCREMENTAL_FILL_WATERMARK)
+    last_id = watermark.queue_log_id
+
+    new_last_id = _get_committed_last_id(session, last_id)
+    if new_last_id is None or new_last_id <= last_id:
+        return None
+
+    first_time, last_time = (session
+                             .query(func.min(QueueLog.timestamp),
+                                    func.max(QueueLog.timestamp))
+                             .filter(QueueLog.id > last_id)
+                             .filter(QueueLog.id <= new_last_id)
+                             .first())
+
+    last_call_id = _get_last_call_id(session)
+
+    params = {'last_id': last_id, 'new_last_id': new_last_id}
+    session.execute(FILL_SIMPLE_CALL_ON_QUEUE_INCREMENTAL_QUERY, params)
+    session.execute(FILL_ANSWERED_CALL_ON_QUEUE_INCREMENTAL_QUERY, params)
+    session.execute(FILL_LEAVEEMPTY_CALL_ON_QUEUE_INCREMENTAL_QUERY, params)
+    _refresh_rollup_of_calls_after(session, last_call_id)
+    session.execute(REMOVE_ENDED_PENDING_CALLS_QUERY, params)
+    session.execute(ADD_PENDING_CALLS_QUERY, params)
+
+    expired_calls = (StatPendingCall.__table__
+                     .delete()
+                     .where(StatPendingCall.time < last_time - _PENDING_CALL_MAX_AGE)
+                     .returning(StatPendingCall.callid, StatPendingCall.queuename, StatPendingCall.time))
+    for callid, queuename, time in session.execute(expired_calls):
+        logger.warning('call %s entered queue %s at %s and never ended, it is not counted', callid, queuename, time)
+
+    watermark.queue_log_id = new_last_id
+    watermark.time = last_time
+    session.flush()
+
+    return first_time, last_time
+
+
+def reset_fill_calls_incremental(session):
+    session.query(StatPendingCall).delete()
+    (session
+     .query(StatWatermark)
+     .filter(StatWatermark.name == _INCREMENTAL_FILL_WATERMARK)
+     .delete())
+
+
+def update_agent_login_state(session):
+    """
+    Fold the agent login and logoff events added to queue_log since the
+    previous update into stat_agent_login_state.
+
+    This is the only writer of the login state. The getters only read it
+    and aggregate the events added since the last update themselves.
+    """
+    watermark = _get_watermark(session, _AGENT_LOGIN_STATE_WATERMARK)
+    last_id = watermark.queue_log_id
+
+    new_last_id = _get_committed_last_id(session, last_id)
+    if new_last_id is None or new_last_id <= last_id:
+        return
+
+    params = {'last_id': last_id, 'new_last_id': new_last_id}
+    session.execute(UPDATE_AGENT_LOGIN_STATE_QUERY, params)
+
+    watermark.queue_log_id = new_last_id
+    session.flush()
+
+
+def reset_agent_login_state(session):
+    session.query(StatAgentLoginState).delete()
+    (session
+     .query(StatWatermark)
+     .filter(StatWatermark.name == _AGENT_LOGIN_STATE_WATERMARK)
+     .delete())
+
+
+def _get_committed_last_id(session, last_id):
+    new_last_id = session.query(func.max(QueueLog.id)).scalar()
+    if new_last_id is None or new_last_id <= last_id:
+        return new_last_id
+
+    params = {'last_id': last_id, 'commit_lag': _QUEUE_LOG_COMMIT_LAG}
+    gap_start = session.execute(FIRST_UNCOMMITTED_QUEUE_LOG_GAP_QUERY, params).scalar()
+    if gap_start is not None:
+        return gap_start
+    return new_last_id
+
+
+def _get_watermark(session, name):
+    # the row lock serializes concurrent runs until their commit
+    query = (session
+             .query(StatWatermark)
+             .filter(StatWatermark.name == name)
+             .with_for_update()
+             .populate_existing())
+
+    watermark = query.first()
+    if watermark is None:
+        _insert_watermark(session, name)
+        watermark = query.one()
+    return watermark
+
+
+def _insert_watermark(session, name):
+    try:
+        with session.begin_nested():
+            session.add(StatWatermark(name=name, queue_log_id=0))
+    except IntegrityError:
+        # created by a concurrent run
+        pass
 
 
 def _run_sql_function_returning_void(session, start, end, function):
@@ -162,36 +540,73 @@ def _run_sql_function_returning_void(session, start, end, function):
      .first())
 
 
-def get_pause_intervals_in_range(session, start, end):
-    pause_in_range = '''\
-SELECT stat_agent.id AS agent,
-       CAST(MIN(pauseall) AS TIMESTAMP) AS pauseall,
-       CAST(unpauseall AS TIMESTAMP)
-  FROM (
-    SELECT agent, time AS pauseall,
-      (
-        SELECT time
-        FROM queue_log
-        WHERE event = 'UNPAUSEALL' AND
-          agent = pause_all.agent AND
-          time > pause_all.time
-        ORDER BY time ASC limit 1
-      ) AS unpauseall
-    FROM queue_log AS pause_all
-    WHERE event = 'PAUSEALL'
-    AND time >= :start
-    ORDER BY agent, time DESC
-  ) AS pauseall, stat_agent
-  WHERE stat_agent.name = agent
-  GROUP BY stat_agent.id, unpauseall
+PAUSE_INTERVALS_IN_RANGE_QUERY = '''\
+WITH
+range_events AS (
+    SELECT agent, event, timestamp
+    FROM queue_log
+    WHERE event IN ('PAUSEALL', 'UNPAUSEALL')
+      AND timestamp >= :start
+      AND timestamp <= :end
+),
+last_range_events AS (
+    SELECT DISTINCT ON (agent) agent, event
+    FROM range_events
+    ORDER BY agent, timestamp DESC
+),
+pause_events AS (
+    SELECT
+        agent,
+        event,
+        timestamp,
+        LAG(event) OVER (PARTITION BY agent ORDER BY timestamp) AS previous_event
+    FROM (
+        SELECT agent, event, timestamp
+        FROM range_events
+        UNION ALL
+        SELECT last_range_events.agent, 'UNPAUSEALL', next_unpause.timestamp
+        FROM last_range_events
+        CROSS JOIN LATERAL (
+            SELECT timestamp
+            FROM queue_log
+            WHERE agent = last_range_events.agent
+              AND event = 'UNPAUSEALL'
+              AND timestamp > :end
+            ORDER BY timestamp
+            LIMIT 1
+        ) AS next_unpause
+        WHERE last_range_events.event = 'PAUSEALL'
+    ) AS bounded_events
+),
+pause_transitions AS (
+    SELECT
+        agent,
+        event,
+        timestamp,
+        LEAD(timestamp) OVER (PARTITION BY agent ORDER BY timestamp) AS next_transition
+    FROM
+        pause_events
+    WHERE
+        previous_event IS NULL OR previous_event <> event
+)
+
+SELECT
+    stat_agent.id AS agent,
+    pause_transitions.timestamp AS pauseall,
+    pause_transitions.next_transition AS unpauseall
+FROM
+    pause_transitions
+INNER JOIN
+    stat_agent ON stat_agent.name = pause_transitions.agent
+WHERE
+    pause_transitions.event = 'PAUSEALL'
 '''
 
-    start = start.strftime(_STR_TIME_FMT)
-    end = end.strftime(_STR_TIME_FMT)
 
+def get_pause_intervals_in_range(session, start, end):
     rows = (session
             .query('agent', 'pauseall', 'unpauseall')
-            .from_statement(pause_in_range)
+            .from_statement(PAUSE_INTERVALS_IN_RANGE_QUERY)
             .params(start=start, end=end))
 
     results = {}
@@ -210,99 +625,40 @@ def get_login_intervals_in_range(session, start, end):
     completed_logins = _get_completed_logins(session, start, end)
     ongoing_logins = _get_ongoing_logins(session, start, end)
 
-    results = _merge_agent_statistics(
+    return _merge_agent_statistics(
         completed_logins,
         ongoing_logins,
     )
 
-    unique_result = {}
-
-    for agent, logins in results.iteritems():
-        logins = _pick_longest_with_same_end(logins)
-        unique_result[agent] = sorted(list(set(logins)))
-
-    return unique_result
-
 
 def _merge_agent_statistics(*args):
     result = {}
 
     for stat in args:
         for agent, logins in stat.iteritems():
-            if agent not in result:
-                result[agent] = logins
-            else:
-                result[agent].extend(logins)
+            result.setdefault(agent, []).extend(logins)
 
     for agent, logins in result.iteritems():
-        filtered_logins = _filter_overlap(logins)
-        result[agent] = filtered_logins
-
-    return result
-
-
-def _filter_overlap(items):
-    starts = []
-    ends = []
-    result = []
-    stack = []
-
-    for item in items:
-        starts.append(item[0])
-        ends.append(item[1])
-
-    starts = sorted(starts)
-    ends = sorted(ends)
-
-    starts.reverse()
-    ends.reverse()
-
-    while starts or ends:
-        if starts and ends and starts[-1] < ends[-1]:
-            start = starts.pop()
-            stack.append(start)
-        else:
-            end = ends.pop()
-            start = stack.pop()
-            if not stack:
-                result.append((start, end))
+        result[agent] = interval.union(logins)
 
     return result
 
 
-def _pick_longest_with_same_end(logins):
-    """
-    Workaround a bug in chan_agent.so where an agent could log multiple times
-    Fixed in XiVO 12.18
-    """
-    end_time_map = {}
-    for start, end in logins:
-        if end not in end_time_map:
-            end_time_map[end] = []
-        end_time_map[end].append(start)
-
-    res = []
-    for end, starts in end_time_map.iteritems():
-        res.append((min(starts), end))
-
-    return res
-
-
 def _get_completed_logins(session, start, end):
     completed_logins_query = '''\
 WITH agent_logins AS (
 SELECT
     agent,
-    CAST(time AS TIMESTAMP) AS logout_timestamp,
-    CAST(time as TIMESTAMP) - (data2 || ' seconds')::INTERVAL AS login_timestamp
+    timestamp AS logout_timestamp,
+    timestamp - (data2 || ' seconds')::INTERVAL AS login_timestamp
 FROM
     queue_log
 WHERE
     event like 'AGENT%LOGOFF'
     AND data1 <> ''
     AND data2::INTEGER > 0
-    AND time > :start
-    AND time <= :end
+    AND timestamp > :start
+    AND timestamp <= :end
 )
 
 SELECT
@@ -317,21 +673,17 @@ ORDER BY
     agent_logins.agent, agent_logins.logout_timestamp
 '''
 
-    formatted_start = start.strftime(_STR_TIME_FMT)
-    formatted_end = end.strftime(_STR_TIME_FMT)
-
     rows = (session.query('agent', 'login_timestamp', 'logout_timestamp')
             .from_statement(completed_logins_query)
-            .params(start=formatted_start, end=formatted_end))
+            .params(start=start, end=end))
 
     results = {}
 
-    for row in rows.all():
-        if row.agent not in results:
-            results[row.agent] = []
-        login = row.login_timestamp if row.login_timestamp > start else start
-        logout = row.logout_timestamp if row.logout_timestamp < end else end
-        results[row.agent].append((login, logout))
+    for row in stream_query(rows):
+        results.setdefault(row.agent, []).append((row.login_timestamp, row.logout_timestamp))
+
+    for agent, logins in results.iteritems():
+        results[agent] = interval.clip(logins, start, end)
 
     return results
 
@@ -364,31 +716,11 @@ def _get_ongoing_logins(session, start, end):
 
 
 def _get_last_logins_and_logouts(session, start, end):
-    query = '''\
-SELECT
-  stat_agent.id AS agent,
-  CAST(MAX(case when event like '%LOGIN' then time end) AS TIMESTAMP) AS login,
-  CAST(MAX(case when event like '%LOGOFF' then time end) AS TIMESTAMP) AS logout
-FROM
-  stat_agent
-JOIN
-  queue_log ON queue_log.agent = stat_agent.name
-WHERE
-  event LIKE 'AGENT%'
-GROUP BY
-  stat_agent.id
-HAVING
-  MAX(case when event like '%LOGIN' then time end) < :end
-'''
-
-    start = start.strftime(_STR_TIME_FMT)
-    end = end.strftime(_STR_TIME_FMT)
-
     rows = session.query(
         'agent',
         'login',
         'logout',
-    ).from_statement(query).params(start=start, end=end)
+    ).from_statement(LAST_LOGINS_AND_LOGOUTS_QUERY).params(end=end, watermark=_AGENT_LOGIN_STATE_WATERMARK)
 
     agent_last_logins = {}
     agent_last_logouts = {}
@@ -33,6 +33,10 @@ def id_from_name(session, queue_name):
     return res[0].id
 
 
+def ids_by_name(session):
+    return dict((name, queue_id) for queue_id, name in session.query(StatQueue.id, StatQueue.name))
+
+
 def insert_if_missing(session, all_queues):
     all_queues = set(all_queues)
     old_queues = set(r[0] for r in session.query(distinct(StatQueue.name)))
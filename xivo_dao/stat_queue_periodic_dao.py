@@ -16,28 +16,46 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
 from xivo_dao.alchemy.stat_queue_periodic import StatQueuePeriodic
+from xivo_dao.helpers.bulk import bulk_insert
 from sqlalchemy.sql.functions import max
 
 
 def insert_stats(session, stats, period_start):
     for queue_id, queue_stats in stats.iteritems():
-        entry = StatQueuePeriodic()
-        entry.time = period_start
-        entry.abandoned = queue_stats.get('abandoned', 0)
-        entry.answered = queue_stats.get('answered', 0)
-        entry.full = queue_stats.get('full', 0)
-        entry.joinempty = queue_stats.get('joinempty', 0)
-        entry.leaveempty = queue_stats.get('leaveempty', 0)
-        entry.closed = queue_stats.get('closed', 0)
-        entry.timeout = queue_stats.get('timeout', 0)
-        entry.divert_ca_ratio = queue_stats.get('divert_ca_ratio', 0)
-        entry.divert_waittime = queue_stats.get('divert_waittime', 0)
-        entry.total = queue_stats['total']
-        entry.queue_id = queue_id
+        entry = StatQueuePeriodic(**_build_row(period_start, queue_id, queue_stats))
 
         session.add(entry)
 
 
+def bulk_insert_stats(session, periods_stats):
+    """
+    periods_stats is an iterable of (period_start, stats) tuples, stats
+    being the same dict as in insert_stats.
+    """
+    rows = (_build_row(period_start, queue_id, queue_stats)
+            for period_start, stats in periods_stats
+            for queue_id, queue_stats in stats.iteritems())
+
+    return bulk_insert(session, StatQueuePeriodic.__table__, rows)
+
+
+def _build_row(period_start, queue_id, queue_stats):
+    return {
+        'time': period_start,
+        'abandoned': queue_stats.get('abandoned', 0),
+        'answered': queue_stats.get('answered', 0),
+        'full': queue_stats.get('full', 0),
+        'joinempty': queue_stats.get('joinempty', 0),
+        'leaveempty': queue_stats.get('leaveempty', 0),
+        'closed': queue_stats.get('closed', 0),
+        'timeout': queue_stats.get('timeout', 0),
+        'divert_ca_ratio': queue_stats.get('divert_ca_ratio', 0),
+        'divert_waittime': queue_stats.get('divert_waittime', 0),
+        'total': queue_stats['total'],
+        'queue_id': queue_id,
+    }
+
+
 def get_most_recent_time(session):
     res = session.query(max(StatQueuePeriodic.time)).first()[0]
     if res is None:
@@ -51,3 +69,11 @@ def clean_table(session):
 
 def remove_after(session, date):
     session.query(StatQueuePeriodic).filter(StatQueuePeriodic.time >= date).delete()
+
+
+def remove_between(session, start, end):
+    (session
+     .query(StatQueuePeriodic)
+     .filter(StatQueuePeriodic.time >= start)
+     .filter(StatQueuePeriodic.time < end)
+     .delete())
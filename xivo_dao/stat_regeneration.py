@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+import logging
+
+from datetime import timedelta
+from itertools import chain
+from multiprocessing import Pool
+
+from xivo_dao import queue_log_dao
+from xivo_dao import stat_agent_periodic_dao
+from xivo_dao import stat_call_on_queue_dao
+from xivo_dao import stat_dao
+from xivo_dao import stat_queue_periodic_dao
+from xivo_dao.helpers import db_manager
+from xivo_dao.helpers.db_utils import session_scope
+from xivo_dao.helpers.period import last_period, split_by_period
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+CHUNK_SIZE = timedelta(days=1)
+PERIOD = timedelta(hours=1)
+
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+
+def regenerate(db_uri, start, end, workers=None, chunk_size=None):
+    """
+    Regenerate the call and periodic statistics of [start, end) in parallel.
+
+    The range is split in chunks of chunk_size, start being expected on a
+    period boundary. Each chunk is regenerated in its own transaction by one
+    of the worker processes, replacing the statistics previously stored for
+    it, so a failed chunk can be regenerated again on its own.
+
+    Returns the list of regenerated (chunk_start, chunk_end) tuples.
+    """
+    workers = workers or DEFAULT_WORKERS
+    chunks = list(split_in_chunks(start, end, chunk_size or CHUNK_SIZE))
+
+    with session_scope() as session:
+        # the only write of the login state, the workers only read it
+        stat_dao.update_agent_login_state(session)
+
+    pool = Pool(workers, initializer=db_manager.init_db, initargs=(db_uri,))
+    try:
+        regenerated = sorted(pool.imap_unordered(_regenerate_chunk, chunks))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    return regenerated
+
+
+def split_in_chunks(start, end, chunk_size):
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + chunk_size, end)
+        yield chunk_start, chunk_end
+        chunk_start = chunk_end
+
+
+def regenerate_chunk(session, start, end):
+    """
+    Replace the stat_call_on_queue, stat_queue_periodic and
+    stat_agent_periodic rows of [start, end).
+
+    Every call status is derived again from queue_log, the queues of the
+    abandoned and timed out calls are expected to be in stat_queue.
+    """
+    last = end - _ONE_MICROSECOND
+
+    stat_call_on_queue_dao.remove_between(session, start, end)
+    stat_queue_periodic_dao.remove_between(session, start, end)
+    stat_agent_periodic_dao.remove_between(session, start, end)
+
+    stat_dao.fill_simple_calls(session, start, last)
+    stat_dao.fill_answered_calls(session, start, last)
+    stat_dao.fill_leaveempty_calls(session, start, last)
+    stat_call_on_queue_dao.add_calls(session, _get_ended_calls(session, start, last))
+
+    queue_stats = stat_call_on_queue_dao.get_periodic_stats_hour(session, start, last)
+    stat_queue_periodic_dao.bulk_insert_stats(session, queue_stats.iteritems())
+
+    agent_stats = _get_agent_periodic_stats(session, start, last)
+    stat_agent_periodic_dao.bulk_insert_stats(session, agent_stats.iteritems())
+
+
+def _get_ended_calls(session, start, end):
+    ended_calls = chain(queue_log_dao.get_queue_abandoned_call(session, start, end),
+                        queue_log_dao.get_queue_timeout_call(session, start, end))
+    for call in ended_calls:
+        yield call['callid'], call['time'], call['queue_name'], call['event'], call['waittime']
+
+
+def _regenerate_chunk(chunk):
+    start, end = chunk
+    logger.debug('regenerating statistics from %s to %s', start, end)
+    with session_scope() as session:
+        regenerate_chunk(session, start, end)
+    return chunk
+
+
+def _get_agent_periodic_stats(session, start, end):
+    final_period = last_period(start, PERIOD, end)
+    results = queue_log_dao.get_wrapup_times(session, start, end, PERIOD)
+
+    intervals_by_name = [
+        ('login_time', stat_dao.get_login_intervals_in_range(session, start, end)),
+        ('pause_time', stat_dao.get_pause_intervals_in_range(session, start, end)),
+    ]
+
+    for name, intervals in intervals_by_name:
+        for agent_id, agent_intervals in intervals.iteritems():
+            for interval_start, interval_end in agent_intervals:
+                # a pause that is not ended yet has no end, it lasts until the end of the chunk
+                interval_end = interval_end or end + _ONE_MICROSECOND
+                periods = split_by_period(interval_start, interval_end, start, final_period, PERIOD)
+                for period_start, duration in periods:
+                    agent_times = results.setdefault(period_start, {}).setdefault(agent_id, {})
+                    agent_times[name] = agent_times.get(name, timedelta(0)) + duration
+
+    return results
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+import logging
+import os
+import time
+import unittest
+
+from xivo_dao.tests.test_dao import DAOTestCase
+
+logger = logging.getLogger(__name__)
+
+RUN_BENCHMARKS = os.getenv('XIVO_BENCHMARK', '0') == '1'
+
+
+# results are logged, run with nosetests --debug=xivo_dao.tests.benchmark to see them
+@unittest.skipUnless(RUN_BENCHMARKS, 'set XIVO_BENCHMARK=1 to run the benchmarks')
+class BenchmarkTestCase(DAOTestCase):
+
+    ROUNDS = 1
+
+    def timed(self, function, *args):
+        '''
+        Call function ROUNDS times and return the result of the last call
+        with the shortest duration in seconds.
+        '''
+        durations = []
+        for _ in range(self.ROUNDS):
+            self.session.expire_all()
+            start = time.time()
+            result = function(*args)
+            durations.append(time.time() - start)
+        return result, min(durations)
+
+    def report(self, message, *args):
+        logger.info('%s: ' + message, self.id(), *args)
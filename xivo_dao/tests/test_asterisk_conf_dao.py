@@ -20,16 +20,23 @@ import uuid
 
 from contextlib import contextmanager
 from hamcrest import assert_that, contains, equal_to, has_entries, \
-    contains_inanyorder, has_length, none, has_properties, has_items
+    contains_inanyorder, has_length, none, has_properties, has_item, has_items, is_not
 
 from mock import patch
+from sqlalchemy import orm
+from sqlalchemy.engine import create_engine
+
 from xivo_dao import asterisk_conf_dao
 from xivo_dao.alchemy.agentqueueskill import AgentQueueSkill
 from xivo_dao.alchemy.iaxcallnumberlimits import IAXCallNumberLimits
+from xivo_dao.alchemy.pickup_membership_version import PickupMembershipVersion
 from xivo_dao.alchemy.queuepenalty import QueuePenalty
+from xivo_dao.alchemy.queuemember import QueueMember
 from xivo_dao.alchemy.queuepenaltychange import QueuePenaltyChange
 from xivo_dao.alchemy.func_key_dest_custom import FuncKeyDestCustom
-from xivo_dao.tests.test_dao import DAOTestCase
+from xivo_dao.alchemy.staticiax import StaticIAX
+from xivo_dao.alchemy.user_line import UserLine
+from xivo_dao.tests.test_dao import DAOTestCase, TEST_DB_URL
 
 
 class UUIDMatcher(object):
@@ -334,6 +341,131 @@ class TestFindSccpSpeeddialSettings(DAOTestCase):
         return row
 
 
+class TestPickupMembershipIndex(DAOTestCase, PickupHelperMixin):
+
+    def test_given_no_changes_then_index_is_not_rebuilt(self):
+        pickup = self.add_pickup()
+        ule = self.add_user_line_with_exten(protocol='sip')
+        self.add_pickup_member_user(pickup, ule.user_id)
+        asterisk_conf_dao.find_pickup_members('sip')
+
+        with patch('xivo_dao.asterisk_conf_dao._build_pickup_membership') as build:
+            asterisk_conf_dao.find_pickup_members('sip')
+            asterisk_conf_dao.find_pickup_members('sccp')
+
+        assert_that(build.called, equal_to(False))
+
+    def test_given_pickup_member_added_then_index_is_rebuilt(self):
+        pickup = self.add_pickup()
+        ule = self.add_user_line_with_exten(protocol='sip')
+        asterisk_conf_dao.find_pickup_members('sip')
+
+        category = self.add_pickup_member_user(pickup, ule.user_id)
+
+        pickup_members = asterisk_conf_dao.find_pickup_members('sip')
+
+        assert_that(pickup_members, equal_to({ule.line.protocolid: {category: set([pickup.id])}}))
+
+    def test_given_queue_member_removed_then_index_is_rebuilt(self):
+        pickup = self.add_pickup()
+        ule = self.add_user_line_with_exten(protocol='sip')
+        self.add_pickup_member_queue(pickup, ule.user_id)
+        asterisk_conf_dao.find_pickup_members('sip')
+
+        self.session.query(QueueMember).delete()
+        self.session.flush()
+
+        assert_that(asterisk_conf_dao.find_pickup_members('sip'), equal_to({}))
+
+    def test_given_user_line_removed_then_index_is_rebuilt(self):
+        pickup = self.add_pickup()
+        ule = self.add_user_line_with_exten(protocol='sip')
+        self.add_pickup_member_user(pickup, ule.user_id)
+        asterisk_conf_dao.find_pickup_members('sip')
+
+        self.session.delete(ule)
+        self.session.flush()
+
+        assert_that(asterisk_conf_dao.find_pickup_members('sip'), equal_to({}))
+
+    def test_given_agent_queue_member_changes_then_version_is_not_bumped(self):
+        queue = self.add_queuefeatures()
+        version = self._pickup_membership_version()
+
+        member = self.add_queue_member(queue_name=queue.name, usertype='agent', userid=1)
+        member.penalty = 5
+        self.session.flush()
+        self.session.delete(member)
+        self.session.flush()
+
+        assert_that(self._pickup_membership_version(), equal_to(version))
+
+    def test_given_unrelated_columns_change_then_version_is_not_bumped(self):
+        ule = self.add_user_line_with_exten(protocol='sip')
+        member = self.add_queue_member(usertype='user', userid=ule.user_id)
+        version = self._pickup_membership_version()
+
+        member.penalty = 5
+        ule.line.provisioningid = 123456
+        self.session.flush()
+
+        assert_that(self._pickup_membership_version(), equal_to(version))
+
+    def test_given_user_queue_member_moves_then_version_is_bumped(self):
+        member = self.add_queue_member(usertype='user')
+        version = self._pickup_membership_version()
+
+        member.queue_name = 'other'
+        self.session.flush()
+
+        assert_that(self._pickup_membership_version(), is_not(equal_to(version)))
+
+    def test_given_a_multi_row_statement_then_version_is_bumped_once(self):
+        for _ in range(3):
+            self.add_user_line_with_exten(protocol='sip')
+        version = self._pickup_membership_version()
+
+        self.session.query(UserLine).delete()
+
+        assert_that(self._pickup_membership_version(), equal_to(version + 1))
+
+    def _pickup_membership_version(self):
+        return self.session.query(PickupMembershipVersion.version).scalar()
+
+    def test_sip_user_settings_use_group_pickups(self):
+        pickup = self.add_pickup()
+        sip = self.add_usersip(category='user')
+        ule = self.add_user_line_with_exten(protocol='sip', protocolid=sip.id)
+        category = self.add_pickup_member_group(pickup, ule.user_id)
+
+        results = list(asterisk_conf_dao.find_indexed_sip_user_settings())
+
+        named_category = {'pickupgroup': 'namedpickupgroup', 'callgroup': 'namedcallgroup'}[category]
+        assert_that(results, contains(has_properties({named_category: str(pickup.id)})))
+
+    def test_sip_user_settings_use_queue_pickups(self):
+        pickup = self.add_pickup()
+        sip = self.add_usersip(category='user')
+        ule = self.add_user_line_with_exten(protocol='sip', protocolid=sip.id)
+        category = self.add_pickup_member_queue(pickup, ule.user_id)
+
+        results = list(asterisk_conf_dao.find_indexed_sip_user_settings())
+
+        named_category = {'pickupgroup': 'namedpickupgroup', 'callgroup': 'namedcallgroup'}[category]
+        assert_that(results, contains(has_properties({named_category: str(pickup.id)})))
+
+    def test_sip_user_settings_skip_commented_pickups(self):
+        pickup = self.add_pickup(commented=1)
+        sip = self.add_usersip(category='user')
+        ule = self.add_user_line_with_exten(protocol='sip', protocolid=sip.id)
+        self.add_pickup_member_user(pickup, ule.user_id)
+
+        results = list(asterisk_conf_dao.find_indexed_sip_user_settings())
+
+        assert_that(results, contains(has_properties(namedpickupgroup=None,
+                                                     namedcallgroup=None)))
+
+
 class TestAsteriskConfDAO(DAOTestCase, PickupHelperMixin):
 
     def test_find_pickup_members_empty(self):
@@ -1245,3 +1377,156 @@ class TestFindSipUserSettings(DAOTestCase, PickupHelperMixin):
 
         assert_that(pickup_groups, contains_inanyorder(str(pickup1.id),
                                                        str(pickup2.id)))
+
+
+class TestSettingsSnapshot(DAOTestCase, PickupHelperMixin):
+
+    def setUp(self):
+        super(TestSettingsSnapshot, self).setUp()
+        self.restart_in_repeatable_read()
+        self.add_extension(exten='*98', type='extenfeatures', typeval='vmusermsg')
+        self.add_sccp_general_settings(option_name='language', option_value='en_US')
+        self.add_sip_general_settings(var_name='autocreate_prefix', var_val='apv')
+        self.add_iax_general_settings(var_name='bindport', var_val='4569')
+        self.add_meetme_general_settings(var_name='audiobuffers', var_val='32')
+        self.add_meetme_general_settings(category='rooms', var_name='conf', var_val='1234')
+        self.add_voicemail_general_settings(var_name='maxmsg', var_val='100')
+        self.add_queue_general_settings(var_name='persistentmembers', var_val='yes')
+        self.add_features(var_name='atxfernoanswertimeout', var_val='15')
+        self.add_features(var_name='parkpos', var_val='701-750')
+        self.add_features(category='featuremap', var_name='disconnect', var_val='*0')
+
+        sccp_line = self.add_sccpline(name='1001', cid_num='1001')
+        sccp_user_line = self.add_user_line_with_exten(protocol='sccp', protocolid=sccp_line.id, exten='1001')
+        self.add_sccpdevice(line='1001')
+
+        sip = self.add_usersip(category='user')
+        sip_user_line = self.add_user_line_with_exten(protocol='sip', protocolid=sip.id, exten='1002')
+
+        pickup = self.add_pickup()
+        self.add_pickup_member_user(pickup, sccp_user_line.user_id, category='member')
+        self.add_pickup_member_user(pickup, sip_user_line.user_id, category='pickup')
+
+        self.add_queue(name='sales')
+        self.add_queue_member(queue_name='sales', interface='SIP/abc', usertype='user', userid=1, penalty=1, position=1)
+        self.add_queue_member(queue_name='sales', interface='SCCP/1001', usertype='user', userid=2, penalty=2, position=2)
+
+    def test_sections_match_the_per_function_settings(self):
+        snapshot = asterisk_conf_dao.load_settings_snapshot(self.session)
+
+        assert_that(snapshot['sip']['general'], equal_to(asterisk_conf_dao.find_sip_general_settings()))
+        assert_that(snapshot['sccp']['general'], equal_to(asterisk_conf_dao.find_sccp_general_settings()))
+        assert_that(snapshot['sccp']['lines'], equal_to(list(asterisk_conf_dao.find_sccp_line_settings())))
+        assert_that(snapshot['sccp']['devices'], equal_to(asterisk_conf_dao.find_sccp_device_settings()))
+        assert_that(snapshot['iax']['general'], equal_to(asterisk_conf_dao.find_iax_general_settings()))
+        assert_that(snapshot['meetme']['general'], equal_to(asterisk_conf_dao.find_meetme_general_settings()))
+        assert_that(snapshot['meetme']['rooms'], equal_to(asterisk_conf_dao.find_meetme_rooms_settings()))
+        assert_that(snapshot['voicemail']['general'], equal_to(asterisk_conf_dao.find_voicemail_general_settings()))
+        assert_that(snapshot['voicemail']['mailboxes'], equal_to(asterisk_conf_dao.find_voicemail_activated()))
+        assert_that(snapshot['queues']['general'], equal_to(asterisk_conf_dao.find_queue_general_settings()))
+        assert_that(snapshot['queues']['queues'], equal_to(asterisk_conf_dao.find_queue_settings()))
+        assert_that(snapshot['queues']['members']['sales'],
+                    equal_to(asterisk_conf_dao.find_queue_members_settings('sales')))
+        assert_that(snapshot['features']['features'], equal_to(asterisk_conf_dao.find_features_settings()))
+        assert_that(snapshot['features']['parking'], equal_to(asterisk_conf_dao.find_parking_settings()))
+
+    def test_sections_are_read_from_one_snapshot(self):
+        engine = create_engine(TEST_DB_URL)
+        reader = orm.Session(bind=engine.connect().execution_options(isolation_level='REPEATABLE READ'))
+        writer = engine.connect()
+        read_sccp_snapshot = asterisk_conf_dao._sccp_snapshot
+
+        def read_sccp_snapshot_then_commit_an_iax_setting(session):
+            sccp = read_sccp_snapshot(session)
+            writer.execute(StaticIAX.__table__.insert().values(filename='iax.conf',
+                                                               category='general',
+                                                               var_name='snapshot_test',
+                                                               var_val='yes'))
+            return sccp
+
+        try:
+            with patch('xivo_dao.asterisk_conf_dao._sccp_snapshot', read_sccp_snapshot_then_commit_an_iax_setting):
+                snapshot = asterisk_conf_dao.load_settings_snapshot(reader)
+        finally:
+            reader.close()
+            writer.execute(StaticIAX.__table__.delete().where(StaticIAX.var_name == 'snapshot_test'))
+            writer.close()
+            engine.dispose()
+
+        assert_that(snapshot['iax']['general'], is_not(has_item(has_entries(var_name='snapshot_test'))))
+
+    def test_read_committed_transaction_is_refused(self):
+        engine = create_engine(TEST_DB_URL)
+        reader = orm.Session(bind=engine)
+        try:
+            self.assertRaises(ValueError, asterisk_conf_dao.load_settings_snapshot, reader)
+        finally:
+            reader.close()
+            engine.dispose()
+
+    def test_sip_users_are_plain_dicts(self):
+        snapshot = asterisk_conf_dao.load_settings_snapshot(self.session)
+
+        [expected] = asterisk_conf_dao.find_indexed_sip_user_settings()
+        assert_that(snapshot['sip']['users'], contains(has_entries(
+            expected.UserSIP.todict(exclude=['options']),
+            options=expected.UserSIP._options,
+            line_context=expected.context,
+            number=expected.number,
+            uuid=expected.uuid,
+            mailbox=expected.mailbox,
+            namedpickupgroup=expected.namedpickupgroup,
+            namedcallgroup=expected.namedcallgroup,
+        )))
+
+
+class TestStreamEndpointSettings(DAOTestCase, PickupHelperMixin):
+
+    def test_stream_sip_user_settings(self):
+        pickup = self.add_pickup()
+        sip = self.add_usersip(category='user')
+        ule = self.add_user_line_with_exten(protocol='sip', protocolid=sip.id, exten='1000')
+        self.add_pickup_member_user(pickup, ule.user_id, category='member')
+        self.add_usersip(category='trunk')
+
+        results = list(asterisk_conf_dao.stream_sip_user_settings())
+
+        assert_that(results, contains(has_entries(id=sip.id,
+                                                  name=sip.name,
+                                                  number='1000',
+                                                  line_context='foocontext',
+                                                  namedpickupgroup=str(pickup.id),
+                                                  namedcallgroup=none())))
+
+    def test_stream_sip_user_settings_in_batches(self):
+        sips = [self.add_usersip(category='user') for _ in range(5)]
+        for sip in sips:
+            self.add_line(protocol='sip', protocolid=sip.id)
+
+        results = asterisk_conf_dao.stream_sip_user_settings(batch_size=2)
+
+        assert_that([result['id'] for result in results],
+                    contains_inanyorder(*[sip.id for sip in sips]))
+
+    def test_stream_sip_authentication_settings(self):
+        self.add_sip_authentication(usersip_id=1)
+
+        results = list(asterisk_conf_dao.stream_sip_authentication_settings())
+
+        assert_that(results, equal_to(asterisk_conf_dao.find_sip_authentication_settings()))
+
+    def test_stream_sccp_line_settings(self):
+        sccp_line = self.add_sccpline(cid_num='1234')
+        self.add_user_line_with_exten(protocol='sccp', protocolid=sccp_line.id, exten='1234')
+
+        results = list(asterisk_conf_dao.stream_sccp_line_settings(batch_size=1))
+
+        assert_that(results, equal_to(list(asterisk_conf_dao.find_sccp_line_settings())))
+
+    def test_stream_iax_trunk_settings(self):
+        self.add_useriax(category='trunk')
+        self.add_useriax(category='user')
+
+        results = list(asterisk_conf_dao.stream_iax_trunk_settings())
+
+        assert_that(results, equal_to(asterisk_conf_dao.find_iax_trunk_settings()))
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from xivo_dao import asterisk_conf_dao
+from xivo_dao.tests.benchmark import BenchmarkTestCase
+
+
+class TestSettingsSnapshotBenchmark(BenchmarkTestCase):
+
+    SIP_USER_COUNT = 300
+    SCCP_USER_COUNT = 100
+    QUEUE_COUNT = 20
+    MEMBERS_PER_QUEUE = 15
+    ROUNDS = 5
+
+    def setUp(self):
+        super(TestSettingsSnapshotBenchmark, self).setUp()
+        self.restart_in_repeatable_read()
+        self.add_extension(exten='*98', type='extenfeatures', typeval='vmusermsg')
+
+        for number in range(self.SIP_USER_COUNT):
+            sip = self.add_usersip(category='user')
+            self.add_user_line_with_exten(protocol='sip', protocolid=sip.id, exten=str(10000 + number))
+
+        for number in range(self.SCCP_USER_COUNT):
+            exten = str(20000 + number)
+            sccp_line = self.add_sccpline(name=exten, cid_num=exten)
+            self.add_user_line_with_exten(protocol='sccp', protocolid=sccp_line.id, exten=exten)
+            self.add_sccpdevice(line=exten)
+
+        self.queue_names = []
+        for number in range(self.QUEUE_COUNT):
+            queue = self.add_queue(name='queue%s' % number)
+            self.queue_names.append(queue.name)
+            for member in range(self.MEMBERS_PER_QUEUE):
+                self.add_queue_member(queue_name=queue.name,
+                                      interface='SIP/%s-%s' % (number, member),
+                                      usertype='user',
+                                      userid=member,
+                                      position=member)
+
+    def test_snapshot_against_per_function_settings(self):
+        _, per_function_duration = self.timed(self._per_function_settings)
+        _, snapshot_duration = self.timed(asterisk_conf_dao.load_settings_snapshot, self.session)
+
+        self.report('%s sip users, %s sccp users, %s queues: per function %.3fs, snapshot %.3fs',
+                    self.SIP_USER_COUNT, self.SCCP_USER_COUNT, self.QUEUE_COUNT,
+                    per_function_duration, snapshot_duration)
+
+    def test_stream_against_orm_endpoint_settings(self):
+        _, orm_duration = self.timed(lambda: list(asterisk_conf_dao.find_sip_user_settings()))
+        _, stream_duration = self.timed(lambda: list(asterisk_conf_dao.stream_sip_user_settings()))
+
+        self.report('%s sip users: orm %.3fs, stream %.3fs', self.SIP_USER_COUNT, orm_duration, stream_duration)
+
+    def _per_function_settings(self):
+        asterisk_conf_dao.find_sip_general_settings()
+        asterisk_conf_dao.find_sip_authentication_settings()
+        list(asterisk_conf_dao.find_sip_user_settings())
+        asterisk_conf_dao.find_sccp_general_settings()
+        list(asterisk_conf_dao.find_sccp_line_settings())
+        asterisk_conf_dao.find_sccp_device_settings()
+        asterisk_conf_dao.find_sccp_speeddial_settings()
+        asterisk_conf_dao.find_iax_general_settings()
+        asterisk_conf_dao.find_iax_trunk_settings()
+        asterisk_conf_dao.find_iax_calllimits_settings()
+        asterisk_conf_dao.find_queue_general_settings()
+        asterisk_conf_dao.find_queue_settings()
+        asterisk_conf_dao.find_queue_skillrule_settings()
+        asterisk_conf_dao.find_queue_penalty_settings()
+        asterisk_conf_dao.find_agent_queue_skills_settings()
+        asterisk_conf_dao.find_queue_penalties_settings()
+        for queue_name in self.queue_names:
+            asterisk_conf_dao.find_queue_members_settings(queue_name)
+        asterisk_conf_dao.find_meetme_general_settings()
+        asterisk_conf_dao.find_meetme_rooms_settings()
+        asterisk_conf_dao.find_voicemail_general_settings()
+        asterisk_conf_dao.find_voicemail_activated()
+        asterisk_conf_dao.find_features_settings()
+        asterisk_conf_dao.find_parking_settings()
@@ -149,6 +149,12 @@ class DAOTestCase(unittest.TestCase):
         self.session.remove()
         self.trans.rollback()
 
+    def restart_in_repeatable_read(self):
+        # the pool checkout ping has already queried in the first transaction
+        self.trans.rollback()
+        self.trans = self.connection.begin()
+        self.connection.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+
     def add_admin(self, **kwargs):
         admin = User(**kwargs)
         self.add_me(admin)
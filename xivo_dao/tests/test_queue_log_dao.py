@@ -144,6 +144,27 @@ class TestQueueLogDAO(DAOTestCase):
 
         self.assertEqual(result, expected)
 
+    def test_get_wrapup_time_spanning_many_periods(self):
+        _, agent_id = self._insert_agent('Agent/1')
+        start = datetime(2012, 10, 1, 6)
+        end = datetime(2012, 10, 1, 7, 59, 59, 999999)
+        queue_log_data = '''\
+| time                       | callid | queuename | agent   | event       | data1 | data2 | data3 | data4 | data5 |
+| 2012-10-01 06:59:00.000000 | NONE   | NONE      | Agent/1 | WRAPUPSTART |   120 |       |       |       |       |
+'''
+        self._insert_queue_log_data(queue_log_data)
+
+        result = queue_log_dao.get_wrapup_times(self.session, start, end, timedelta(seconds=30))
+
+        expected = {
+            datetime(2012, 10, 1, 6, 59): {agent_id: {'wrapup_time': timedelta(seconds=30)}},
+            datetime(2012, 10, 1, 6, 59, 30): {agent_id: {'wrapup_time': timedelta(seconds=30)}},
+            datetime(2012, 10, 1, 7): {agent_id: {'wrapup_time': timedelta(seconds=30)}},
+            datetime(2012, 10, 1, 7, 0, 30): {agent_id: {'wrapup_time': timedelta(seconds=30)}},
+        }
+
+        self.assertEqual(result, expected)
+
     def test_get_first_time(self):
         self.assertRaises(LookupError, queue_log_dao.get_first_time, self.session)
 
@@ -365,6 +386,49 @@ class TestQueueLogDAO(DAOTestCase):
         self.assertEqual(result.data4, '4')
         self.assertEqual(result.data5, '5')
 
+    def test_insert_entry_sets_timestamp(self):
+        queue_log_dao.insert_entry('2012-07-01 08:01:01.123456', 'callid', 'queue', 'agent', 'event')
+
+        result = self.session.query(QueueLog.timestamp).filter(QueueLog.callid == 'callid').scalar()
+
+        self.assertEqual(result, datetime(2012, 7, 1, 8, 1, 1, 123456))
+
+    def test_timestamp_follows_time_updates(self):
+        self._insert_entry_queue_full(datetime(2012, 7, 1, 8, 1, 1), 'update_time', 'q1')
+
+        (self.session.query(QueueLog)
+         .filter(QueueLog.callid == 'update_time')
+         .update({'time': '2012-07-01 09:01:01.000000'}, synchronize_session=False))
+
+        result = self.session.query(QueueLog.timestamp).filter(QueueLog.callid == 'update_time').scalar()
+
+        self.assertEqual(result, datetime(2012, 7, 1, 9, 1, 1))
+
+    def test_timestamp_is_fetched_after_insert(self):
+        entry = QueueLog(time='2012-07-01 08:01:01.000000', callid='fetched', queuename='q1', event='FULL')
+        self.add_me(entry)
+
+        self.assertEqual(entry.timestamp, datetime(2012, 7, 1, 8, 1, 1))
+
+    def test_backfill_timestamp(self):
+        self._insert_entry_queue_full(datetime(2012, 7, 1, 8, 1, 1), 'backfill1', 'q1')
+        self._insert_entry_queue_full(datetime(2012, 7, 1, 8, 2, 1), 'backfill2', 'q1')
+        self._insert_entry_queue_full(datetime(2012, 7, 1, 8, 3, 1), 'backfill3', 'q1')
+        self.add_me(QueueLog(time='not a time', callid='backfill4', queuename='q1', event='FULL'))
+        self.session.execute('UPDATE queue_log SET timestamp = NULL')
+
+        result = queue_log_dao.backfill_timestamp(batch_size=2)
+
+        self.assertEqual(result, 4)
+        rows = (self.session.query(QueueLog.callid, QueueLog.timestamp)
+                .filter(QueueLog.callid.like('backfill%'))
+                .order_by(QueueLog.callid)
+                .all())
+        self.assertEqual(rows, [('backfill1', datetime(2012, 7, 1, 8, 1, 1)),
+                                ('backfill2', datetime(2012, 7, 1, 8, 2, 1)),
+                                ('backfill3', datetime(2012, 7, 1, 8, 3, 1)),
+                                ('backfill4', None)])
+
     def test_hours_with_calls(self):
         start = datetime(2012, 01, 01)
         end = datetime(2012, 6, 30, 23, 59, 59, 999999)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+import unittest
+
+from hamcrest import assert_that, equal_to
+from mock import ANY, patch, sentinel
+
+from xivo_dao import queue_statistic_dao
+
+
+@patch('xivo_dao.queue_statistic_dao.time')
+@patch('xivo_dao.queue_statistic_dao._query_statistics')
+class TestGetStatistics(unittest.TestCase):
+
+    def setUp(self):
+        queue_statistic_dao.clear_cache()
+
+    def tearDown(self):
+        queue_statistic_dao.clear_cache()
+
+    def test_statistics_are_reused_within_the_ttl(self, query_statistics, time):
+        query_statistics.return_value = sentinel.statistics
+        time.time.side_effect = [1000.0, 1001.0]
+
+        first = queue_statistic_dao.get_statistics('q1', 3600, 20)
+        second = queue_statistic_dao.get_statistics('q1', 3600, 20)
+
+        assert_that(first, equal_to(sentinel.statistics))
+        assert_that(second, equal_to(sentinel.statistics))
+        query_statistics.assert_called_once_with(ANY, 'q1', 3600, 20)
+
+    def test_statistics_are_refreshed_after_the_ttl(self, query_statistics, time):
+        query_statistics.side_effect = [sentinel.old, sentinel.new]
+        time.time.side_effect = [1000.0, 1000.0 + queue_statistic_dao.CACHE_TTL]
+
+        queue_statistic_dao.get_statistics('q1', 3600, 20)
+        result = queue_statistic_dao.get_statistics('q1', 3600, 20)
+
+        assert_that(result, equal_to(sentinel.new))
+
+    def test_statistics_are_cached_per_parameters(self, query_statistics, time):
+        query_statistics.side_effect = [sentinel.q1, sentinel.q2]
+        time.time.return_value = 1000.0
+
+        queue_statistic_dao.get_statistics('q1', 3600, 20)
+        result = queue_statistic_dao.get_statistics('q2', 3600, 20)
+
+        assert_that(result, equal_to(sentinel.q2))
+
+    def test_clear_cache_drops_the_locks(self, query_statistics, time):
+        time.time.return_value = 1000.0
+        queue_statistic_dao.get_statistics('q1', 3600, 20)
+
+        queue_statistic_dao.clear_cache()
+
+        assert_that(queue_statistic_dao._cache, equal_to({}))
+        assert_that(queue_statistic_dao._locks, equal_to({}))
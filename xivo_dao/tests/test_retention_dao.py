@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from datetime import datetime as dt
+from datetime import timedelta
+
+from hamcrest import assert_that, contains, contains_inanyorder, equal_to, has_entries
+from mock import Mock
+
+from xivo_dao import retention_dao
+from xivo_dao.alchemy.call_log import CallLog
+from xivo_dao.alchemy.cel import CEL
+from xivo_dao.alchemy.queue_log import QueueLog
+from xivo_dao.alchemy.stat_agent_login_state import StatAgentLoginState
+from xivo_dao.alchemy.stat_call_on_queue_rollup import StatCallOnQueueRollup
+from xivo_dao.alchemy.stat_queue import StatQueue
+from xivo_dao.alchemy.stat_queue_periodic import StatQueuePeriodic
+from xivo_dao.tests.test_dao import DAOTestCase
+
+
+class TestPurge(DAOTestCase):
+
+    def test_purge_removes_rows_older_than_cutoff(self):
+        cutoff = dt(2016, 1, 1)
+        old_cel_ids = [self.add_cel(id=i, eventtime=cutoff - timedelta(days=1)) for i in [1, 2, 3, 50]]
+        new_cel_id = self.add_cel(id=4, eventtime=cutoff)
+        self.add_me_all([
+            QueueLog(time='2015-12-31 23:59:59.000000', callid='old'),
+            QueueLog(time='2016-01-01 00:00:00.000000', callid='new'),
+        ])
+        progress = Mock()
+
+        removed = retention_dao.purge(cutoff, tables=['cel', 'queue_log'],
+                                      batch_size=2, progress=progress)
+
+        assert_that(removed, equal_to({'cel': len(old_cel_ids), 'queue_log': 1}))
+        assert_that(self.session.query(CEL.id).all(), contains((new_cel_id,)))
+        assert_that(self.session.query(QueueLog.callid).all(), contains(('new',)))
+        progress.assert_any_call('cel', 2)
+        progress.assert_any_call('cel', 4)
+
+    def test_purge_all_tables(self):
+        cutoff = dt(2016, 1, 1)
+        queue = StatQueue(name='q1')
+        self.add_me(queue)
+        self.add_me_all([
+            CallLog(date=cutoff - timedelta(hours=1), duration=timedelta(0)),
+            CallLog(date=cutoff + timedelta(hours=1), duration=timedelta(0)),
+            StatQueuePeriodic(time=cutoff - timedelta(hours=1), queue_id=queue.id, total=1),
+        ])
+
+        removed = retention_dao.purge(cutoff)
+
+        assert_that(removed, has_entries({'call_log': 1, 'stat_queue_periodic': 1, 'cel': 0}))
+        assert_that(self.session.query(CallLog.date).all(), contains((cutoff + timedelta(hours=1),)))
+
+    def test_purge_rollup_quarter_hours_before_cutoff(self):
+        cutoff = dt(2016, 1, 1, 0, 10)
+        self.add_me_all([
+            StatCallOnQueueRollup(bucket=dt(2015, 12, 31, 23, 45), status='full', total=1),
+            StatCallOnQueueRollup(bucket=dt(2016, 1, 1), status='full', total=1),
+        ])
+
+        removed = retention_dao.purge(cutoff, tables=['stat_call_on_queue_rollup'])
+
+        assert_that(removed, equal_to({'stat_call_on_queue_rollup': 1}))
+        assert_that(self.session.query(StatCallOnQueueRollup.bucket).all(), contains((dt(2016, 1, 1),)))
+
+    def test_purge_queue_log_rows_without_timestamp_on_their_time(self):
+        cutoff = dt(2016, 1, 1)
+        self.add_me_all([
+            QueueLog(time='2015-12-31 23:59:59.000000', callid='old'),
+            QueueLog(time='2016-01-01 00:00:00.000000', callid='new'),
+        ])
+        self.session.execute('UPDATE queue_log SET timestamp = NULL')
+
+        removed = retention_dao.purge(cutoff, tables=['queue_log'])
+
+        assert_that(removed, equal_to({'queue_log': 1}))
+        assert_that(self.session.query(QueueLog.callid).all(), contains(('new',)))
+
+    def test_purge_login_state_of_agents_logged_out_before_cutoff(self):
+        cutoff = dt(2016, 1, 1)
+        self.add_me_all([
+            StatAgentLoginState(agent='Agent/1', last_login=dt(2015, 1, 1), last_logout=dt(2015, 1, 2)),
+            StatAgentLoginState(agent='Agent/2', last_login=dt(2015, 1, 2), last_logout=dt(2015, 1, 1)),
+            StatAgentLoginState(agent='Agent/3', last_login=dt(2015, 1, 1)),
+            StatAgentLoginState(agent='Agent/4', last_login=dt(2015, 1, 1), last_logout=cutoff),
+        ])
+
+        removed = retention_dao.purge(cutoff, tables=['stat_agent_login_state'])
+
+        assert_that(removed, equal_to({'stat_agent_login_state': 1}))
+        assert_that(self.session.query(StatAgentLoginState.agent).all(),
+                    contains_inanyorder(('Agent/2',), ('Agent/3',), ('Agent/4',)))
+
+    def test_purge_leaves_the_caller_session_alone(self):
+        cutoff = dt(2016, 1, 1)
+        self.add_cel(eventtime=cutoff - timedelta(days=1))
+        pending = CallLog(date=cutoff + timedelta(hours=1), duration=timedelta(0))
+        self.session.add(pending)
+
+        removed = retention_dao.purge(cutoff, tables=['cel'])
+
+        assert_that(removed, equal_to({'cel': 1}))
+        assert_that(self.session.new, contains(pending))
+        assert_that(self.session.query(CEL.id).all(), contains())
@@ -91,6 +91,30 @@ class TestStatAgentPeriodicDAO(DAOTestCase):
         except LookupError:
             self.fail('Should have found a row')
 
+    def test_bulk_insert_stats(self):
+        _, agent_id = self._insert_agent_to_stat_agent()
+        periods_stats = [
+            (dt(2012, 1, 1, 1), {agent_id: {'login_time': timedelta(minutes=50),
+                                            'pause_time': timedelta(minutes=13)}}),
+            (dt(2012, 1, 1, 2), {agent_id: {'login_time': ONE_HOUR,
+                                            'wrapup_time': timedelta(seconds=30)}}),
+        ]
+
+        count = stat_agent_periodic_dao.bulk_insert_stats(self.session, iter(periods_stats))
+
+        self.assertEqual(count, 2)
+        result = (self.session.query(StatAgentPeriodic.time,
+                                     StatAgentPeriodic.login_time,
+                                     StatAgentPeriodic.pause_time,
+                                     StatAgentPeriodic.wrapup_time)
+                  .filter(StatAgentPeriodic.agent_id == agent_id)
+                  .order_by(StatAgentPeriodic.time)
+                  .all())
+        self.assertEqual(result, [
+            (dt(2012, 1, 1, 1), timedelta(minutes=50), timedelta(minutes=13), timedelta(0)),
+            (dt(2012, 1, 1, 2), ONE_HOUR, timedelta(0), timedelta(seconds=30)),
+        ])
+
     def test_clean_table(self):
         _, agent_id = self._insert_agent_to_stat_agent()
         stats = {
@@ -141,3 +165,17 @@ class TestStatAgentPeriodicDAO(DAOTestCase):
 
         self.assertEqual(res.count(), 1)
         self.assertEqual(res[0].time, dt(2012, 1, 1))
+
+    def test_remove_between(self):
+        _, agent_id = self._insert_agent_to_stat_agent()
+        stats = {agent_id: {'login_time': timedelta(minutes=15)}}
+
+        with flush_session(self.session):
+            for period_start in [dt(2012, 1, 1), dt(2012, 1, 2), dt(2012, 1, 3)]:
+                stat_agent_periodic_dao.insert_stats(self.session, stats, period_start)
+
+        stat_agent_periodic_dao.remove_between(self.session, dt(2012, 1, 2), dt(2012, 1, 3))
+
+        res = self.session.query(StatAgentPeriodic.time).order_by(StatAgentPeriodic.time)
+
+        self.assertEqual([row.time for row in res], [dt(2012, 1, 1), dt(2012, 1, 3)])
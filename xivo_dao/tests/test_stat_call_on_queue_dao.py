@@ -19,10 +19,13 @@ import datetime
 
 from hamcrest import assert_that
 from hamcrest import contains
+from hamcrest import contains_inanyorder
+from hamcrest import equal_to
 from sqlalchemy import func
 
 from xivo_dao import stat_call_on_queue_dao
 from xivo_dao.alchemy.stat_call_on_queue import StatCallOnQueue
+from xivo_dao.alchemy.stat_call_on_queue_rollup import StatCallOnQueueRollup
 from xivo_dao.alchemy.stat_queue import StatQueue
 from xivo_dao.alchemy.stat_agent import StatAgent
 from xivo_dao.tests.test_dao import DAOTestCase
@@ -122,6 +125,34 @@ class TestStatCallOnQueueDAO(DAOTestCase):
         self.assertEqual(res[0].callid, 'callid')
         self.assertEqual(res[0].waittime, 27)
 
+    def test_add_calls(self):
+        q1, q1_id = self._insert_queue_to_stat_queue('q1')
+        q2, q2_id = self._insert_queue_to_stat_queue('q2')
+        t1 = datetime.datetime(2012, 1, 1, 1, 1, 1)
+        t2 = datetime.datetime(2012, 1, 1, 1, 1, 2)
+        calls = [
+            ('callid_1', t1, q1, 'abandoned', 12),
+            ('callid_2', t2, q2, 'full', None),
+        ]
+
+        count = stat_call_on_queue_dao.add_calls(self.session, iter(calls))
+
+        self.assertEqual(count, 2)
+        res = (self.session.query(StatCallOnQueue.callid,
+                                  StatCallOnQueue.time,
+                                  StatCallOnQueue.queue_id,
+                                  StatCallOnQueue.status,
+                                  StatCallOnQueue.waittime)
+               .order_by(StatCallOnQueue.callid)
+               .all())
+        self.assertEqual(res, [('callid_1', t1, q1_id, 'abandoned', 12),
+                               ('callid_2', t2, q2_id, 'full', 0)])
+
+    def test_add_calls_unknown_queue(self):
+        calls = [('callid', datetime.datetime(2012, 1, 1), 'unknown', 'full', None)]
+
+        self.assertRaises(LookupError, stat_call_on_queue_dao.add_calls, self.session, calls)
+
     def test_get_periodic_stats_full(self):
         start = datetime.datetime(2012, 01, 01, 00, 00, 00)
         end = datetime.datetime(2012, 01, 01, 3, 0, 0)
@@ -222,6 +253,139 @@ class TestStatCallOnQueueDAO(DAOTestCase):
 
         self.assertEqual(stats_hour[start][queue_id]['total'], 9)
 
+    def test_get_periodic_stats_partial_quarter_hours(self):
+        start = datetime.datetime(2012, 1, 1, 0, 7)
+        end = datetime.datetime(2012, 1, 1, 0, 52)
+
+        queue_name, queue_id = self._insert_queue_to_stat_queue()
+
+        for minute_increment in [5, 8, 15, 22, 35, 50, 55]:
+            time = datetime.datetime(2012, 1, 1) + datetime.timedelta(minutes=minute_increment)
+            stat_call_on_queue_dao.add_full_call(self.session, 'callid%s' % minute_increment, time, queue_name)
+
+        stats_quarter_hour = stat_call_on_queue_dao.get_periodic_stats_quarter_hour(self.session, start, end)
+
+        self.assertEqual(stats_quarter_hour, {
+            datetime.datetime(2012, 1, 1, 0, 0): {queue_id: {'full': 1, 'total': 1}},
+            datetime.datetime(2012, 1, 1, 0, 15): {queue_id: {'full': 2, 'total': 2}},
+            datetime.datetime(2012, 1, 1, 0, 30): {queue_id: {'full': 1, 'total': 1}},
+            datetime.datetime(2012, 1, 1, 0, 45): {queue_id: {'full': 1, 'total': 1}},
+        })
+
+        stats_hour = stat_call_on_queue_dao.get_periodic_stats_hour(self.session, start, end)
+
+        self.assertEqual(stats_hour, {
+            datetime.datetime(2012, 1, 1): {queue_id: {'full': 5, 'total': 5}},
+        })
+
+    def test_get_periodic_stats_counts_calls_without_queue(self):
+        start = datetime.datetime(2012, 1, 1)
+        end = datetime.datetime(2012, 1, 1, 0, 52)
+        for minute_increment in [5, 50]:
+            time = start + datetime.timedelta(minutes=minute_increment)
+            self.add_me(StatCallOnQueue(callid='callid%s' % minute_increment, time=time, status='full'))
+
+        stats_quarter_hour = stat_call_on_queue_dao.get_periodic_stats_quarter_hour(self.session, start, end)
+
+        self.assertEqual(stats_quarter_hour, {
+            datetime.datetime(2012, 1, 1, 0, 0): {None: {'full': 1, 'total': 1}},
+            datetime.datetime(2012, 1, 1, 0, 45): {None: {'full': 1, 'total': 1}},
+        })
+
+    def test_rollup_follows_removed_calls(self):
+        start = datetime.datetime(2012, 1, 1)
+        queue_name, queue_id = self._insert_queue_to_stat_queue()
+        for minute_increment in [5, 20, 35, 65]:
+            time = start + datetime.timedelta(minutes=minute_increment)
+            stat_call_on_queue_dao.add_full_call(self.session, 'callid%s' % minute_increment, time, queue_name)
+
+        stat_call_on_queue_dao.remove_between(self.session,
+                                              start + datetime.timedelta(minutes=15),
+                                              start + datetime.timedelta(minutes=30))
+        stat_call_on_queue_dao.remove_after(self.session, start + datetime.timedelta(hours=1))
+
+        assert_that(self._rollup(), contains(
+            (start, queue_id, 'full', 1),
+            (start + datetime.timedelta(minutes=30), queue_id, 'full', 1),
+        ))
+
+    def test_rollup_follows_added_and_removed_callids(self):
+        start = datetime.datetime(2012, 1, 1)
+        queue_name, queue_id = self._insert_queue_to_stat_queue()
+        stat_call_on_queue_dao.add_calls(self.session, [
+            ('callid1', start, queue_name, 'abandoned', 3),
+            ('callid2', start + datetime.timedelta(minutes=5), queue_name, 'abandoned', 3),
+            ('callid3', start + datetime.timedelta(minutes=20), queue_name, 'timeout', 3),
+        ])
+
+        stat_call_on_queue_dao.remove_callids(self.session, ['callid2', 'callid3'])
+
+        assert_that(self._rollup(), contains(
+            (start, queue_id, 'abandoned', 1),
+        ))
+
+    def test_rollup_follows_updated_and_deleted_calls(self):
+        start = datetime.datetime(2012, 1, 1)
+        _, queue_id = self._insert_queue_to_stat_queue()
+        moved = StatCallOnQueue(callid='moved', time=start, status='full', queue_id=queue_id)
+        deleted = StatCallOnQueue(callid='deleted', time=start, status='full', queue_id=queue_id)
+        self.add_me(moved)
+        self.add_me(deleted)
+
+        moved.time = start + datetime.timedelta(minutes=20)
+        self.session.delete(deleted)
+        self.session.flush()
+
+        assert_that(self._rollup(), contains(
+            (start + datetime.timedelta(minutes=15), queue_id, 'full', 1),
+        ))
+
+    def test_refresh_rollup_range(self):
+        start = datetime.datetime(2012, 1, 1)
+        queue_name, queue_id = self._insert_queue_to_stat_queue()
+        for minute_increment in [0, 5, 20, 50]:
+            time = start + datetime.timedelta(minutes=minute_increment)
+            stat_call_on_queue_dao.add_full_call(self.session, 'callid%s' % minute_increment, time, queue_name)
+        self.session.query(StatCallOnQueueRollup).delete()
+
+        stat_call_on_queue_dao.refresh_rollup(self.session,
+                                              start + datetime.timedelta(minutes=5),
+                                              start + datetime.timedelta(minutes=20))
+
+        assert_that(self._rollup(), contains(
+            (start, queue_id, 'full', 2),
+            (start + datetime.timedelta(minutes=15), queue_id, 'full', 1),
+        ))
+
+    def test_refresh_rollup(self):
+        start = datetime.datetime(2012, 1, 1)
+        queue_name, queue_id = self._insert_queue_to_stat_queue()
+        for minute_increment in [5, 10, 20]:
+            time = start + datetime.timedelta(minutes=minute_increment)
+            stat_call_on_queue_dao.add_full_call(self.session, 'callid%s' % minute_increment, time, queue_name)
+        self.session.query(StatCallOnQueueRollup).delete()
+
+        stat_call_on_queue_dao.refresh_rollup(self.session)
+
+        assert_that(self._rollup(), contains(
+            (start, queue_id, 'full', 2),
+            (start + datetime.timedelta(minutes=15), queue_id, 'full', 1),
+        ))
+
+    def _rollup(self):
+        total = func.sum(StatCallOnQueueRollup.total)
+        return (self.session
+                .query(StatCallOnQueueRollup.bucket,
+                       StatCallOnQueueRollup.queue_id,
+                       StatCallOnQueueRollup.status,
+                       total)
+                .group_by(StatCallOnQueueRollup.bucket,
+                          StatCallOnQueueRollup.queue_id,
+                          StatCallOnQueueRollup.status)
+                .having(total != 0)
+                .order_by(StatCallOnQueueRollup.bucket, StatCallOnQueueRollup.status)
+                .all())
+
     def test_clean_table(self):
         start = datetime.datetime(2012, 01, 01, 00, 00, 00)
 
@@ -294,6 +458,23 @@ class TestStatCallOnQueueDAO(DAOTestCase):
 
         assert_that(result, contains(callid))
 
+    def test_that_backfilled_calls_are_found_between_date(self):
+        queue_name, _ = self._insert_queue_to_stat_queue()
+        for index in range(5):
+            stat_call_on_queue_dao.add_full_call(self.session, 'callid%s' % index,
+                                                 datetime.datetime(2012, 1, 1, 10, index), queue_name)
+        self.session.execute('UPDATE stat_call_on_queue SET end_time = NULL')
+
+        updated = stat_call_on_queue_dao.backfill_end_time(batch_size=2)
+
+        result = stat_call_on_queue_dao.find_all_callid_between_date(
+            self.session,
+            datetime.datetime(2012, 1, 1, 10, 0, 0),
+            datetime.datetime(2012, 1, 1, 10, 59, 59))
+
+        assert_that(updated, equal_to(5))
+        assert_that(result, contains_inanyorder('callid0', 'callid1', 'callid2', 'callid3', 'callid4'))
+
     def test_remove_callid_before(self):
         callid1 = 'callid1'
         callid2 = 'callid2'
@@ -310,3 +491,27 @@ class TestStatCallOnQueueDAO(DAOTestCase):
 
         callids = self.session.query(StatCallOnQueue.callid)
         self.assertEqual(callids.count(), 0)
+
+    def test_remove_callids_in_batches(self):
+        queue_name, _ = self._insert_queue_to_stat_queue()
+        for i in range(5):
+            stat_call_on_queue_dao.add_full_call(self.session, 'callid%s' % i, datetime.datetime(2012, 1, 1), queue_name)
+
+        stat_call_on_queue_dao.remove_callids(self.session, ['callid0', 'callid1', 'callid3', 'callid4'], batch_size=3)
+
+        callids = self.session.query(StatCallOnQueue.callid).all()
+        assert_that(callids, contains(('callid2',)))
+
+    def test_end_time_follows_the_call_durations(self):
+        _, queue_id = self._insert_queue_to_stat_queue()
+        call = StatCallOnQueue(callid='callid', time=datetime.datetime(2014, 1, 1, 10), ringtime=1,
+                               talktime=60, waittime=5, status='answered', queue_id=queue_id)
+        self.add_me(call)
+
+        self.session.refresh(call)
+        self.assertEqual(call.end_time, datetime.datetime(2014, 1, 1, 10, 1, 6))
+
+        call.talktime = 120
+        self.session.flush()
+        self.session.refresh(call)
+        self.assertEqual(call.end_time, datetime.datetime(2014, 1, 1, 10, 2, 6))
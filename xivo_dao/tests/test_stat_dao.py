@@ -19,6 +19,7 @@ import datetime
 from datetime import datetime as t
 
 from hamcrest import assert_that, equal_to
+from mock import ANY, patch
 
 from sqlalchemy import func
 
@@ -27,6 +28,7 @@ from xivo_dao import stat_call_on_queue_dao
 from xivo_dao.alchemy.queue_log import QueueLog
 from xivo_dao.alchemy.stat_agent import StatAgent
 from xivo_dao.alchemy.stat_call_on_queue import StatCallOnQueue
+from xivo_dao.alchemy.stat_pending_call import StatPendingCall
 from xivo_dao.alchemy.stat_queue import StatQueue
 from xivo_dao.helpers.db_utils import flush_session
 from xivo_dao.tests.test_dao import DAOTestCase
@@ -100,6 +102,124 @@ class TestFillAnsweredCall(DAOTestCase):
 
         assert_that(count, equal_to(1))
 
+    def test_that_filled_calls_are_counted_in_the_periodic_stats(self):
+        begin, end = t(2014, 7, 3, 11, 0, 0), t(2014, 7, 3, 11, 59, 59, 999999)
+        queue = StatQueue(name='swk_allemagne')
+        self.add_me_all([queue, self.enterqueue_event, self.connect_event, self.complete_agent_event])
+
+        stat_dao.fill_answered_calls(self.session, begin, end)
+
+        stats = stat_call_on_queue_dao.get_periodic_stats_hour(self.session, t(2014, 7, 3, 10, 0, 0), end)
+        assert_that(stats, equal_to({
+            t(2014, 7, 3, 10, 0, 0): {queue.id: {'answered': 1, 'total': 1}},
+        }))
+
+
+class TestFillCallsIncremental(DAOTestCase):
+
+    def setUp(self):
+        DAOTestCase.setUp(self)
+        stat_dao.reset_fill_calls_incremental(self.session)
+        self.queue = StatQueue(name='q1')
+        self.agent = StatAgent(name='Agent/1')
+        self.add_me_all([self.queue, self.agent])
+
+    def _queue_log(self, time, callid, event, agent='NONE', **data):
+        return QueueLog(time=time, callid=callid, queuename='q1', agent=agent, event=event, **data)
+
+    def _calls(self):
+        return (self.session
+                .query(StatCallOnQueue.callid,
+                       StatCallOnQueue.time,
+                       StatCallOnQueue.status,
+                       StatCallOnQueue.waittime)
+                .order_by(StatCallOnQueue.callid)
+                .all())
+
+    def test_nothing_to_process(self):
+        result = stat_dao.fill_calls_incremental(self.session)
+
+        assert_that(result, equal_to(None))
+
+    def test_call_ending_in_a_later_run_is_added_once(self):
+        self.add_me_all([
+            self._queue_log('2014-07-03 10:57:11.000000', '1', 'ENTERQUEUE'),
+            self._queue_log('2014-07-03 10:57:19.000000', '1', 'CONNECT', agent='Agent/1', data1='8'),
+        ])
+
+        first_range = stat_dao.fill_calls_incremental(self.session)
+
+        assert_that(first_range, equal_to((t(2014, 7, 3, 10, 57, 11), t(2014, 7, 3, 10, 57, 19))))
+        assert_that(self._calls(), equal_to([]))
+        assert_that(self.session.query(StatPendingCall.callid).all(), equal_to([('1',)]))
+
+        self.add_me_all([
+            self._queue_log('2014-07-03 11:06:10.000000', '1', 'COMPLETEAGENT', agent='Agent/1', data1='8', data2='531'),
+            self._queue_log('2014-07-03 11:07:00.000000', '2', 'FULL'),
+        ])
+
+        stat_dao.fill_calls_incremental(self.session)
+        stat_dao.fill_calls_incremental(self.session)
+
+        assert_that(self._calls(), equal_to([
+            ('1', t(2014, 7, 3, 10, 57, 11), 'answered', 8),
+            ('2', t(2014, 7, 3, 11, 7), 'full', 0),
+        ]))
+        assert_that(self.session.query(StatPendingCall).count(), equal_to(0))
+
+    def test_leaveempty_call_split_across_runs(self):
+        self.add_me(self._queue_log('2014-07-03 10:59:50.000000', '1', 'ENTERQUEUE'))
+
+        stat_dao.fill_calls_incremental(self.session)
+
+        self.add_me(self._queue_log('2014-07-03 11:00:10.000000', '1', 'LEAVEEMPTY'))
+
+        stat_dao.fill_calls_incremental(self.session)
+
+        assert_that(self._calls(), equal_to([
+            ('1', t(2014, 7, 3, 10, 59, 50), 'leaveempty', 20),
+        ]))
+
+    @patch('xivo_dao.stat_dao.logger')
+    def test_pending_call_older_than_a_day_is_dropped_and_logged(self, logger):
+        self.add_me(self._queue_log('2014-07-03 10:57:11.000000', '1', 'ENTERQUEUE'))
+        stat_dao.fill_calls_incremental(self.session)
+        self.add_me(self._queue_log('2014-07-04 10:57:12.000000', '2', 'FULL'))
+
+        stat_dao.fill_calls_incremental(self.session)
+
+        assert_that(self.session.query(StatPendingCall).count(), equal_to(0))
+        assert_that(self._calls(), equal_to([('2', t(2014, 7, 4, 10, 57, 12), 'full', 0)]))
+        logger.warning.assert_called_once_with(ANY, '1', 'q1', t(2014, 7, 3, 10, 57, 11))
+
+    def test_rows_after_a_recent_id_hole_wait_for_the_hole(self):
+        self.add_me(self._queue_log('2014-07-03 10:00:00.000000', '1', 'FULL'))
+        stat_dao.fill_calls_incremental(self.session)
+
+        now = datetime.datetime.now()
+        late_id = self.session.execute("SELECT nextval('queue_log_id_seq')").scalar()
+        self.add_me(self._queue_log(now.strftime(TIMESTAMP_FORMAT), '3', 'FULL'))
+
+        result = stat_dao.fill_calls_incremental(self.session)
+
+        assert_that(result, equal_to(None))
+
+        late_row = self._queue_log(now.strftime(TIMESTAMP_FORMAT), '2', 'FULL')
+        late_row.id = late_id
+        self.add_me(late_row)
+
+        stat_dao.fill_calls_incremental(self.session)
+
+        assert_that([call.callid for call in self._calls()], equal_to(['1', '2', '3']))
+
+    def test_rows_after_an_old_id_hole_are_processed(self):
+        self.session.execute("SELECT nextval('queue_log_id_seq')")
+        self.add_me(self._queue_log('2014-07-03 10:00:00.000000', '1', 'FULL'))
+
+        stat_dao.fill_calls_incremental(self.session)
+
+        assert_that([call.callid for call in self._calls()], equal_to(['1']))
+
 
 class TestStatDAO(DAOTestCase):
 
@@ -716,21 +836,3 @@ LANGUAGE SQL;
         for agent, statistic in expected.iteritems():
             for login in statistic:
                 self.assertTrue(login in statistics[agent])
-
-    def test_filter_overlap(self):
-        items = [(1, 2), (2, 3)]
-        result = stat_dao._filter_overlap(items)
-
-        self.assertEqual(sorted(result), sorted(items))
-
-        items = [(1, 2), (2, 3), (2, 4)]
-        expected = [(1, 2), (2, 4)]
-        result = stat_dao._filter_overlap(items)
-
-        self.assertEqual(sorted(result), sorted(expected))
-
-        items = [(1, 2), (2, 4), (3, 4)]
-        expected = [(1, 2), (2, 4)]
-        result = stat_dao._filter_overlap(items)
-
-        self.assertEqual(sorted(result), sorted(expected))
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from datetime import datetime as dt
+from datetime import timedelta
+
+from xivo_dao import stat_dao
+from xivo_dao.alchemy.queue_log import QueueLog
+from xivo_dao.alchemy.stat_agent import StatAgent
+from xivo_dao.helpers.bulk import bulk_insert
+from xivo_dao.tests.benchmark import BenchmarkTestCase
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+# get_pause_intervals_in_range before the window function rewrite
+CORRELATED_PAUSE_INTERVALS_QUERY = '''\
+SELECT stat_agent.id AS agent,
+       CAST(MIN(pauseall) AS TIMESTAMP) AS pauseall,
+       CAST(unpauseall AS TIMESTAMP)
+  FROM (
+    SELECT agent, time AS pauseall,
+      (
+        SELECT time
+        FROM queue_log
+        WHERE event = 'UNPAUSEALL' AND
+          agent = pause_all.agent AND
+          time > pause_all.time
+        ORDER BY time ASC limit 1
+      ) AS unpauseall
+    FROM queue_log AS pause_all
+    WHERE event = 'PAUSEALL'
+    AND time >= :start
+    ORDER BY agent, time DESC
+  ) AS pauseall, stat_agent
+  WHERE stat_agent.name = agent
+  GROUP BY stat_agent.id, unpauseall
+'''
+
+
+class TestPauseIntervalsBenchmark(BenchmarkTestCase):
+
+    AGENT_COUNT = 50
+    PAUSES_PER_AGENT = 200
+
+    def setUp(self):
+        super(TestPauseIntervalsBenchmark, self).setUp()
+        self.start = dt(2012, 7, 1)
+        self.end = dt(2012, 7, 31, 23, 59, 59, 999999)
+
+        agents = [StatAgent(name='Agent/%s' % number) for number in range(self.AGENT_COUNT)]
+        self.add_me_all(agents)
+        bulk_insert(self.session, QueueLog.__table__, self._pause_events(agents))
+
+    def _pause_events(self, agents):
+        for agent in agents:
+            pause_time = self.start + timedelta(minutes=agent.id % 60)
+            for _ in range(self.PAUSES_PER_AGENT):
+                for event, delay in [('PAUSEALL', 0), ('PAUSEALL', 1), ('UNPAUSEALL', 10)]:
+                    event_time = pause_time + timedelta(minutes=delay)
+                    yield {
+                        'time': event_time.strftime(TIMESTAMP_FORMAT),
+                        'callid': 'NONE',
+                        'queuename': 'NONE',
+                        'agent': agent.name,
+                        'event': event,
+                    }
+                pause_time += timedelta(hours=3)
+
+    def test_window_function_against_correlated_subquery(self):
+        correlated, correlated_duration = self.timed(self._correlated_pause_intervals)
+        windowed, windowed_duration = self.timed(stat_dao.get_pause_intervals_in_range,
+                                                 self.session, self.start, self.end)
+
+        self.report('%s agents, %s pauses each: correlated subquery %.3fs, window function %.3fs',
+                    self.AGENT_COUNT, self.PAUSES_PER_AGENT, correlated_duration, windowed_duration)
+
+        self.assertEqual(self._sorted(windowed), self._sorted(correlated))
+
+    def _correlated_pause_intervals(self):
+        rows = (self.session
+                .query('agent', 'pauseall', 'unpauseall')
+                .from_statement(CORRELATED_PAUSE_INTERVALS_QUERY)
+                .params(start=self.start.strftime(TIMESTAMP_FORMAT)))
+
+        results = {}
+        for row in rows.all():
+            results.setdefault(row.agent, []).append((row.pauseall, row.unpauseall))
+        return results
+
+    @staticmethod
+    def _sorted(intervals):
+        return dict((agent, sorted(pauses)) for agent, pauses in intervals.iteritems())
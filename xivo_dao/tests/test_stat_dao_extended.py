@@ -20,7 +20,9 @@ from datetime import datetime as dt
 from xivo_dao import stat_dao
 from xivo_dao.alchemy.queue_log import QueueLog
 from xivo_dao.alchemy.stat_agent import StatAgent
+from xivo_dao.alchemy.stat_agent_login_state import StatAgentLoginState
 from xivo_dao.alchemy.stat_queue import StatQueue
+from xivo_dao.alchemy.stat_watermark import StatWatermark
 from xivo_dao.helpers.db_utils import flush_session
 from xivo_dao.tests.test_dao import DAOTestCase
 
@@ -132,6 +134,79 @@ class TestStatDAO(DAOTestCase):
 
         self.assertEqual(result, expected)
 
+    def test_get_last_logins_and_logouts_incremental(self):
+        _, agent_id_1 = self._insert_agent('Agent/1')
+        _, agent_id_2 = self._insert_agent('Agent/2')
+        start = dt(2012, 6, 1)
+        end = dt(2012, 6, 1, 23, 59, 59, 999999)
+
+        queue_log_data = '''\
+| time                       | callid  | queuename | agent   | event               | data1        | data2 | data3         | data4 | data5 |
+| 2012-06-01 06:00:00.000000 | login_1 | NONE      | Agent/1 | AGENTCALLBACKLOGIN  | 1001@default |       |               |       |       |
+| 2012-06-01 07:00:00.000000 | login_2 | NONE      | Agent/2 | AGENTCALLBACKLOGIN  | 1002@default |       |               |       |       |
+'''
+        self._insert_queue_log_data(queue_log_data)
+
+        stat_dao.update_agent_login_state(self.session)
+
+        queue_log_data = '''\
+| time                       | callid   | queuename | agent   | event               | data1        | data2 | data3         | data4 | data5 |
+| 2012-06-01 08:00:00.000000 | logout_1 | NONE      | Agent/1 | AGENTCALLBACKLOGOFF | 1001@default |  7200 | CommandLogoff |       |       |
+| 2012-06-01 09:00:00.000000 | login_3  | NONE      | Agent/1 | AGENTLOGIN          | SIP/abc-1234 |       |               |       |       |
+'''
+        self._insert_queue_log_data(queue_log_data)
+
+        logins, logouts = stat_dao._get_last_logins_and_logouts(self.session, start, end)
+
+        self.assertEqual(logins, {
+            agent_id_1: dt(2012, 6, 1, 9),
+            agent_id_2: dt(2012, 6, 1, 7),
+        })
+        self.assertEqual(logouts, {
+            agent_id_1: dt(2012, 6, 1, 8),
+            agent_id_2: None,
+        })
+
+    def test_get_last_logins_and_logouts_does_not_write(self):
+        _, agent_id_1 = self._insert_agent('Agent/1')
+        start = dt(2012, 6, 1)
+        end = dt(2012, 6, 1, 23, 59, 59, 999999)
+
+        queue_log_data = '''\
+| time                       | callid  | queuename | agent   | event               | data1        | data2 | data3         | data4 | data5 |
+| 2012-06-01 06:00:00.000000 | login_1 | NONE      | Agent/1 | AGENTCALLBACKLOGIN  | 1001@default |       |               |       |       |
+'''
+        self._insert_queue_log_data(queue_log_data)
+
+        logins, _ = stat_dao._get_last_logins_and_logouts(self.session, start, end)
+
+        self.assertEqual(logins, {agent_id_1: dt(2012, 6, 1, 6)})
+        self.assertEqual(self.session.query(StatAgentLoginState).count(), 0)
+        self.assertEqual(self.session.query(StatWatermark).count(), 0)
+
+    def test_fill_calls_incremental_updates_login_state(self):
+        self._insert_agent('Agent/1')
+
+        queue_log_data = '''\
+| time                       | callid  | queuename | agent   | event               | data1        | data2 | data3         | data4 | data5 |
+| 2012-06-01 06:00:00.000000 | login_1 | NONE      | Agent/1 | AGENTCALLBACKLOGIN  | 1001@default |       |               |       |       |
+'''
+        self._insert_queue_log_data(queue_log_data)
+
+        stat_dao.fill_calls_incremental(self.session)
+
+        states = self.session.query(StatAgentLoginState.agent, StatAgentLoginState.last_login).all()
+        self.assertEqual(states, [('Agent/1', dt(2012, 6, 1, 6))])
+
+    def test_get_watermark_created_by_a_concurrent_run(self):
+        self.add_me(StatWatermark(name='concurrent', queue_log_id=42))
+        self.session.expunge_all()
+
+        stat_dao._insert_watermark(self.session, 'concurrent')
+        watermark = stat_dao._get_watermark(self.session, 'concurrent')
+
+        self.assertEqual(watermark.queue_log_id, 42)
+
     def test_get_ongoing_logins(self):
         _, agent_id_1 = self._insert_agent('Agent/1')
         _, agent_id_2 = self._insert_agent('Agent/2')
@@ -229,6 +304,87 @@ class TestStatDAO(DAOTestCase):
 
         self.assertEqual(result, expected)
 
+    def test_get_pause_intervals_in_range_bounded_by_end(self):
+        _, agent_id_1 = self._insert_agent('Agent/1')
+        start = dt(2012, 07, 01)
+        end = dt(2012, 07, 31, 23, 59, 59, 999999)
+
+        queue_log_data = '''\
+| time                       | callid | queuename | agent   | event      | data1 | data2 | data3 | data4 | data5 |
+| 2012-06-30 23:00:00.000000 | NONE   | NONE      | Agent/1 | PAUSEALL   |       |       |       |       |       |
+| 2012-07-01 01:00:00.000000 | NONE   | NONE      | Agent/1 | UNPAUSEALL |       |       |       |       |       |
+| 2012-07-31 23:00:00.000000 | NONE   | NONE      | Agent/1 | PAUSEALL   |       |       |       |       |       |
+| 2012-08-01 01:00:00.000000 | NONE   | NONE      | Agent/1 | UNPAUSEALL |       |       |       |       |       |
+| 2012-08-01 02:00:00.000000 | NONE   | NONE      | Agent/1 | PAUSEALL   |       |       |       |       |       |
+| 2012-08-01 03:00:00.000000 | NONE   | NONE      | Agent/1 | UNPAUSEALL |       |       |       |       |       |
+'''
+
+        self._insert_queue_log_data(queue_log_data)
+
+        result = stat_dao.get_pause_intervals_in_range(self.session, start, end)
+
+        expected = {
+            agent_id_1: [
+                (dt(2012, 7, 31, 23), dt(2012, 8, 1, 1)),
+            ]
+        }
+
+        self.assertEqual(result, expected)
+
+    def test_get_pause_intervals_in_range_closes_only_open_pauses_after_end(self):
+        _, agent_id_1 = self._insert_agent('Agent/1')
+        _, agent_id_2 = self._insert_agent('Agent/2')
+        start = dt(2012, 07, 01)
+        end = dt(2012, 07, 31, 23, 59, 59, 999999)
+
+        queue_log_data = '''\
+| time                       | callid | queuename | agent   | event      | data1 | data2 | data3 | data4 | data5 |
+| 2012-07-31 22:00:00.000000 | NONE   | NONE      | Agent/1 | PAUSEALL   |       |       |       |       |       |
+| 2012-07-31 22:30:00.000000 | NONE   | NONE      | Agent/1 | UNPAUSEALL |       |       |       |       |       |
+| 2012-07-31 23:00:00.000000 | NONE   | NONE      | Agent/2 | PAUSEALL   |       |       |       |       |       |
+| 2012-08-01 01:00:00.000000 | NONE   | NONE      | Agent/1 | UNPAUSEALL |       |       |       |       |       |
+| 2012-08-02 01:00:00.000000 | NONE   | NONE      | Agent/2 | UNPAUSEALL |       |       |       |       |       |
+| 2012-08-03 01:00:00.000000 | NONE   | NONE      | Agent/2 | UNPAUSEALL |       |       |       |       |       |
+'''
+
+        self._insert_queue_log_data(queue_log_data)
+
+        result = stat_dao.get_pause_intervals_in_range(self.session, start, end)
+
+        expected = {
+            agent_id_1: [
+                (dt(2012, 7, 31, 22), dt(2012, 7, 31, 22, 30)),
+            ],
+            agent_id_2: [
+                (dt(2012, 7, 31, 23), dt(2012, 8, 2, 1)),
+            ],
+        }
+
+        self.assertEqual(result, expected)
+
+    def test_get_pause_intervals_in_range_no_unpauseall(self):
+        _, agent_id_1 = self._insert_agent('Agent/1')
+        start = dt(2012, 07, 01)
+        end = dt(2012, 07, 31, 23, 59, 59, 999999)
+
+        queue_log_data = '''\
+| time                       | callid | queuename | agent   | event      | data1 | data2 | data3 | data4 | data5 |
+| 2012-07-21 09:54:09.999999 | NONE   | NONE      | Agent/1 | PAUSEALL   |       |       |       |       |       |
+| 2012-07-21 09:59:09.999999 | NONE   | NONE      | Agent/1 | PAUSEALL   |       |       |       |       |       |
+'''
+
+        self._insert_queue_log_data(queue_log_data)
+
+        result = stat_dao.get_pause_intervals_in_range(self.session, start, end)
+
+        expected = {
+            agent_id_1: [
+                (dt(2012, 7, 21, 9, 54, 9, 999999), None),
+            ]
+        }
+
+        self.assertEqual(result, expected)
+
     def _insert_queue_log_data(self, queue_log_data):
         with flush_session(self.session):
             lines = queue_log_data.split('\n')
@@ -30,6 +30,14 @@ class TestStatQueueDAO(DAOTestCase):
 
         self.assertEqual(result, queue.id)
 
+    def test_ids_by_name(self):
+        queue_1 = self._insert_queue('queue_1')
+        queue_2 = self._insert_queue('queue_2')
+
+        result = stat_queue_dao.ids_by_name(self.session)
+
+        self.assertEqual(result, {'queue_1': queue_1.id, 'queue_2': queue_2.id})
+
     def test_insert_if_missing(self):
         old_queues = ['queue_%s' % number for number in range(5)]
         for queue_name in old_queues:
@@ -77,6 +77,20 @@ class TestStatQueuePeriodicDAO(DAOTestCase):
         except LookupError:
             self.fail('Should have found a row')
 
+    def test_bulk_insert_stats(self):
+        stats = self._get_stats_for_queue()
+        first_period = datetime.datetime(2012, 1, 1, 0, 0, 0)
+        second_period = datetime.datetime(2012, 1, 1, 1, 0, 0)
+
+        count = stat_queue_periodic_dao.bulk_insert_stats(self.session, [(first_period, stats),
+                                                                         (second_period, stats)])
+
+        self.assertEqual(count, 2)
+        result = (self.session.query(StatQueuePeriodic.time, StatQueuePeriodic.answered, StatQueuePeriodic.total)
+                  .order_by(StatQueuePeriodic.time)
+                  .all())
+        self.assertEqual(result, [(first_period, 27, 98), (second_period, 27, 98)])
+
     def test_get_most_recent_time(self):
         self.assertRaises(LookupError, stat_queue_periodic_dao.get_most_recent_time, self.session)
 
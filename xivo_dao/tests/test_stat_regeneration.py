@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Avencall
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+import unittest
+
+from datetime import datetime as dt
+from datetime import timedelta
+from hamcrest import assert_that, contains, equal_to, has_entries
+from mock import patch
+
+from xivo_dao import stat_regeneration
+from xivo_dao.alchemy.queue_log import QueueLog
+from xivo_dao.alchemy.stat_agent import StatAgent
+from xivo_dao.alchemy.stat_agent_login_state import StatAgentLoginState
+from xivo_dao.alchemy.stat_agent_periodic import StatAgentPeriodic
+from xivo_dao.alchemy.stat_call_on_queue import StatCallOnQueue
+from xivo_dao.alchemy.stat_queue import StatQueue
+from xivo_dao.alchemy.stat_queue_periodic import StatQueuePeriodic
+from xivo_dao.alchemy.stat_watermark import StatWatermark
+from xivo_dao.helpers.db_utils import flush_session
+from xivo_dao.tests.test_dao import DAOTestCase
+
+ONE_DAY = timedelta(days=1)
+QUEUE_LOG_COLUMNS = ('time', 'callid', 'queuename', 'agent', 'event', 'data1', 'data2', 'data3')
+
+
+class TestSplitInChunks(unittest.TestCase):
+
+    def test_split_in_chunks(self):
+        result = stat_regeneration.split_in_chunks(dt(2012, 7, 1), dt(2012, 7, 3, 12), ONE_DAY)
+
+        assert_that(list(result), contains(
+            (dt(2012, 7, 1), dt(2012, 7, 2)),
+            (dt(2012, 7, 2), dt(2012, 7, 3)),
+            (dt(2012, 7, 3), dt(2012, 7, 3, 12)),
+        ))
+
+
+@patch('xivo_dao.stat_dao.fill_leaveempty_calls')
+@patch('xivo_dao.stat_dao.fill_simple_calls')
+class TestRegenerateChunk(DAOTestCase):
+
+    def setUp(self):
+        super(TestRegenerateChunk, self).setUp()
+        self.agent = StatAgent(name='Agent/1')
+        self.queue = StatQueue(name='q1')
+        self.add_me(self.agent)
+        self.add_me(self.queue)
+
+    def test_regenerate_chunk_replaces_the_chunk_statistics(self, _fill_simple, _fill_leaveempty):
+        start, end = dt(2012, 7, 1), dt(2012, 7, 2)
+        with flush_session(self.session):
+            for time in [dt(2012, 6, 30, 23), dt(2012, 7, 1, 10)]:
+                self.session.add(StatCallOnQueue(callid='old', time=time, queue_id=self.queue.id,
+                                                 status='full'))
+                self.session.add(StatQueuePeriodic(time=time, queue_id=self.queue.id, total=1))
+                self.session.add(StatAgentPeriodic(time=time, agent_id=self.agent.id))
+        self._add_queue_log([
+            ('2012-07-01 08:00:00.000000', 'login', 'NONE', 'Agent/1', 'AGENTCALLBACKLOGIN', '1001@default', ''),
+            ('2012-07-01 09:00:00.000000', 'c1', 'q1', 'NONE', 'ENTERQUEUE', '', ''),
+            ('2012-07-01 09:00:05.000000', 'c1', 'q1', 'Agent/1', 'CONNECT', '5', ''),
+            ('2012-07-01 09:01:05.000000', 'c1', 'q1', 'Agent/1', 'COMPLETEAGENT', '5', '60'),
+            ('2012-07-01 09:30:00.000000', 'login', 'NONE', 'Agent/1', 'AGENTCALLBACKLOGOFF', '1001@default', '5400'),
+        ])
+
+        stat_regeneration.regenerate_chunk(self.session, start, end)
+
+        calls = self.session.query(StatCallOnQueue).order_by(StatCallOnQueue.time).all()
+        assert_that([(c.callid, c.time) for c in calls], contains(
+            ('old', dt(2012, 6, 30, 23)),
+            ('c1', dt(2012, 7, 1, 9)),
+        ))
+        queue_stats = self.session.query(StatQueuePeriodic).order_by(StatQueuePeriodic.time).all()
+        assert_that([(s.time, s.total) for s in queue_stats], contains(
+            (dt(2012, 6, 30, 23), 1),
+            (dt(2012, 7, 1, 9), 1),
+        ))
+        agent_stats = self.session.query(StatAgentPeriodic).order_by(StatAgentPeriodic.time).all()
+        assert_that([(s.time, s.login_time) for s in agent_stats], contains(
+            (dt(2012, 6, 30, 23), timedelta(0)),
+            (dt(2012, 7, 1, 8), timedelta(hours=1)),
+            (dt(2012, 7, 1, 9), timedelta(minutes=30)),
+        ))
+
+    def test_regenerate_chunk_keeps_abandoned_and_timeout_calls(self, _fill_simple, _fill_leaveempty):
+        start, end = dt(2012, 7, 1), dt(2012, 7, 2)
+        self._add_queue_log([
+            ('2012-07-01 09:00:00.000000', 'c1', 'q1', 'NONE', 'ENTERQUEUE', '', ''),
+            ('2012-07-01 09:00:30.000000', 'c1', 'q1', 'NONE', 'ABANDON', '1', '1', '30'),
+            ('2012-07-01 10:00:00.000000', 'c2', 'q1', 'NONE', 'ENTERQUEUE', '', ''),
+            ('2012-07-01 10:01:00.000000', 'c2', 'q1', 'NONE', 'EXITWITHTIMEOUT', '1', '1', '60'),
+        ])
+
+        stat_regeneration.regenerate_chunk(self.session, start, end)
+        stat_regeneration.regenerate_chunk(self.session, start, end)
+
+        calls = self.session.query(StatCallOnQueue).order_by(StatCallOnQueue.time).all()
+        assert_that([(c.callid, c.status, c.waittime) for c in calls], contains(
+            ('c1', 'abandoned', 30),
+            ('c2', 'timeout', 60),
+        ))
+
+    def test_regenerate_chunk_with_an_ongoing_pause(self, _fill_simple, _fill_leaveempty):
+        start, end = dt(2012, 7, 1), dt(2012, 7, 2)
+        self._add_queue_log([
+            ('2012-07-01 22:30:00.000000', 'NONE', 'NONE', 'Agent/1', 'PAUSEALL', '', ''),
+        ])
+
+        stat_regeneration.regenerate_chunk(self.session, start, end)
+
+        agent_stats = self.session.query(StatAgentPeriodic).order_by(StatAgentPeriodic.time).all()
+        assert_that([(s.time, s.pause_time) for s in agent_stats], contains(
+            (dt(2012, 7, 1, 22), timedelta(minutes=30)),
+            (dt(2012, 7, 1, 23), timedelta(hours=1)),
+        ))
+
+    def test_regenerate_chunk_does_not_write_the_login_state(self, _fill_simple, _fill_leaveempty):
+        start, end = dt(2012, 7, 1), dt(2012, 7, 2)
+        self._add_queue_log([
+            ('2012-07-01 08:00:00.000000', 'login', 'NONE', 'Agent/1', 'AGENTCALLBACKLOGIN', '1001@default', ''),
+        ])
+
+        stat_regeneration.regenerate_chunk(self.session, start, end)
+
+        assert_that(self.session.query(StatWatermark).count(), equal_to(0))
+        assert_that(self.session.query(StatAgentLoginState).count(), equal_to(0))
+
+    def _add_queue_log(self, entries):
+        with flush_session(self.session):
+            for entry in entries:
+                self.session.add(QueueLog(**dict(zip(QUEUE_LOG_COLUMNS, entry))))